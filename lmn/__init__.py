@@ -26,3 +26,15 @@ handler.setFormatter(colorlog.ColoredFormatter(
 
 logger = colorlog.getLogger('lmn')
 logger.addHandler(handler)
+
+
+class LMNError(Exception):
+    """An error to be reported to the user (the CLI prints the message and exits with code 1)."""
+
+
+def __getattr__(name):
+    # NOTE: lmn.client imports most of lmn (that imports `lmn.logger`), thus it is only loaded on access
+    if name in ('Client', 'Job'):
+        from lmn import client
+        return getattr(client, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""lmn remote agent: runs on the remote host and serves requests over stdin / stdout.
+
+This file is uploaded as-is and must only depend on the standard library (Python >= 3.6).
+
+Protocol (one JSON object per line):
+    request : {"id": 1, "ops": [{"op": "write_file", "args": {"path": "/tmp/a.sh", "content": "..."}}, ...], "stop_on_error": true}
+    response: {"id": 1, "results": [{"ok": true, "result": ...}, {"ok": false, "error": "...", "type": "OSError"}, ...]}
+Operations after a failed one are skipped (with "type": "Skipped") if stop_on_error is set.
+"""
+import json
+import os
+import subprocess
+import sys
+
+VERSION = 1
+
+
+def op_ping():
+    return {'version': VERSION, 'python': sys.version.split()[0]}
+
+
+def op_write_file(path, content, mode=None):
+    path = os.path.expanduser(path)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+    if mode is not None:
+        os.chmod(tmp_path, int(mode, 8))
+    os.replace(tmp_path, path)
+    return None
+
+
+def op_exec(cmd, timeout=None):
+    proc = subprocess.run(['bash', '-c', cmd], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          timeout=timeout)
+    return {'returncode': proc.returncode,
+            'stdout': proc.stdout.decode('utf-8', 'replace'),
+            'stderr': proc.stderr.decode('utf-8', 'replace')}
+
+
+OPS = {
+    'ping': op_ping,
+    'write_file': op_write_file,
+    'exec': op_exec,
+}
+
+
+def handle(request):
+    results = []
+    failed = False
+    for op in request.get('ops', []):
+        if failed and request.get('stop_on_error', True):
+            results.append({'ok': False, 'error': 'skipped due to a previous error', 'type': 'Skipped'})
+            continue
+        try:
+            if op.get('op') not in OPS:
+                raise ValueError('unknown operation: {}'.format(op.get('op')))
+            results.append({'ok': True, 'result': OPS[op['op']](**op.get('args', {}))})
+        except Exception as e:
+            failed = True
+            results.append({'ok': False, 'error': str(e), 'type': type(e).__name__})
+    return {'id': request.get('id'), 'results': results}
+
+
+def main():
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            response = handle(json.loads(line))
+        except ValueError as e:
+            response = {'id': None, 'error': 'invalid request: {}'.format(e)}
+        sys.stdout.write(json.dumps(response) + '\n')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""Local side of the lmn remote agent (see `lmn/_remote_agent.py`).
+
+The agent runs on the remote host over a single long-lived ssh channel and serves batches of
+operations (write_file, exec), returning structured results.
+`AgentClient` implements `run` / `put` of `CLISSHClient` (non-interactive only) on top of it, where the uploads
+are sent along with the next command (e.g., the job script with its submission) in a single round trip.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import subprocess
+import threading
+from pathlib import Path
+from queue import Empty, Queue
+from typing import List, Optional
+
+from lmn import logger
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from lmn.machine import RemoteConfig
+
+AGENT_SOURCE = Path(__file__).parent / '_remote_agent.py'
+
+# The agent exits with this code if the script has not been uploaded yet
+_NOT_UPLOADED = 97
+
+
+class AgentError(RuntimeError):
+    """An operation failed on the remote (`type` is the name of the exception raised there)."""
+    def __init__(self, message: str, type: str = 'RuntimeError') -> None:
+        super().__init__(message)
+        self.type = type
+
+
+def get_agent_path() -> str:
+    """Return the remote path (relative to $HOME) of the agent, which changes with its content."""
+    digest = hashlib.sha1(AGENT_SOURCE.read_bytes()).hexdigest()[:12]
+    return f'.lmn/agent-{digest}.py'
+
+
+class AgentClient:
+    """Talks to the remote agent. Use it as a context manager, or call `close()`.
+
+    - timeout: seconds to wait for a response (per command that it runs), after which the agent is stopped
+    """
+    def __init__(self, remote_conf: RemoteConfig, python: str = 'python3', timeout: float = 120.) -> None:
+        self.remote_conf = remote_conf
+        self.python = python
+        self.timeout = timeout
+        self.proc = None
+        self._lines = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._pending = []  # Uploads to be sent along with the next command (see `put`)
+
+    def _ssh_cmd(self, remote_cmd: str) -> List[str]:
+        # TODO: Move the ControlPath to global config
+        control_path = os.path.expanduser(f'~/.ssh/lmn-ssh-socket-{self.remote_conf.host}')
+        return ['ssh', '-T', '-o', f'ControlPath={control_path}', self.remote_conf.base_uri, remote_cmd]
+
+    def _spawn(self):
+        path = get_agent_path()
+        remote_cmd = f'test -f {path} || exit {_NOT_UPLOADED} ; exec {self.python} -u {path}'
+        self.proc = subprocess.Popen(self._ssh_cmd(remote_cmd), stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+
+        # NOTE: The output is read in a thread, so that a hung agent cannot block `batch` forever
+        self._lines = Queue()
+
+        def read_lines(stdout, lines: Queue):
+            for line in stdout:
+                lines.put(line)
+            lines.put(None)
+
+        threading.Thread(target=read_lines, args=(self.proc.stdout, self._lines), daemon=True).start()
+
+    def _upload(self):
+        path = get_agent_path()
+        logger.debug(f'uploading the agent to {self.remote_conf.base_uri}:{path}')
+        with open(AGENT_SOURCE, 'r') as f:
+            subprocess.run(self._ssh_cmd(f'mkdir -p .lmn && cat > {path}.tmp && mv {path}.tmp {path}'),
+                           stdin=f, check=True, stdout=subprocess.DEVNULL)
+
+    def start(self) -> AgentClient:
+        self._spawn()
+        try:
+            self.call('ping')
+        except AgentError as e:
+            if e.type != 'ConnectionError':
+                # e.g., the remote shell printed something before the agent started
+                self._kill()
+                raise
+            if self.proc.wait() != _NOT_UPLOADED:
+                raise
+            self._upload()
+            self._spawn()
+            self.call('ping')
+        return self
+
+    def _kill(self):
+        self.proc.kill()
+        self.proc.wait()
+
+    def close(self):
+        if self.proc is not None:
+            try:
+                self.flush()
+            except AgentError as e:
+                logger.warning(f'Failed to upload files to {self.remote_conf.base_uri}: {str(e)}')
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            self.proc.wait()
+            self.proc = None
+
+    def __enter__(self) -> AgentClient:
+        return self.start()
+
+    def __exit__(self, *args):
+        self.close()
+
+    def batch(self, ops: List[dict], stop_on_error: bool = True, timeout: Optional[float] = None) -> List[dict]:
+        """Run the operations (`{'op': name, 'args': {...}}`) in one round trip and return their results.
+
+        Each result is `{'ok': True, 'result': ...}` or `{'ok': False, 'error': message, 'type': exception name}`.
+        AgentError is raised if no response arrives within `timeout` seconds (`self.timeout` by default).
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            self._next_id += 1
+            request = {'id': self._next_id, 'ops': ops, 'stop_on_error': stop_on_error}
+            try:
+                self.proc.stdin.write(json.dumps(request) + '\n')
+                self.proc.stdin.flush()
+                line = self._lines.get(timeout=timeout)
+            except (BrokenPipeError, ValueError):
+                line = None
+            except Empty:
+                self._kill()
+                raise AgentError(f'The agent on {self.remote_conf.base_uri} did not respond in {timeout} seconds',
+                                 type='TimeoutError')
+            if not line:
+                raise AgentError(f'The agent on {self.remote_conf.base_uri} is not running', type='ConnectionError')
+            try:
+                response = json.loads(line)
+            except ValueError:
+                raise AgentError(f'Unexpected output from the agent on {self.remote_conf.base_uri}: {line.strip()}')
+        if 'error' in response:
+            raise AgentError(response['error'])
+        return response['results']
+
+    def call(self, op: str, **args):
+        """Run a single operation and return its result, raising AgentError if it fails."""
+        result = self.batch([{'op': op, 'args': args}])[0]
+        if not result['ok']:
+            raise AgentError(result['error'], type=result['type'])
+        return result['result']
+
+    # Compatible with CLISSHClient (non-interactive)
+    def uri(self, path):
+        return f'{self.remote_conf.base_uri}:{path}'
+
+    def run(self, cmd, directory="$HOME", env=None, capture_output: bool = False, dry_run: bool = False) -> Optional[str]:
+        if env:
+            raise ValueError('AgentClient.run does not take `env`. Export the envvars in `cmd` instead.')
+        if directory is not None:
+            cmd = f'cd {directory} && {cmd}'
+        if dry_run:
+            logger.info(f'dry run: {cmd}')
+            return '' if capture_output else None
+        ops, self._pending = self._pending + [{'op': 'exec', 'args': {'cmd': cmd, 'timeout': self.timeout}}], []
+        *uploads, result = self.batch(ops, timeout=self.timeout + 10)
+        for upload in uploads:
+            if not upload['ok']:
+                raise AgentError(upload['error'], type=upload['type'])
+        if not result['ok']:
+            raise AgentError(result['error'], type=result['type'])
+        result = result['result']
+        if result['returncode'] != 0:
+            msg = f"The command {cmd} returned exit code {result['returncode']}\n---\n{result['stderr']}\n---"
+            raise RuntimeError(msg)
+        if capture_output:
+            return result['stdout'].rstrip()
+        print(result['stdout'], end='')
+        return None
+
+    def put(self, fpath, target_path=None) -> None:
+        """Upload the file along with the next `run` (or `flush`)."""
+        with open(fpath, 'r') as f:
+            self._pending.append({'op': 'write_file', 'args': {'path': str(target_path), 'content': f.read()}})
+
+    def flush(self) -> None:
+        """Send the uploads that are not sent yet."""
+        ops, self._pending = self._pending, []
+        for result in self.batch(ops) if ops else []:
+            if not result['ok']:
+                raise AgentError(result['error'], type=result['type'])
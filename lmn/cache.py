@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""A small on-disk cache for values measured on remote hosts (e.g., link throughput, capabilities)."""
+from __future__ import annotations
+import os
+from os.path import expandvars
+from typing import Any, Optional
+
+
+class HostCache:
+    """Keeps JSON-serializable values per host in `~/.lmn/cache/{name}.json` for `ttl` seconds."""
+    def __init__(self, name: str, ttl: float, cachedir=expandvars('$HOME/.lmn/cache')) -> None:
+        self.path = os.path.join(cachedir, f'{name}.json')
+        self.ttl = ttl
+
+    def _load(self) -> dict:
+        import json
+        if not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            # A broken cache is simply discarded
+            return {}
+
+    def _save(self, entries: dict):
+        import json
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(entries, f, indent=2)
+
+    def get(self, host: str) -> Optional[Any]:
+        """Return the value cached for `host` unless it is expired."""
+        import time
+        entry = self._load().get(host)
+        if entry is None or entry['cached_at'] + self.ttl <= time.time():
+            return None
+        return entry['value']
+
+    def set(self, host: str, value: Any):
+        import time
+        entries = self._load()
+        entries[host] = {'value': value, 'cached_at': time.time()}
+        self._save(entries)
+
+    def remove(self, host: str):
+        entries = self._load()
+        if entries.pop(host, None) is not None:
+            self._save(entries)
@@ -1,15 +1,15 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 from lmn import __version__
-from lmn import logger
+from lmn import logger, LMNError
 import sys
 import argparse
 from typing import List, Optional
 
 
 def global_parser():
-    from . import brun, run, sync, nv
-    commands = [brun, run, sync, nv]
+    from . import brun, run, apply, sync, pull, watch, nv, alloc, gc
+    commands = [brun, run, apply, sync, pull, watch, nv, alloc, gc]
 
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -73,8 +73,18 @@ def core(args):
 
     # Load config and fuse it with parsed arguments
     from ._config_loader import load_config
-    project, remote_conf, preset_conf = load_config(parsed.machine)
-    parsed.handler(project, remote_conf, parsed, preset_conf)
+    try:
+        machine_name = getattr(parsed, 'machine', None)
+        if machine_name is None or isinstance(machine_name, list):
+            # Commands that take multiple machines (i.e., `lmn nv`) load the configs by themselves,
+            # and the ones without a machine (i.e., `lmn apply`) do not need them
+            project, remote_conf, preset_conf = None, None, None
+        else:
+            project, remote_conf, preset_conf = load_config(machine_name)
+        parsed.handler(project, remote_conf, parsed, preset_conf)
+    except LMNError as e:
+        logger.error(str(e))
+        sys.exit(1)
 
 
 def main(args: Optional[List[str]] = None) -> None:
@@ -1,15 +1,15 @@
 """Load config file and fuse it with runtime options"""
 from __future__ import annotations
 from argparse import Namespace
-from typing import Optional, List, Union
+from typing import Dict, Optional, List, Union
 import os
 import pathlib
 from pathlib import Path
-from lmn import logger
+from lmn import logger, LMNError
 from lmn.helpers import find_project_root, parse_config
 from posixpath import expandvars
 
-from lmn.config import LMNDirectories
+from lmn.config import DatasetConfig, LMNDirectories, OutputFilterConfig
 from lmn.machine import RemoteConfig
 
 DOCKER_ROOT_DIR = '/lmn'
@@ -25,7 +25,10 @@ class Project:
                  outdir: Optional[str] = None, exclude: Optional[List[str]] = None,
                  startup: Union[str, List[str]] = "",
                  mount_from_host: Optional[dict] = None,
-                 env: Optional[dict] = None) -> None:
+                 env: Optional[dict] = None,
+                 sync_mode: str = 'all',
+                 output_filter: Optional[OutputFilterConfig] = None,
+                 datasets: Optional[Dict[str, DatasetConfig]] = None) -> None:
         self.name = name
         self.rootdir = Path(rootdir)
         self.outdir = self.rootdir / ".output" if outdir is None else outdir
@@ -35,6 +38,9 @@ class Project:
         self.startup = startup
         self.env = env if env is not None else {}
         self.mount_from_host = mount_from_host if mount_from_host is not None else {}
+        self.sync_mode = sync_mode
+        self.output_filter = output_filter if output_filter is not None else OutputFilterConfig()
+        self.datasets = datasets if datasets is not None else {}
 
         self._make_directories()
 
@@ -99,22 +105,84 @@ def get_docker_lmndirs(lmndir: Union[Path, str], project_name: str) -> Namespace
     )
 
 
-def load_config(machine_name: str):
+def select_machine_from_pool(config: dict, pool_name: str) -> str:
+    """Probe the machines in the pool (defined in "pools") and return the name of the least loaded one."""
+    from lmn.config import MachineConfig
+    from lmn.probe import select_least_loaded
+
+    pools = config.get('pools', {})
+    if pool_name not in pools:
+        raise LMNError(
+            f'Pool "{pool_name}" not found in your configuration. \n'
+            f'Available pools are: {", ".join(pools.keys())}'
+        )
+
+    unknown = [name for name in pools[pool_name] if name not in config['machines']]
+    if unknown:
+        raise LMNError(f'Machines {unknown} in pool "{pool_name}" are not found in "machines".')
+
+    remote_confs = {}
+    for name in pools[pool_name]:
+        mconf = MachineConfig(**config['machines'][name])
+        remote_confs[name] = RemoteConfig(mconf.user, mconf.host)
+
+    logger.info(f'Probing {len(remote_confs)} machines in pool "{pool_name}"')
+    machine_name = select_least_loaded(remote_confs)
+    if machine_name is None:
+        raise LMNError(f'None of the machines in pool "{pool_name}" is reachable.')
+
+    logger.info(f'Selected machine: {machine_name}')
+    return machine_name
+
+
+def load_remote_confs(machine_names: List[str]) -> Dict[str, RemoteConfig]:
+    """Return RemoteConfig of each machine. "all" expands to all the machines, and "pool:<name>" to the machines in the pool."""
+    from lmn.config import MachineConfig
+    config = parse_config(find_project_root())
+    machines = config.get('machines', {})
+    pools = config.get('pools', {})
+
+    expanded = []
+    for name in machine_names:
+        if name == 'all':
+            expanded += list(machines.keys())
+        elif name.startswith('pool:') and name[len('pool:'):] in pools:
+            expanded += pools[name[len('pool:'):]]
+        else:
+            expanded += [name]
+
+    unknown = [name for name in expanded if name not in machines]
+    if unknown:
+        raise LMNError(
+            f'Machines {unknown} not found in your configuration. \n'
+            f'Available machines are: {", ".join(machines.keys())}'
+        )
+
+    remote_confs = {}
+    for name in expanded:
+        mconf = MachineConfig(**machines[name])
+        remote_confs[name] = RemoteConfig(mconf.user, mconf.host)
+    return remote_confs
+
+
+def load_config(machine_name: str, project_dir: Optional[Union[str, Path]] = None):
+    """Load the configs of the project (that contains `project_dir`, or the current directory) and the machine."""
     from lmn.config import ProjectConfig, MachineConfig
-    proj_rootdir = find_project_root()
+    proj_rootdir = find_project_root(project_dir)
     config = parse_config(proj_rootdir)
 
     # Error checking in config file
     if 'machines' not in config:
-        logger.error('The configuration file does not contain "machines" section.')
-        import sys; sys.exit(1)
+        raise LMNError('The configuration file does not contain "machines" section.')
+
+    if machine_name.startswith('pool:'):
+        machine_name = select_machine_from_pool(config, machine_name[len('pool:'):])
 
     if machine_name not in config['machines']:
-        logger.error(
+        raise LMNError(
             f'Machine "{machine_name}" not found in your configuration. \n'
             f'Available machines are: {", ".join(config["machines"].keys())}'
         )
-        import sys; sys.exit(1)
 
     # TODO:
     # Both pconf and mconf can definitely be pydantic objects
@@ -158,7 +226,10 @@ def load_config(machine_name: str):
                       exclude=pconf.exclude,
                       startup=pconf.startup,
                       env={**pconf.environment, **secret_env},
-                      mount_from_host={**pconf.mount_from_host, **mconf.mount_from_host})
+                      mount_from_host={**pconf.mount_from_host, **mconf.mount_from_host},
+                      sync_mode=pconf.sync_mode,
+                      output_filter=pconf.output_filter,
+                      datasets=pconf.datasets)
 
     remote_conf = RemoteConfig(mconf.user, mconf.host)
 
@@ -0,0 +1,140 @@
+"""Resolve Slurm / PBS configurations, including queue-aware selection of partitions and presets"""
+from __future__ import annotations
+from typing import Dict, Optional
+from lmn import logger, LMNError
+from lmn.machine import CLISSHClient
+from lmn.scheduler.slurm import SlurmConfig
+from lmn.scheduler.pbs import PBSConfig
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from lmn.cli._config_loader import Machine
+
+
+def _load_preset(preset: dict, key: str, name: str) -> dict:
+    _conf = preset.get(key, {}).get(name, {})
+    if not _conf:
+        raise LMNError(f'Config preset: "{name}" cannot be found in "{key}" or is empty.')
+    return _conf
+
+
+def get_slurm_conf(machine: Machine, sconf: Optional[str], preset: dict,
+                   ssh_client: Optional[CLISSHClient] = None) -> SlurmConfig:
+    """Return SlurmConfig of the machine, or the preset in "slurm-configs" if `sconf` is specified.
+
+    `sconf` can be comma-separated preset names, and `partition` can be 'auto' (see `partition_candidates`).
+    With multiple candidates, the one where the job would start soonest is picked.
+    """
+    if machine.parsed_conf.slurm is None:
+        raise ValueError('Configuration must have an entry for "slurm" to use Slurm mode.')
+
+    # Create SlurmConfig object
+    if sconf is None:
+        candidates = {'default': machine.parsed_conf.slurm}
+    else:
+        # Try to load from the slurm conf presets
+        logger.debug('parsed.sconf is specified. Loading custom preset conf.')
+        candidates = {name: SlurmConfig(**_load_preset(preset, 'slurm-configs', name)) for name in sconf.split(',')}
+
+    # Expand partition: 'auto'
+    expanded = {}
+    for name, conf in candidates.items():
+        if conf.partition != 'auto':
+            expanded[name] = conf
+            continue
+        if not conf.partition_candidates:
+            raise LMNError('`partition_candidates` must be specified to use partition: "auto".')
+        for partition in conf.partition_candidates:
+            expanded[f'{name}:{partition}'] = conf.model_copy(update={'partition': partition})
+
+    if len(expanded) == 1:
+        name, conf = next(iter(expanded.items()))
+        if sconf is not None:
+            logger.info(f'Using Slurm preset: [{sconf}]')
+        return conf
+
+    if ssh_client is None:
+        raise ValueError('Selecting a Slurm config from multiple candidates requires an ssh client.')
+    return _select_slurm_conf(ssh_client, expanded)
+
+
+def _select_slurm_conf(ssh_client: CLISSHClient, candidates: Dict[str, SlurmConfig]) -> SlurmConfig:
+    """Pick the candidate with the earliest expected start time reported by `sbatch --test-only`."""
+    from lmn.scheduler.slurm import make_test_only_command, parse_test_only_output
+
+    output = ssh_client.run(make_test_only_command(candidates), capture_output=True)
+    start_times = parse_test_only_output(output)
+    for name, start_time in start_times.items():
+        logger.info(f'Expected start time [{name}]: {start_time if start_time is not None else "unavailable"}')
+
+    available = {name: start_time for name, start_time in start_times.items() if start_time is not None}
+    if not available:
+        raise LMNError(f'None of the Slurm configs can be submitted. Output of `sbatch --test-only`:\n{output}')
+
+    name = min(available, key=available.get)
+    logger.info(f'Using Slurm config: [{name}]')
+    return candidates[name]
+
+
+def get_pbs_conf(machine: Machine, pbsconf: Optional[str], preset: dict,
+                 ssh_client: Optional[CLISSHClient] = None) -> PBSConfig:
+    """Return PBSConfig of the machine, or the preset in "pbs-configs" if `pbsconf` is specified.
+
+    `pbsconf` can be comma-separated preset names, and `queue` can be 'auto' (see `queue_candidates`).
+    With multiple candidates, the one with the least queued jobs is picked.
+    """
+    if machine.parsed_conf.pbs is None:
+        raise ValueError('Configuration must have an entry for "pbs" to use PBS mode.')
+
+    # Create PBSConfig object
+    if pbsconf is None:
+        candidates = {'default': machine.parsed_conf.pbs}
+    else:
+        # Try to load from the pbs conf presets
+        logger.debug('parsed.pbsconf is specified. Loading custom preset conf.')
+        candidates = {name: PBSConfig(**_load_preset(preset, 'pbs-configs', name)) for name in pbsconf.split(',')}
+
+    # Expand queue: 'auto'
+    expanded = {}
+    for name, conf in candidates.items():
+        if conf.queue != 'auto':
+            expanded[name] = conf
+            continue
+        if not conf.queue_candidates:
+            raise LMNError('`queue_candidates` must be specified to use queue: "auto".')
+        for queue in conf.queue_candidates:
+            expanded[f'{name}:{queue}'] = conf.model_copy(update={'queue': queue})
+
+    if len(expanded) == 1:
+        name, conf = next(iter(expanded.items()))
+        if pbsconf is not None:
+            logger.info(f'Using PBS preset: [{pbsconf}]')
+        return conf
+
+    if ssh_client is None:
+        raise ValueError('Selecting a PBS config from multiple candidates requires an ssh client.')
+    return _select_pbs_conf(ssh_client, expanded)
+
+
+def _select_pbs_conf(ssh_client: CLISSHClient, candidates: Dict[str, PBSConfig]) -> PBSConfig:
+    """Pick the candidate whose queue has the least queued (and then running) jobs according to `qstat -Q`."""
+    from lmn.scheduler.pbs import parse_qstat_queues
+
+    # NOTE: A failing `qstat -Q` results in no queues (and LMNError below) rather than RuntimeError
+    output = ssh_client.run('qstat -Q 2>&1 ; true', capture_output=True)
+    queues = parse_qstat_queues(output)
+    available = {}
+    for name, conf in candidates.items():
+        stats = queues.get(conf.queue)
+        if stats is None:
+            logger.info(f'Queue [{name}]: unavailable')
+            continue
+        logger.info(f'Queue [{name}]: {stats["queued"]} queued, {stats["running"]} running')
+        available[name] = (stats['queued'], stats['running'])
+
+    if not available:
+        raise LMNError(f'None of the PBS queues is enabled and started. Output of `qstat -Q`:\n{output}')
+
+    name = min(available, key=available.get)
+    logger.info(f'Using PBS config: [{name}]')
+    return candidates[name]
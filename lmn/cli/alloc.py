@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Hold a Slurm allocation so that the following interactive runs can skip the queue."""
+
+
+from __future__ import annotations
+from argparse import ArgumentParser
+from argparse import Namespace
+from lmn import logger, LMNError
+from lmn.machine import CLISSHClient
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from lmn.cli._config_loader import Project, Machine
+
+
+def _get_parser() -> ArgumentParser:
+    parser = ArgumentParser()
+    parser.add_argument(
+        "machine",
+        action="store",
+        type=str,
+        help="Machine",
+    )
+    parser.add_argument(
+        "--verbose",
+        default=False,
+        action="store_true",
+        help="Be verbose"
+    )
+    parser.add_argument(
+        "--sconf",
+        default=None,
+        help="specify a slurm configuration to be used"
+    )
+    parser.add_argument(
+        "--ttl",
+        default=None,
+        help="how long to hold the allocation in Slurm time format (e.g., 2:00:00). Defaults to `time` in the slurm config"
+    )
+    parser.add_argument(
+        "--release",
+        action="store_true",
+        help="cancel the allocation held on the machine",
+    )
+    return parser
+
+
+def handler(project: Project, machine: Machine, parsed: Namespace, preset: dict):
+    from lmn.helpers import AllocationManager, establish_persistent_ssh
+    from lmn.scheduler.slurm import make_slurm_command, parse_salloc_jobid, parse_slurm_time
+    from lmn.cli._scheduler import get_slurm_conf
+
+    logger.debug(f'handling command for {__file__}')
+    logger.debug(f'parsed: {parsed}')
+
+    establish_persistent_ssh(machine.remote_conf)
+    ssh_client = CLISSHClient(machine.remote_conf)
+    alloc_manager = AllocationManager()
+
+    existing = alloc_manager.get(machine.base_uri)
+    if parsed.release:
+        if existing is None:
+            logger.info(f'No allocation is held on {machine.base_uri}')
+            return
+        cancel_cmd = f'scancel {existing["job_id"]}'
+        if parsed.dry_run:
+            logger.info(f'dry run: {cancel_cmd}')
+            return
+        ssh_client.run(cancel_cmd)
+        alloc_manager.remove(machine.base_uri)
+        logger.info(f'Released the allocation: job {existing["job_id"]}')
+        return
+
+    if existing is not None:
+        logger.warning(f'An allocation is already held on {machine.base_uri}: job {existing["job_id"]}. '
+                       'Run `lmn alloc --release` first to replace it.')
+        return
+
+    slurm_conf = get_slurm_conf(machine, parsed.sconf, preset, ssh_client=ssh_client)
+    ttl = parsed.ttl or slurm_conf.time or '1:00:00'
+
+    # `--no-shell` immediately exits after the allocation is granted, and the allocation is kept until `--time` passes
+    name = f'{machine.user}-lmn-{project.name}-alloc'
+    slurm_command = make_slurm_command(slurm_conf, job_name=name, time=ttl, output=None, error=None)
+    # NOTE: The exit status is ignored so that the salloc output is shown when it fails
+    cmd = slurm_command.srun('', srun_cmd='salloc --no-shell') + ' 2>&1 ; true'
+    logger.info(f'Requesting an allocation for {ttl} on {machine.base_uri}')
+    if parsed.dry_run:
+        logger.info(f'dry run: {cmd}')
+        return
+
+    try:
+        output = ssh_client.run(cmd, capture_output=True)
+    except RuntimeError as e:
+        raise LMNError(f'Failed to request an allocation on {machine.base_uri}:\n{str(e)}')
+    job_id = parse_salloc_jobid(output)
+    if job_id is None:
+        raise LMNError(f'salloc failed on {machine.base_uri}:\n{output}')
+
+    alloc_manager.set(machine.base_uri, job_id, parse_slurm_time(ttl), sconf=parsed.sconf)
+    logger.info(f'Allocation granted: job {job_id}. `lmn run {parsed.machine}` will run in this allocation until it expires.')
+
+
+name = 'alloc'
+description = 'hold a Slurm allocation that following interactive runs reuse'
+parser = _get_parser()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Run a launch plan written by `lmn run --plan` (see `lmn.plan`)."""
+
+
+from __future__ import annotations
+from argparse import ArgumentParser
+from argparse import Namespace
+from pathlib import Path
+from typing import Dict, List
+from lmn import logger, LMNError
+from lmn.plan import LaunchPlan
+
+
+def _get_parser() -> ArgumentParser:
+    parser = ArgumentParser()
+    parser.add_argument(
+        "plan",
+        action="store",
+        type=str,
+        help="JSON file of the launch plan",
+    )
+    parser.add_argument(
+        "--verbose",
+        default=False,
+        action="store_true",
+        help="Be verbose"
+    )
+    return parser
+
+
+def apply_plan(plan: LaunchPlan, dry_run: bool = False) -> Dict[str, List[str]]:
+    """Sync the files and run the steps of the plan. Returns a map from the name of each submitted job to its job ids."""
+    from tempfile import NamedTemporaryFile
+    from lmn.cli.sync import _apply_sync_spec
+    from lmn.helpers import LaunchLogManager, establish_persistent_ssh, get_timestamp
+    from lmn.machine import CLISSHClient, RemoteConfig
+    from lmn.runner import _submit_chain
+
+    remote_conf = RemoteConfig(plan.user, plan.host)
+    logger.info(f'Applying the plan of {plan.project} ({plan.mode} mode) on {remote_conf.base_uri}: {len(plan.syncs)} syncs, {len(plan.steps)} steps')
+    if dry_run:
+        for spec in plan.syncs:
+            logger.info(f'dry run: sync {spec.source_dir} to {spec.target_dir}')
+        for step in plan.steps:
+            logger.info(f'dry run: {step.op} {step.path if step.op == "put" else step.cmd}')
+        return {}
+
+    establish_persistent_ssh(remote_conf)
+    for spec in plan.syncs:
+        try:
+            _apply_sync_spec(spec, remote_conf, plan.sync_conf)
+        except OSError:
+            import traceback
+            raise LMNError(traceback.format_exc(0))
+
+    ssh_client = CLISSHClient(remote_conf)
+    jobs = {}
+    for step in plan.steps:
+        if step.op == 'put':
+            with NamedTemporaryFile(mode='w+') as temp_file:
+                temp_file.write(step.content)
+                temp_file.flush()
+                ssh_client.put(temp_file.name, step.path)
+        elif step.op == 'run':
+            try:
+                ssh_client.run(step.cmd, directory=step.directory, env=step.env)
+            except RuntimeError as e:
+                # NOTE: hide error as the exception is also raised when the command returns non-zero exit value.
+                logger.debug(f'ssh_client.run(...) failed!!:\n{str(e)}')
+        elif step.op == 'submit':
+            job_ids = _submit_chain(ssh_client, step.cmd, step.directory)
+            if step.log is not None:
+                jobs[step.log['job_name']] = job_ids
+                if job_ids:
+                    LaunchLogManager().log({**step.log, 'timestamp': get_timestamp(), 'job_ids': job_ids})
+    return jobs
+
+
+def handler(project, machine, parsed: Namespace, preset: dict):
+    if not Path(parsed.plan).is_file():
+        raise LMNError(f'Plan file {parsed.plan} is not found.')
+    plan = LaunchPlan.load(parsed.plan)
+    apply_plan(plan, dry_run=parsed.dry_run)
+
+
+name = 'apply'
+description = 'run a launch plan written by `lmn run --plan`'
+parser = _get_parser()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""Garbage-collect remote lmn directories: --contain snapshots and submitted scripts."""
+
+
+from __future__ import annotations
+import time
+from pathlib import Path
+from argparse import ArgumentParser
+from argparse import Namespace
+from typing import Dict, List, Optional, Set
+from lmn import logger
+from lmn.machine import CLISSHClient
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from lmn.cli._config_loader import Project, Machine
+
+
+def _get_parser() -> ArgumentParser:
+    parser = ArgumentParser()
+    parser.add_argument(
+        "machine",
+        action="store",
+        type=str,
+        help="Machine",
+    )
+    parser.add_argument(
+        "--verbose",
+        default=False,
+        action="store_true",
+        help="Be verbose"
+    )
+    parser.add_argument(
+        "--keep",
+        action="store",
+        type=int,
+        default=3,
+        help="always keep this many latest --contain snapshots (default: 3)"
+    )
+    parser.add_argument(
+        "--older-than",
+        action="store",
+        type=float,
+        default=1.,
+        help="only delete snapshots older than this many days (default: 1)"
+    )
+    parser.add_argument(
+        "--scripts-older-than",
+        action="store",
+        type=float,
+        default=7.,
+        help="delete submitted scripts older than this many days (default: 7)"
+    )
+    return parser
+
+
+def _format_size(kbytes: int) -> str:
+    size = float(kbytes)
+    for unit in ['K', 'M', 'G', 'T']:
+        if size < 1024 or unit == 'T':
+            return f'{size:.1f}{unit}'
+        size /= 1024
+
+
+def parse_du(lines: List[str]) -> Dict[str, int]:
+    """Parse `du -sk` output into a map from path to kilobytes."""
+    usage = {}
+    for line in lines:
+        fields = line.split(None, 1)
+        if len(fields) == 2 and fields[0].isdigit():
+            usage[fields[1]] = int(fields[0])
+    return usage
+
+
+def get_snapshot_status(entries: List[dict], host: str, queued_job_ids: Dict[str, Optional[Set[str]]]) -> Dict[str, str]:
+    """Return the status of each snapshot root (parent of codedir) that has Slurm / PBS jobs in the launch log.
+
+    - queued_job_ids: the job ids in the queue of each scheduler ('slurm' / 'pbs'), or None if it cannot be queried
+
+    The status is 'active' if any of its jobs is still in the queue, 'finished' if all of them have left the queue,
+    and 'unknown' if the queue of its scheduler cannot be queried. Snapshots that are not in the map
+    (e.g., of --contain runs in ssh / docker mode, or launched from another machine) are unknown as well.
+    """
+    # NOTE: PBS job ids look like 1234.server, and only the number is compared
+    queued_job_ids = {scheduler: None if job_ids is None else {job_id.split('.')[0] for job_id in job_ids}
+                      for scheduler, job_ids in queued_job_ids.items()}
+    status = {}
+    for entry in entries:
+        if entry.get('host') != host or 'lmndirs' not in entry or 'mode' not in entry:
+            continue
+        snapshot = str(Path(entry['lmndirs']['codedir']).parent)
+        job_ids = queued_job_ids.get('slurm' if 'slurm' in entry['mode'] else 'pbs')
+        if job_ids is None:
+            entry_status = 'unknown'
+        elif any(str(job_id).split('.')[0] in job_ids for job_id in entry.get('job_ids', [])):
+            entry_status = 'active'
+        else:
+            entry_status = 'finished'
+        # A snapshot (e.g., of a sweep) is only finished if all of its entries are
+        if status.get(snapshot) in (None, 'finished') or entry_status == 'active':
+            status[snapshot] = entry_status
+    return status
+
+
+def get_snapshot_time(path: str, mtime: Optional[int]) -> Optional[float]:
+    """Return when the snapshot `{rootdir}--{run_id}` was made (as a UNIX time), read from its run ID if possible."""
+    from lmn.helpers import is_run_id, read_run_id, read_timestamp
+    suffix = Path(path).name.rsplit('--', 1)[-1]
+    if is_run_id(suffix):
+        return read_run_id(suffix).timestamp()
+    try:
+        # Snapshots made by older versions are suffixed with timestamps
+        return read_timestamp(suffix).timestamp()
+    except ValueError:
+        return mtime
+
+
+def handler(project: Project, machine: Machine, parsed: Namespace, preset: dict):
+    from lmn.helpers import LaunchLogManager, establish_persistent_ssh
+    from lmn.probe import parse_sections
+
+    logger.debug(f'handling command for {__file__}')
+    logger.debug(f'parsed: {parsed}')
+
+    establish_persistent_ssh(machine.remote_conf)
+    ssh_client = CLISSHClient(machine.remote_conf)
+
+    rootdir = Path(machine.lmndirs.rootdir)
+    snapshots = rootdir.parent / f'{rootdir.name}--*'
+
+    # A single pass: disk usage of every project (and its snapshots), snapshot mtimes, and queued jobs
+    # NOTE: LMN_QUERY_OK tells an empty queue from a failed query
+    output = ssh_client.run(' ; '.join((
+        'echo LMN_SECTION du', f'du -sk {rootdir.parent}/* 2>/dev/null',
+        'echo LMN_SECTION mtime', f'stat -c %Y:%n {snapshots} 2>/dev/null',
+        'echo LMN_SECTION slurm', 'squeue -h -u $USER -o %i 2>/dev/null && echo LMN_QUERY_OK',
+        'echo LMN_SECTION pbs', 'qselect -u $USER 2>/dev/null && echo LMN_QUERY_OK',
+        'true',
+    )), capture_output=True)
+    sections = parse_sections(output)
+
+    usage = parse_du(sections.get('du', []))
+    per_project = {}
+    for path, kbytes in usage.items():
+        project_name = Path(path).name.split('--')[0]
+        per_project[project_name] = per_project.get(project_name, 0) + kbytes
+    logger.info(f'Disk usage under {machine.base_uri}:{rootdir.parent}')
+    for project_name, kbytes in sorted(per_project.items(), key=lambda item: -item[1]):
+        print(f'  {_format_size(kbytes):>8}  {project_name}')
+
+    created = {}
+    for line in sections.get('mtime', []):
+        mtime, _, path = line.partition(':')
+        if mtime.isdigit():
+            created[path] = get_snapshot_time(path, int(mtime))
+
+    queued_job_ids = {}
+    for scheduler in ['slurm', 'pbs']:
+        lines = sections.get(scheduler, [])
+        queued_job_ids[scheduler] = set(lines[:-1]) if lines and lines[-1] == 'LMN_QUERY_OK' else None
+    status = get_snapshot_status(LaunchLogManager().read(), machine.base_uri, queued_job_ids)
+
+    # Retention policy: keep the latest `--keep` snapshots and the recent ones,
+    # and only delete the ones whose jobs are known to be finished (never the ones with an unknown status)
+    now = time.time()
+    ordered = sorted(created, key=created.get, reverse=True)
+    to_delete = [path for path in ordered[parsed.keep:]
+                 if status.get(path) == 'finished' and now - created[path] > parsed.older_than * 24 * 3600]
+
+    freed = sum(usage.get(path, 0) for path in to_delete)
+    num_active = len([path for path in ordered if status.get(path) == 'active'])
+    num_unknown = len([path for path in ordered if status.get(path, 'unknown') == 'unknown'])
+    logger.info(f'{len(ordered)} snapshots of {project.name}: deleting {len(to_delete)} ({_format_size(freed)}), '
+                f'{num_active} with active jobs, {num_unknown} kept as their jobs are unknown')
+    for path in to_delete:
+        logger.debug(f'deleting {path}')
+
+    scriptdir = machine.lmndirs.scriptdir
+    minutes = int(parsed.scripts_older_than * 24 * 60)
+    cmds = [f'rm -rf {" ".join(to_delete)}'] if to_delete else []
+    # NOTE: sbatch / qsub keep their own copy of the submitted script, thus it is safe to delete them
+    cmds += [f'find {scriptdir} -maxdepth 1 -name ".script-*.sh" -mmin +{minutes} -delete 2>/dev/null']
+    queried = [job_ids for job_ids in queued_job_ids.values() if job_ids is not None]
+    if queried and not any(queried):
+        # Task lists and queues of the sweep workers are read while the workers run
+        cmds += [f'find {scriptdir} -maxdepth 1 \\( -name ".tasks-*" -o -name ".queue-*" \\) -mmin +{minutes} -exec rm -rf {{}} + 2>/dev/null']
+    cmds += ['true']
+
+    if parsed.dry_run:
+        logger.info('dry run: nothing is deleted')
+        for path in to_delete:
+            print(f'  {path}')
+        return
+    ssh_client.run(' ; '.join(cmds))
+    logger.info('Done!')
+
+
+name = 'gc'
+description = 'delete old --contain snapshots and scripts on a remote server'
+parser = _get_parser()
@@ -1,14 +1,12 @@
 #!/usr/bin/env python3
-"""Simply run nvidia-smi command on a specified remote."""
+"""Show GPU usage of remote machines (nvidia-smi)."""
 
 
 from __future__ import annotations
-from copy import deepcopy
-import os
-from pathlib import Path
 from argparse import ArgumentParser
 from argparse import Namespace
-from lmn import logger
+from typing import Dict, List, Optional
+from lmn import logger, LMNError
 from lmn.cli.brun import handler as brun_handler
 
 from typing import TYPE_CHECKING
@@ -22,7 +20,8 @@ def _get_parser() -> ArgumentParser:
         "machine",
         action="store",
         type=str,
-        help="Machine",
+        nargs="+",
+        help="Machines (`all` for all the machines, `pool:<name>` for the machines in a pool)",
     )
     parser.add_argument(
         "--verbose",
@@ -30,15 +29,82 @@ def _get_parser() -> ArgumentParser:
         action="store_true",
         help="Be verbose"
     )
+    parser.add_argument(
+        "-w",
+        "--watch",
+        action="store",
+        type=float,
+        nargs="?",
+        const=5.,
+        default=None,
+        help="refresh the table every N seconds (default: 5)"
+    )
+    parser.add_argument(
+        "--raw",
+        action="store_true",
+        help="just run nvidia-smi on a single machine"
+    )
     return parser
 
 
+def render_table(statuses: Dict[str, Optional[List[dict]]]) -> str:
+    """Render one row per GPU: free memory, utilization and processes."""
+    header = ('MACHINE', 'GPU', 'NAME', 'FREE / TOTAL (MiB)', 'UTIL', 'PROCESSES')
+    rows = []
+    for machine_name, gpus in statuses.items():
+        if gpus is None:
+            rows.append((machine_name, '-', 'unreachable', '', '', ''))
+            continue
+        if not gpus:
+            rows.append((machine_name, '-', 'no GPU found', '', '', ''))
+            continue
+        for gpu in gpus:
+            free = gpu['memory_total'] - gpu['memory_used']
+            procs = ' '.join(f'{proc["user"]}({proc["memory_used"]}MiB)' for proc in gpu['processes'])
+            rows.append((machine_name, str(gpu['index']), gpu['name'],
+                         f'{free} / {gpu["memory_total"]}', f'{gpu["utilization"]}%', procs))
+
+    widths = [max(len(row[col]) for row in [header, *rows]) for col in range(len(header))]
+    return '\n'.join('  '.join(val.ljust(width) for val, width in zip(row, widths)).rstrip()
+                     for row in [header, *rows])
+
+
 def handler(project: Project, machine: Machine, parsed: Namespace, preset: dict):
-    parsed.remote_command = 'nvidia-smi'
-    parsed.with_startup = False  # HACK
-    brun_handler(project, machine, parsed, preset)
+    import time
+    from lmn.cli._config_loader import load_config, load_remote_confs
+    from lmn.probe import make_gpu_status_command, parse_gpu_status, run_on_hosts
+
+    if parsed.raw:
+        if len(parsed.machine) > 1:
+            raise LMNError('--raw option only supports a single machine.')
+        project, machine, preset = load_config(parsed.machine[0])
+        parsed.remote_command = 'nvidia-smi'
+        parsed.with_startup = False  # HACK
+        brun_handler(project, machine, parsed, preset)
+        return
+
+    remote_confs = load_remote_confs(parsed.machine)
+    cmd = make_gpu_status_command()
+
+    # Establish ControlMaster connections only once, and reuse them while watching
+    establish = True
+    try:
+        while True:
+            outputs = run_on_hosts(remote_confs, cmd, establish=establish)
+            establish = False
+            statuses = {name: None if output is None else parse_gpu_status(output) for name, output in outputs.items()}
+            table = render_table(statuses)
+            if parsed.watch is None:
+                print(table)
+                return
+
+            # Clear the screen and show the table
+            print('\033[H\033[J' + time.strftime('%H:%M:%S') + f' (every {parsed.watch}s)\n' + table, flush=True)
+            time.sleep(parsed.watch)
+    except KeyboardInterrupt:
+        pass
 
 
 name = 'nv'
-description = 'run nvidia-smi on a remote server'
+description = 'show GPU usage of remote servers'
 parser = _get_parser()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Pull the output files from a remote server, optionally following them while the job is running."""
+
+
+from __future__ import annotations
+from pathlib import Path
+from argparse import ArgumentParser
+from argparse import Namespace
+from lmn import logger
+from lmn.cli.sync import _sync_output, follow_output
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from lmn.cli._config_loader import Project, Machine
+
+
+def _get_parser() -> ArgumentParser:
+    parser = ArgumentParser()
+    parser.add_argument(
+        "machine",
+        action="store",
+        type=str,
+        help="Machine",
+    )
+    parser.add_argument(
+        "--verbose",
+        default=False,
+        action="store_true",
+        help="Be verbose"
+    )
+    parser.add_argument(
+        "-f",
+        "--follow",
+        action="store_true",
+        help="keep pulling the output files as they change (until interrupted)",
+    )
+    parser.add_argument(
+        "--interval",
+        action="store",
+        type=float,
+        default=30.,
+        help="seconds between the checks for changes with --follow (default: 30)"
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store",
+        type=str,
+        default=None,
+        help="pull from the output directory of a --contain run (the suffix of `{root_dir}--{suffix}`)"
+    )
+    parser.add_argument(
+        "--since",
+        action="store",
+        type=str,
+        default=None,
+        help="only pull the output files modified within this duration (e.g., 30m, 2h, 1d)"
+    )
+    return parser
+
+
+def handler(project: Project, machine: Machine, parsed: Namespace, preset: dict):
+    from lmn.helpers import establish_persistent_ssh
+    from lmn.output import parse_duration
+
+    logger.debug(f'handling command for {__file__}')
+    logger.debug(f'parsed: {parsed}')
+
+    if parsed.snapshot is not None:
+        rootdir = Path(machine.lmndirs.rootdir)
+        machine.lmndirs.outdir = rootdir.parent / f'{rootdir.name}--{parsed.snapshot}' / 'output'
+
+    since = None if parsed.since is None else parse_duration(parsed.since)
+
+    establish_persistent_ssh(machine.remote_conf)
+    if not parsed.follow:
+        _sync_output(project, machine, dry_run=parsed.dry_run, since=since)
+        return
+
+    logger.info(f'Following {machine.base_uri}:{machine.lmndirs.outdir} (Ctrl-C to stop)')
+    try:
+        follow_output(project, machine, interval=parsed.interval, since=since, dry_run=parsed.dry_run)
+    except KeyboardInterrupt:
+        pass
+
+
+name = 'pull'
+description = 'pull the output files from a remote server'
+parser = _get_parser()
@@ -1,21 +1,24 @@
 from __future__ import annotations
-import time
 from copy import deepcopy
+from functools import partial
 import os
 from pathlib import Path
 from argparse import ArgumentParser
 from argparse import Namespace
-from lmn import logger
-from lmn.helpers import find_project_root, parse_sweep_idx
+from lmn import logger, LMNError
+from lmn.helpers import find_project_root, make_run_id, parse_sweep_idx
 from lmn.machine import CLISSHClient
 from lmn.runner import SlurmRunner, PBSRunner
-from lmn.cli.sync import _sync_output, _sync_code
+from lmn.cli.sync import _sync_output, _sync_code, _stage_datasets, _get_code_sync_spec, _get_dataset_sync_specs
+from lmn.cli._scheduler import get_slurm_conf, get_pbs_conf
 from lmn.const import available_modes
 
 
-from typing import TYPE_CHECKING, Literal, Optional
+from typing import TYPE_CHECKING, Dict, List, Literal, Optional
 if TYPE_CHECKING:
+    from lmn.agent import AgentClient
     from lmn.cli._config_loader import Project, Machine
+    from lmn.plan import PlanRecorder, PlanStep
 
 
 def _get_parser() -> ArgumentParser:
@@ -45,12 +48,12 @@ def _get_parser() -> ArgumentParser:
     parser.add_argument(
         "--sconf",
         default=None,
-        help="specify a slurm configuration to be used"
+        help="specify a slurm configuration to be used (comma-separated presets: use the one where the job starts soonest)"
     )
     parser.add_argument(
         "--pbsconf",
         default=None,
-        help="specify a PBS configuration to be used"
+        help="specify a PBS configuration to be used (comma-separated presets: use the one with the least queued jobs)"
     )
     parser.add_argument(
         "--dconf",
@@ -88,13 +91,20 @@ def _get_parser() -> ArgumentParser:
         action="store_true",
         help="With this flag, rsync will copy the project directory to a new unique location on remote, rather than the predetermined one.",
     )
+    parser.add_argument(
+        "--pull-every",
+        action="store",
+        type=float,
+        default=None,
+        help="pull the output files every this many seconds (when they changed) while the command is running (not with --disown)"
+    )
     parser.add_argument(
         "-n",
         "--num-sequence",
         action="store",
         type=int,
         default=1,
-        help="number of sequence in Slurm sequential jobs"
+        help="number of sequence in Slurm / PBS sequential jobs (each job starts after the previous one ends)"
     )
     parser.add_argument(
         "--sweep",
@@ -102,6 +112,25 @@ def _get_parser() -> ArgumentParser:
         type=str,
         help="specify sweep range (e.g., --sweep 0-255) this changes the value of $LMN_RUN_SWEEP_IDX"
     )
+    parser.add_argument(
+        "--workers",
+        action="store",
+        type=int,
+        default=None,
+        help="launch this many worker jobs that pull sweep indices from a shared task queue, rather than one job per index (only for Slurm / PBS mode)"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="with --sweep, only submit the indices that have not completed yet (and are not queued / running) (only for Slurm / PBS mode)"
+    )
+    parser.add_argument(
+        "--plan",
+        action="store",
+        type=str,
+        default=None,
+        help="write the launch plan (what would be synced and run) to this JSON file rather than launching; run it later with `lmn apply` (implies --dry-run)"
+    )
     parser.add_argument(
         "remote_command",
         default=False,
@@ -113,6 +142,213 @@ def _get_parser() -> ArgumentParser:
     return parser
 
 
+def _select_latest_snapshot(code_dirs: List[str]) -> Optional[str]:
+    """Return the latest of the snapshot code directories (`{rootdir}--{run_id}/code`), or None if there is none.
+
+    Run IDs sort in the order they are made, and the snapshots named after them are newer than the ones
+    named after timestamps by older versions of lmn (which also sort in order among themselves).
+    NOTE: mtimes cannot tell the latest, as rsync copies the mtime of the local project root onto every snapshot.
+    """
+    from lmn.helpers import is_run_id
+
+    def _key(code_dir: str):
+        suffix = Path(code_dir).parent.name.rsplit('--', 1)[-1]
+        return (is_run_id(suffix), suffix)
+
+    return max(code_dirs, key=_key, default=None)
+
+
+def _find_link_dests(machine: Machine) -> List[str]:
+    """Return the code directories that a new --contain snapshot can hard-link unchanged files from.
+
+    These are the latest `{rootdir}--{run_id}/code` and the regular (non-contained) `{rootdir}/code`.
+    NOTE: A hard-linked file is shared between the snapshots, thus a job that writes to a file in its codedir in place
+    (rather than replacing it) changes the same file in the other snapshots that share it.
+    """
+    rootdir = Path(machine.lmndirs.rootdir)
+    snapshots = rootdir.parent / f'{rootdir.name}--*' / 'code'
+    ssh_client = CLISSHClient(machine.remote_conf)
+    separator = '--- lmn ---'
+    output = ssh_client.run(f'ls -1d {snapshots} 2>/dev/null ; echo "{separator}" ; test -d {machine.lmndirs.codedir} && echo {machine.lmndirs.codedir} ; true',
+                            capture_output=True)
+    snapshots_output, _, codedir_output = output.partition(separator)
+    latest = _select_latest_snapshot([line.strip() for line in snapshots_output.splitlines() if line.strip()])
+    link_dests = ([] if latest is None else [latest]) + [line.strip() for line in codedir_output.splitlines() if line.strip()]
+    logger.debug(f'link-dest directories: {link_dests}')
+    return link_dests
+
+
+def _prepare(project: Project, machine: Machine, parsed: Namespace, mode: str) -> Optional[str]:
+    """Pre-flight stage of the launch. Returns the shared codedir if the project is on a shared filesystem."""
+    # If the project is on a filesystem shared with the remote, use it as the codedir rather than copying it
+    # (a --contain run needs its own copy though)
+    # With --no-sync, the project is not probed, but a codedir found by an earlier run is still used
+    shared_codedir = None
+    if not parsed.contain and machine.parsed_conf.shared_fs:
+        from lmn.cli.sync import _detect_shared_codedir
+        shared_codedir = _detect_shared_codedir(project, machine, probe=not parsed.no_sync)
+
+    # Fail fast, before spending time on syncing, if the host cannot run the job
+    _preflight(machine, mode, sync=not parsed.no_sync and shared_codedir is None, dry_run=parsed.dry_run)
+    return shared_codedir
+
+
+def _sync(project: Project, machine: Machine, parsed: Namespace, runtime_options: Namespace, shared_codedir: Optional[str]):
+    """Sync stage of the launch: sync the code (into a new snapshot with --contain) and stage the datasets."""
+    if shared_codedir is not None:
+        logger.info(f'The project is on a shared filesystem. Using {shared_codedir} as the codedir without syncing.')
+        machine.lmndirs.codedir = shared_codedir
+        if parsed.no_sync:
+            return
+        lmndirs = machine.lmndirs
+        mkdir_cmd = f'mkdir -p {lmndirs.outdir} {lmndirs.mountdir} {lmndirs.scriptdir}'
+        if runtime_options.plan is not None:
+            from lmn.plan import PlanStep
+            runtime_options.plan.steps.append(PlanStep(op='run', cmd=mkdir_cmd))
+            runtime_options.plan.syncs += _get_dataset_sync_specs(project, machine)
+        else:
+            CLISSHClient(machine.remote_conf).run(mkdir_cmd)
+            _stage_datasets(project, machine)
+
+    elif not parsed.no_sync:
+        link_dest = None
+        if parsed.contain:
+            # Unchanged files are hard-linked from the latest snapshot rather than transferred again
+            link_dest = _find_link_dests(machine)
+
+            # Generate a unique path and set it to machine.lmndir
+            _hash = runtime_options.run_id
+
+            # HACK: Dirty but just overwrite machine.lmndirs with new paths
+            # Add the hash to lmndirs
+            rootdir = Path(machine.lmndirs.rootdir)
+            new_lmn_root = rootdir.parent / (rootdir.name + f'--{_hash}')
+            machine.lmndirs.codedir = new_lmn_root / 'code'
+            if not project.datasets:
+                # NOTE: mountdir is shared across snapshots if datasets are staged there
+                machine.lmndirs.mountdir = new_lmn_root / 'mount'
+            machine.lmndirs.outdir = new_lmn_root / 'output'
+            machine.lmndirs.scriptdir = new_lmn_root / 'script'
+            # machine.lmndir = Path(f'{machine.lmndir}/{_hash}')
+
+            runtime_options.name = _hash
+            logger.info(f'--contain flag is set.\n\tsetting the remote lmndir to {new_lmn_root}\n\tsetting jobs suffix to {_hash}')
+
+        if runtime_options.plan is not None:
+            runtime_options.plan.syncs += [_get_code_sync_spec(project, machine, link_dest=link_dest),
+                                           *_get_dataset_sync_specs(project, machine)]
+        else:
+            _sync_code(project, machine, link_dest=link_dest)
+            _stage_datasets(project, machine)
+
+
+async def _check_image(machine: Machine, mode: str, dry_run: bool = False):
+    """Image stage of the launch: make sure the docker image is available on the host (pulling it if needed), and warn if the SIF file is missing."""
+    ssh_client = CLISSHClient(machine.remote_conf)
+    if mode == 'docker' and machine.parsed_conf.docker is not None:
+        image = machine.parsed_conf.docker.image
+        if dry_run:
+            return
+        try:
+            await ssh_client.run_async(f'docker image inspect {image} >/dev/null 2>&1 || docker pull -q {image}', capture_output=True)
+        except RuntimeError:
+            raise LMNError(f'Docker image {image} is not available on {machine.base_uri}.')
+    elif 'sing' in mode and machine.parsed_conf.singularity is not None:
+        sif_file = machine.parsed_conf.singularity.sif_file
+        # NOTE: Only absolute paths are checked; URIs (docker://, library://, ...) and relative paths are left to singularity.
+        # The image may still exist only on the compute nodes, thus a missing one is not an error.
+        if not sif_file.startswith('/') or '://' in sif_file:
+            return
+        output = await ssh_client.run_async(f'test -e {sif_file} && echo found ; true', capture_output=True)
+        if 'found' not in output:
+            logger.warning(f'SIF file {sif_file} is not found on {machine.base_uri} (it may only be visible from the compute nodes).')
+
+
+# Agents started in this process (host -> AgentClient), reused across launches (see `lmn.client.Client`)
+_agents = {}
+
+
+def _start_agent(machine: Machine):
+    """Start the lmn agent on the host (closed at exit), or return None if it fails to start.
+
+    The agent is reused if it is still running for the host.
+    """
+    import atexit
+    import subprocess
+    from lmn.agent import AgentClient, AgentError
+    agent = _agents.get(machine.base_uri)
+    if agent is not None and agent.proc is not None and agent.proc.poll() is None:
+        return agent
+    try:
+        agent = AgentClient(machine.remote_conf).start()
+    except (AgentError, subprocess.CalledProcessError, OSError) as e:
+        logger.warning(f'Failed to start the agent on {machine.base_uri}: {str(e)}')
+        return None
+    atexit.register(agent.close)
+    _agents[machine.base_uri] = agent
+    return agent
+
+
+def _preflight(machine: Machine, mode: str, sync: bool = True, dry_run: bool = False):
+    """Raise LMNError if the host lacks the tools for the mode or a writable lmn root directory (see `lmn.probe.get_capabilities`).
+
+    The container runtime may only be available on the compute nodes (or after `startup`), thus its absence is only warned.
+    With dry_run, the lmn root directory is not created.
+    """
+    from lmn.probe import get_capabilities, get_missing_tools
+
+    rootdir = machine.lmndirs.rootdir
+    capabilities = get_capabilities(machine.remote_conf, rootdir, create=not dry_run)
+    if capabilities is None:
+        logger.warning(f'Failed to probe {machine.base_uri}. Skipping the pre-flight checks.')
+        return
+    if get_missing_tools(capabilities, mode, sync) or not capabilities['writable']:
+        # The cached capabilities may be outdated (e.g., a tool has been installed since)
+        capabilities = get_capabilities(machine.remote_conf, rootdir, refresh=True, create=not dry_run) or capabilities
+
+    missing = get_missing_tools(capabilities, mode, sync)
+    if missing:
+        raise LMNError(f'{", ".join(missing)} not found on {machine.base_uri} ({mode} mode requires them).')
+    if not capabilities['writable']:
+        raise LMNError(f'{rootdir} on {machine.base_uri} is not writable. Please set `root_dir` in the config.')
+    missing = get_missing_tools(capabilities, mode, expected=True)
+    if missing:
+        logger.warning(f'{", ".join(missing)} not found on {machine.base_uri}. '
+                       f'Make sure that the compute nodes have it (e.g., `module load` in `startup`).')
+    free_kbytes = capabilities['free_kbytes']
+    if free_kbytes is not None and free_kbytes < 1024 * 1024:
+        logger.warning(f'Only {free_kbytes // 1024} MB is left under {rootdir} on {machine.base_uri}')
+    logger.debug(f'capabilities of {machine.base_uri}: {capabilities}')
+
+
+def _setup_datasets(project: Project, machine: Machine, mode: str):
+    """Point `LMN_DATASET_{NAME}` envvars to the staged datasets, copying them to the node-local cache first if requested."""
+    from lmn.dataset import get_dataset_envvar, get_dataset_manifest, make_node_local_command
+    from lmn.output import parse_size
+
+    in_container = mode == 'docker' or 'sing' in mode
+    mountdir = machine.container_lmndirs.mountdir if in_container else machine.lmndirs.mountdir
+    cache_conf = machine.parsed_conf.node_local_cache
+
+    prelude = []
+    for idx, (name, dataset) in enumerate(project.datasets.items()):
+        if dataset.node_local and cache_conf is not None and mode != 'docker':
+            max_kbytes = None if cache_conf.max_size is None else parse_size(cache_conf.max_size) // 1024
+            manifest = get_dataset_manifest(project.rootdir / dataset.path, dataset.exclude)
+            prelude += [make_node_local_command(name, f'{machine.lmndirs.mountdir}/{name}', manifest, cache_conf.dir,
+                                                max_kbytes=max_kbytes, fd=20 + idx)]
+        else:
+            if dataset.node_local:
+                logger.warning(f'Dataset "{name}" is read from mountdir, as node-local cache is not available '
+                               f'({"docker mode" if mode == "docker" else "node_local_cache is not set for the machine"})')
+            project.env[get_dataset_envvar(name)] = f'{mountdir}/{name}'
+
+    if prelude:
+        project.startup = ' ; '.join([*prelude, project.startup]) if project.startup.strip() else ' ; '.join(prelude)
+        if 'sing' in mode and machine.parsed_conf.singularity is not None:
+            machine.parsed_conf.singularity.mount_from_host[cache_conf.dir] = cache_conf.dir
+
+
 def print_conf(mode: str, machine: Machine, image: Optional[str] = None):
     output = f'Running with [{mode}] mode on [{machine.remote_conf.base_uri}]'
     if image is not None:
@@ -135,6 +371,54 @@ def handler(project: Project, machine: Machine, parsed: Namespace, preset: dict)
     proj_rootdir = find_project_root()
     rel_workdir = curr_dir.relative_to(proj_rootdir)
     logger.debug(f'relative working dir: {rel_workdir}')
+
+    # Before running anything significant, validate the options
+    _validate_options(parsed)
+    _validate_mode(machine, parsed.mode or machine.parsed_conf.mode or 'ssh')
+    if parsed.plan is not None:
+        parsed.dry_run = True
+
+    # - Run a pre-flight ssh with ControlMaster to establish & retain the connection
+    # - The future ssh / rsync will reuse this connection
+    from lmn.helpers import establish_persistent_ssh
+    establish_persistent_ssh(machine.remote_conf)
+
+    launch(project, machine, parsed, preset, rel_workdir)
+
+
+def _validate_options(parsed: Namespace):
+    if parsed.sweep:
+        # This will raise an error if the format is invalid
+        parse_sweep_idx(parsed.sweep)
+
+    if parsed.resume and not parsed.sweep:
+        raise LMNError('--resume option can only be used with --sweep.')
+
+    if parsed.workers is not None:
+        if not parsed.sweep:
+            raise LMNError('--workers option can only be used with --sweep.')
+        if parsed.workers < 1:
+            raise LMNError(f'--workers must be a positive integer, but got {parsed.workers}.')
+
+
+def _validate_mode(machine: Machine, mode: str):
+    """Raise LMNError unless `mode` is available on the machine (its container config is set)."""
+    if mode not in available_modes:
+        raise LMNError(f'Invalid mode: {mode}. Available modes are: {", ".join(available_modes)}')
+    if mode == 'docker' and machine.parsed_conf.docker is None:
+        raise LMNError(f'Configuration of {machine.base_uri} must have an entry for "docker" to use docker mode.')
+    if 'sing' in mode and machine.parsed_conf.singularity is None:
+        raise LMNError(f'Configuration of {machine.base_uri} must have an entry for "singularity" to use {mode} mode.')
+
+
+def launch(project: Project, machine: Machine, parsed: Namespace, preset: dict,
+           rel_workdir: Path) -> Dict[str, List[str]]:
+    """Sync the code, run the command and sync the output files back (the ssh connection must be established).
+
+    Returns a map from the name of each submitted Slurm / PBS batch job to its job ids.
+    With --dry-run, nothing changes on the remote; the launch is compiled into a plan (see `lmn.plan`),
+    which is written to `parsed.plan` (or shown if it is not set).
+    """
     if isinstance(parsed.remote_command, list):
         cmd = ' '.join(parsed.remote_command)
     else:
@@ -150,50 +434,86 @@ def handler(project: Project, machine: Machine, parsed: Namespace, preset: dict)
                                 name=parsed.name,
                                 num_sequence=parsed.num_sequence,
                                 no_sync=parsed.no_sync,
-                                force=parsed.force)
-
-    # Before running anything significant, validate --sweep format if specified
-    if parsed.sweep:
-        # This will raise an error if the format is invalid
-        parse_sweep_idx(parsed.sweep)
-
-    # - Run a pre-flight ssh with ControlMaster to establish & retain the connection
-    # - The future ssh / rsync will reuse this connection
-    from lmn.helpers import establish_persistent_ssh
-    establish_persistent_ssh(machine.remote_conf)
+                                force=parsed.force,
+                                run_id=make_run_id(),
+                                plan=None)
+    logger.debug(f'run id: {runtime_options.run_id}')
 
     # Sync code first
     if parsed.no_sync:
         logger.warning('--no-sync option is True, local files will not be synced.')
 
-    if not parsed.no_sync:
-        if parsed.contain:
-            # Generate a unique path and set it to machine.lmndir
-            from lmn.helpers import get_timestamp
-            _hash = get_timestamp()
-
-            # HACK: Dirty but just overwrite machine.lmndirs with new paths
-            # Add the hash to lmndirs
-            rootdir = Path(machine.lmndirs.rootdir)
-            new_lmn_root = rootdir.parent / (rootdir.name + f'--{_hash}')
-            machine.lmndirs.codedir = new_lmn_root / 'code'
-            machine.lmndirs.mountdir = new_lmn_root / 'mount'
-            machine.lmndirs.outdir = new_lmn_root / 'output'
-            machine.lmndirs.scriptdir = new_lmn_root / 'script'
-            # machine.lmndir = Path(f'{machine.lmndir}/{_hash}')
-
-            runtime_options.name = _hash
-            logger.info(f'--contain flag is set.\n\tsetting the remote lmndir to {new_lmn_root}\n\tsetting jobs suffix to {_hash}')
+        # If `lmn watch` is pushing the local edits to this machine, make sure it has caught up
+        from lmn.cli.watch import get_watch_key
+        from lmn.watch import WatchState
+        key = get_watch_key(machine)
+        if WatchState().get(key) is not None:
+            logger.info('Waiting for `lmn watch` to push the pending changes')
+            since = WatchState().request_scan(key)
+            if not WatchState().wait(key, since):
+                logger.warning('`lmn watch` has not finished pushing the changes. The remote code may be outdated.')
+
+    # Independent stages of the launch run concurrently:
+    # - pre-flight checks (shared filesystem detection, host capabilities) -> code sync (and datasets)
+    # - container image verification
+    from lmn.pipeline import Pipeline
+    mode = parsed.mode or machine.parsed_conf.mode or 'ssh'
+    if parsed.dry_run:
+        from lmn.plan import LaunchPlan
+        runtime_options.plan = LaunchPlan(run_id=runtime_options.run_id,
+                                          user=machine.user, host=machine.host, project=project.name, mode=mode, cmd=cmd,
+                                          env={key: str(val) for key, val in {**project.env, **machine.env}.items()},
+                                          sync_conf=machine.parsed_conf.sync)
+    pipeline = Pipeline()
+    pipeline.add('preflight', lambda: _prepare(project, machine, parsed, mode))
+    pipeline.add('sync', lambda shared_codedir: _sync(project, machine, parsed, runtime_options, shared_codedir),
+                 deps=['preflight'])
+    pipeline.add('image', partial(_check_image, machine, mode, dry_run=parsed.dry_run))
+    pipeline.run()
+
+    # Keep pulling the output files in the background while the command is running
+    follower = None
+    if parsed.pull_every is not None and not runtime_options.no_sync and not runtime_options.disown and not parsed.dry_run:
+        from threading import Event, Thread
+        from lmn.cli.sync import follow_output
+        stop_event = Event()
+        follower = Thread(target=follow_output, args=(project, machine),
+                          kwargs={'interval': parsed.pull_every, 'stop_event': stop_event, 'dry_run': parsed.dry_run},
+                          daemon=True)
+        follower.start()
+
+    try:
+        jobs = _run(project, machine, parsed, preset, runtime_options)
+    finally:
+        if follower is not None:
+            stop_event.set()
+            follower.join()
+
+    if runtime_options.plan is not None:
+        if parsed.plan is not None:
+            runtime_options.plan.save(parsed.plan)
+            logger.info(f'The launch plan is written to {parsed.plan}. Run it with `lmn apply {parsed.plan}`')
+        else:
+            print(runtime_options.plan.model_dump_json(indent=2))
+        return jobs
 
-        _sync_code(project, machine, parsed.dry_run)
+    # Sync output files
+    if not runtime_options.no_sync and not runtime_options.disown:
+        _sync_output(project, machine, dry_run=parsed.dry_run)
+    return jobs
 
 
+def _run(project: Project, machine: Machine, parsed: Namespace, preset: dict,
+         runtime_options: Namespace) -> Dict[str, List[str]]:
     # If parsed.mode is not set, try to read from the config file.
     mode = parsed.mode or machine.parsed_conf.mode
     if mode is None:
         logger.warning('mode is not set. Setting it to SSH mode')
         mode = 'ssh'
 
+    if project.datasets:
+        _setup_datasets(project, machine, mode)
+
     if mode == 'ssh':
         from lmn.runner import SSHRunner
 
@@ -202,6 +522,9 @@ def handler(project: Project, machine: Machine, parsed: Namespace, preset: dict)
         env = {**project.env, **machine.env}
 
         ssh_client = CLISSHClient(machine.remote_conf)
+        if runtime_options.plan is not None:
+            from lmn.plan import PlanRecorder
+            ssh_client = PlanRecorder(ssh_client, runtime_options.plan)
         ssh_runner = SSHRunner(ssh_client, lmndirs)
         print_conf(mode, machine)
         ssh_runner.exec(runtime_options.cmd,
@@ -246,16 +569,14 @@ def handler(project: Project, machine: Machine, parsed: Namespace, preset: dict)
         # Because of all the complications,
         # I'd prefer to use `use_ssh_client=True` that uses ssh binary rather than paramiko
 
-        client = DockerClient(base_url=base_url, use_ssh_client=True)
+        # NOTE: A plan runs the equivalent docker CLI commands over ssh instead
+        client = DockerClient(base_url=base_url, use_ssh_client=True) if runtime_options.plan is None else None
 
         # Specify job name
         name = f'{machine.user}-lmn-{project.name}'
         if runtime_options.name is not None:
             name = f'{name}--{runtime_options.name}'
 
-        if parsed.dry_run:
-            raise ValueError('dry run is not yet supported for Docker mode')
-
         # from lmn.cli._config_loader import DOCKER_ROOT_DIR, get_docker_lmndirs
         # docker_lmndirs = get_docker_lmndirs(DOCKER_ROOT_DIR, project.name)
         docker_lmndirs = machine.container_lmndirs
@@ -283,12 +604,19 @@ def handler(project: Project, machine: Machine, parsed: Namespace, preset: dict)
         docker_pconf.env.update(env)
 
         docker_runner = DockerRunner(client, docker_lmndirs)
+        plan_recorder = None
+        if runtime_options.plan is not None:
+            from lmn.plan import PlanRecorder
+            plan_recorder = PlanRecorder(CLISSHClient(machine.remote_conf), runtime_options.plan)
 
         print_conf(mode, machine, docker_pconf.image)
         if parsed.sweep:
             if not runtime_options.disown:
-                logger.error("You must set -d option to use sweep functionality.")
-                import sys; sys.exit(1)
+                raise LMNError("You must set -d option to use sweep functionality.")
+            if parsed.workers is not None:
+                logger.warn("`--workers` option has no effect in Docker mode")
+            if parsed.resume:
+                raise LMNError("`--resume` option is not supported in Docker mode.")
             sweep_ind = parse_sweep_idx(parsed.sweep)
 
             single_sweep = (len(sweep_ind) == 1)
@@ -302,12 +630,28 @@ def handler(project: Project, machine: Machine, parsed: Namespace, preset: dict)
                 dconf.name = _name
                 dconf.env.update(env)
 
+                if plan_recorder is not None:
+                    plan_recorder.run(docker_runner.make_cli_command(runtime_options.cmd,
+                                                                     runtime_options.rel_workdir,
+                                                                     dconf,
+                                                                     interactive=False,
+                                                                     kill_existing_container=runtime_options.force,
+                                                                     quiet=not single_sweep),
+                                      directory=None, dry_run=True)
+                    continue
                 docker_runner.exec(runtime_options.cmd,
                                    runtime_options.rel_workdir,
                                    dconf,
                                    interactive=False,
                                    kill_existing_container=runtime_options.force,
                                    quiet=not single_sweep)
+        elif plan_recorder is not None:
+            plan_recorder.run(docker_runner.make_cli_command(runtime_options.cmd,
+                                                             runtime_options.rel_workdir,
+                                                             docker_pconf,
+                                                             interactive=not runtime_options.disown,
+                                                             kill_existing_container=runtime_options.force),
+                              directory=None, dry_run=True)
         else:
             docker_runner.exec(runtime_options.cmd,
                                runtime_options.rel_workdir,
@@ -319,17 +663,13 @@ def handler(project: Project, machine: Machine, parsed: Namespace, preset: dict)
     elif 'slurm' in mode or 'pbs' in mode:
         # validate the mode
         if mode not in ['slurm', 'slurm-sing', 'sing-slurm', 'pbs', 'pbs-sing', 'sing-pbs']:
-            logger.error(f'Invalid mode: {mode}')
-            import sys; sys.exit(1)
+            raise LMNError(f'Invalid mode: {mode}')
 
-        handler_scheduler(project, machine, parsed, preset, mode, runtime_options)
+        return handler_scheduler(project, machine, parsed, preset, mode, runtime_options)
 
     else:
         raise ValueError(f'Unrecognized mode: {mode}')
-
-    # Sync output files
-    if not runtime_options.no_sync and not runtime_options.disown:
-        _sync_output(project, machine, dry_run=parsed.dry_run)
+    return {}
 
 
 def handler_scheduler(
@@ -339,60 +679,34 @@ def handler_scheduler(
     preset: dict,
     mode: Literal['slurm', 'slurm-sing', 'sing-slurm', 'pbs', 'pbs-sing', 'sing-pbs'],
     run_opt: Namespace,
-    ):
+    ) -> Dict[str, List[str]]:
+    """Run the command via Slurm / PBS. Returns a map from the name of each submitted batch job to its job ids."""
     import random
     import randomname
 
     startup = ' ; '.join([e for e in [project.startup, machine.startup] if e.strip()])
     lmndirs = machine.lmndirs
+    user_cmd = run_opt.cmd
 
     ssh_client = CLISSHClient(machine.remote_conf)
+    if machine.parsed_conf.agent and run_opt.disown and run_opt.plan is None:
+        # Batch submission only needs non-interactive commands, which the agent serves over a single channel
+        ssh_client = _start_agent(machine) or ssh_client
+    plan_recorder = None
+    if run_opt.plan is not None:
+        from lmn.plan import PlanRecorder
+        ssh_client = plan_recorder = PlanRecorder(ssh_client, run_opt.plan)
 
     if 'slurm' in mode:
-        from lmn.scheduler.slurm import SlurmConfig
-
-        if machine.parsed_conf.slurm is None:
-            raise ValueError('Configuration must have an entry for "slurm" to use Slurm mode.')
-
-        # Create SlurmConfig object
-        if parsed.sconf is None:
-            scheduler_conf = machine.parsed_conf.slurm
-        else:
-            # Try to load from the slurm conf presets
-            logger.debug('parsed.sconf is specified. Loading custom preset conf.')
-            _sconf = preset.get('slurm-configs', {}).get(parsed.sconf, {})
-            if not _sconf:
-                logger.error(f'Slurm config preset: "{parsed.sconf}" cannot be found in "slurm-configs" or is empty.')
-                import sys; sys.exit(1)
-            scheduler_conf = SlurmConfig(**_sconf)
-            logger.info(f'Using Slurm preset: [{parsed.sconf}]')
-
+        scheduler_conf = get_slurm_conf(machine, parsed.sconf, preset, ssh_client=ssh_client)
         runner = SlurmRunner(ssh_client, lmndirs)
 
     elif 'pbs' in mode:
-        from lmn.scheduler.pbs import PBSConfig
-
-        if machine.parsed_conf.pbs is None:
-            raise ValueError('Configuration must have an entry for "pbs" to use PBS mode.')
-
-        # Create PBSConfig object
-        if parsed.pbsconf is None:
-            scheduler_conf = machine.parsed_conf.pbs
-        else:
-            # Try to load from the slurm conf presets
-            logger.debug('parsed.sconf is specified. Loading custom preset conf.')
-            _pconf = preset.get('pbs-configs', {}).get(parsed.pbsconf, {})
-            if not _pconf:
-                logger.error(f'PBS config preset: "{parsed.pbsconf}" cannot be found in "pbs-configs" or is empty.')
-                import sys; sys.exit(1)
-            scheduler_conf = PBSConfig(**_pconf)
-            logger.info(f'Using PBS preset: [{parsed.pbsconf}]')
-
+        scheduler_conf = get_pbs_conf(machine, parsed.pbsconf, preset, ssh_client=ssh_client)
         runner = PBSRunner(ssh_client, lmndirs)
 
     else:
-        logger.error(f'Unrecognized mode: {mode}')
-        import sys; sys.exit(1)
+        raise LMNError(f'Unrecognized mode: {mode}')
 
     # NOTE: Slurm / PBS seem to be fine with duplicated name.
     proj_name_maxlen = 15
@@ -405,10 +719,9 @@ def handler_scheduler(
     if run_opt.force:
         logger.warn("`-f / --force` option has no effect in Slurm / PBS mode")
 
-    # Specify job name
+    # Specify job name (suffixed with the run ID unless --name is given)
     name = f'{machine.user}-lmn-{project.name}'
-    if run_opt.name is not None:
-        name = f'{name}--{run_opt.name}'
+    name = f'{name}--{run_opt.name if run_opt.name is not None else run_opt.run_id}'
     scheduler_conf.job_name = name
 
     if 'sing' in mode:
@@ -472,21 +785,54 @@ def handler_scheduler(
         # Finally overwrite run_opt.cmd
         run_opt.cmd = SingularityCommand.run(run_opt.cmd, sing_conf)
 
-    timestamp = f"{time.time():.5f}".split('.')[-1]  # 5 subdigits of the timestamp
+    # NOTE: Scripts are named after the run ID, thus concurrent launches never overwrite each other's
+    run_id = run_opt.run_id
     print_conf(mode, machine, image=sing_conf.sif_file if mode in ['slurm-sing', 'sing-slurm'] else None)
 
     env = {**project.env, **machine.env}
     if parsed.sweep:
         if not run_opt.disown:
-            logger.error("You must set -d option to use sweep functionality.")
-            import sys; sys.exit(1)
+            raise LMNError("You must set -d option to use sweep functionality.")
 
         if not parsed.contain:
-            logger.error("You should set --contain option to use sweep functionality.")
-            import sys; sys.exit(1)
+            raise LMNError("You should set --contain option to use sweep functionality.")
 
         sweep_ind = parse_sweep_idx(parsed.sweep)
 
+        # Mark each sweep index as completed when the command succeeds, so that `--resume` can skip it later
+        # NOTE: rootdir is not affected by --contain, thus markers are shared across launches of the same sweep
+        from lmn.sweep import get_sweep_key, make_completion_command
+        sweep_key = get_sweep_key(user_cmd)
+        marker_dir = Path(lmndirs.rootdir) / '.sweep' / sweep_key
+        run_opt.cmd = make_completion_command(run_opt.cmd, marker_dir)
+
+        if parsed.resume:
+            sweep_ind = _filter_sweep_indices(ssh_client, machine, project, sweep_ind, marker_dir, sweep_key,
+                                              scheduler='slurm' if 'slurm' in mode else 'pbs')
+            if not sweep_ind:
+                logger.info('All sweep indices are either completed or still in the queue. Nothing to launch.')
+                return {}
+
+        if parsed.workers is not None:
+            worker_jobs = _launch_sweep_workers(runner, ssh_client, lmndirs, scheduler_conf, run_opt, sweep_ind,
+                                                num_workers=parsed.workers, startup=startup, run_id=run_id,
+                                                env=env, dry_run=parsed.dry_run)
+            for job_name, job_ids in worker_jobs.items():
+                # NOTE: The task list is recorded so that `--resume` knows which indices the live workers cover
+                _log_launch(project, machine, mode, run_id, job_name, job_ids, user_cmd, plan_recorder=plan_recorder,
+                            sweep=parsed.sweep, sweep_ind=list(sweep_ind))
+            return worker_jobs
+
+        # With the agent, the scripts and the submissions of all the indices are recorded and sent in a single round trip
+        from lmn.agent import AgentClient
+        sweep_runner, sweep_recorder = runner, plan_recorder
+        if isinstance(ssh_client, AgentClient):
+            from lmn.plan import LaunchPlan, PlanRecorder
+            sweep_recorder = PlanRecorder(ssh_client, LaunchPlan(user=machine.user, host=machine.host, project=project.name,
+                                                                 mode=mode, cmd=user_cmd))
+            sweep_runner = type(runner)(sweep_recorder, lmndirs)
+
+        jobs = {}
         _scheduler_conf = deepcopy(scheduler_conf)
         for sweep_idx in sweep_ind:
             # NOTE: This special prefix "SINGULARITYENV_" is stripped and the rest is passed to singularity container,
@@ -503,19 +849,186 @@ def handler_scheduler(
             # and that will be evaluated right before singularity launches
             env.update({'LMN_RUN_SWEEP_IDX': sweep_idx, 'RMX_RUN_SWEEP_IDX': sweep_idx})
 
-            # Add sweep_idx to the job name
-            _scheduler_conf.job_name = f'{scheduler_conf.job_name}-{timestamp}-{sweep_idx}'
+            # Add sweep_idx to the job name (that has the run ID, as --contain is set)
+            _scheduler_conf.job_name = f'{scheduler_conf.job_name}-{sweep_idx}'
             logger.info(f'Launching sweep {sweep_idx}: {_scheduler_conf.job_name}')
 
-            runner.exec(run_opt.cmd, run_opt.rel_workdir, conf=_scheduler_conf,
-                        startup=startup,
-                        timestamp=timestamp,
-                        interactive=False, num_sequence=run_opt.num_sequence,
-                        env=env, dry_run=parsed.dry_run)
+            job_ids = sweep_runner.exec(run_opt.cmd, run_opt.rel_workdir, conf=_scheduler_conf,
+                                        startup=startup,
+                                        timestamp=f'{run_id}-{sweep_idx}',
+                                        interactive=False, num_sequence=run_opt.num_sequence,
+                                        env=env, dry_run=parsed.dry_run or sweep_recorder is not None)
+            _log_launch(project, machine, mode, run_id, _scheduler_conf.job_name, job_ids, user_cmd, plan_recorder=sweep_recorder,
+                        sweep_idx=sweep_idx)
+            jobs[_scheduler_conf.job_name] = job_ids
+        if sweep_recorder is not plan_recorder:
+            return _submit_with_agent(ssh_client, sweep_recorder.plan.steps)
+        return jobs
     else:
-        runner.exec(run_opt.cmd, run_opt.rel_workdir, conf=scheduler_conf,
-                    startup=startup, timestamp=timestamp, interactive=not run_opt.disown, num_sequence=run_opt.num_sequence,
-                    env=env, dry_run=parsed.dry_run)
+        exec_kwargs = {}
+        if 'slurm' in mode and not run_opt.disown and run_opt.num_sequence == 1:
+            # Dispatch into the allocation held by `lmn alloc` if there is one
+            exec_kwargs['jobid'] = _find_allocation(ssh_client, machine, parsed.sconf)
+
+        job_ids = runner.exec(run_opt.cmd, run_opt.rel_workdir, conf=scheduler_conf,
+                              startup=startup, timestamp=run_id, interactive=not run_opt.disown, num_sequence=run_opt.num_sequence,
+                              env=env, dry_run=parsed.dry_run, **exec_kwargs)
+        _log_launch(project, machine, mode, run_id, scheduler_conf.job_name, job_ids, user_cmd, plan_recorder=plan_recorder)
+        return {scheduler_conf.job_name: job_ids}
+
+
+def _submit_with_agent(agent: AgentClient, steps: List[PlanStep]) -> Dict[str, List[str]]:
+    """Run the recorded steps (uploads and submissions) in a single round trip of the agent, and log the launches.
+
+    Returns a map from the name of each submitted batch job to its job ids.
+    """
+    from lmn.helpers import LaunchLogManager, get_timestamp
+    from lmn.runner import _read_job_ids, _wrap_submission
+    ops = []
+    for step in steps:
+        if step.op == 'put':
+            ops.append({'op': 'write_file', 'args': {'path': step.path, 'content': step.content}})
+        else:
+            cmd = _wrap_submission(step.cmd) if step.op == 'submit' else step.cmd
+            if step.directory is not None:
+                cmd = f'cd {step.directory} && {cmd}'
+            ops.append({'op': 'exec', 'args': {'cmd': cmd, 'timeout': agent.timeout}})
+    num_execs = sum(op['op'] == 'exec' for op in ops)
+    logger.debug(f'submitting {num_execs} commands through the agent')
+    results = agent.batch(ops, timeout=agent.timeout * (num_execs + 1))
+
+    jobs = {}
+    for step, result in zip(steps, results):
+        if not result['ok']:
+            logger.error(f'Failed to {step.op} {step.path if step.op == "put" else step.cmd}: {result["error"]}')
+        if step.op != 'submit' or step.log is None:
+            continue
+        job_ids = _read_job_ids(step.cmd, result['result']['stdout']) if result['ok'] else []
+        jobs[step.log['job_name']] = job_ids
+        if job_ids:
+            LaunchLogManager().log({**step.log, 'timestamp': get_timestamp(), 'job_ids': job_ids})
+    return jobs
+
+
+def _log_launch(project: Project, machine: Machine, mode: str, run_id: str, job_name: str, job_ids: List[str], cmd: str,
+                plan_recorder: Optional[PlanRecorder] = None, **extra):
+    """Record the submitted jobs in the launch log (~/.lmn/launched.jsonl).
+
+    When compiling a plan, the entry is attached to the submission instead, and `lmn apply` records it with the job ids.
+    """
+    from lmn.helpers import LaunchLogManager, get_timestamp, posixpath2str
+    entry = {
+        'timestamp': get_timestamp(),
+        'host': machine.base_uri,
+        'project': project.name,
+        'mode': mode,
+        'run_id': run_id,
+        'job_name': job_name,
+        'job_ids': job_ids,
+        'lmndirs': vars(machine.lmndirs),
+        'cmd': cmd,
+        **extra,
+    }
+    if plan_recorder is not None:
+        plan_recorder.tag_submission(posixpath2str({key: val for key, val in entry.items() if key not in ['timestamp', 'job_ids']}))
+        return
+    if not job_ids:
+        return
+    LaunchLogManager().log(entry)
+
+
+def _find_allocation(ssh_client: CLISSHClient, machine: Machine, sconf: Optional[str]) -> Optional[str]:
+    """Return the job id of the allocation held by `lmn alloc` if it is still running."""
+    from lmn.helpers import AllocationManager
+
+    alloc_manager = AllocationManager()
+    allocation = alloc_manager.get(machine.base_uri)
+    if allocation is None:
+        return None
+
+    if allocation.get('sconf') != sconf:
+        logger.info(f'Allocation {allocation["job_id"]} was created with a different Slurm config. Not using it.')
+        return None
+
+    state = ssh_client.run(f'squeue -h -j {allocation["job_id"]} -o %T 2>/dev/null', capture_output=True)
+    if state.strip() != 'RUNNING':
+        logger.info(f'Allocation {allocation["job_id"]} is no longer running. Falling back to a new allocation.')
+        alloc_manager.remove(machine.base_uri)
+        return None
+
+    logger.info(f'Reusing the allocation held by `lmn alloc`: job {allocation["job_id"]}')
+    return allocation['job_id']
+
+
+def _filter_sweep_indices(ssh_client: CLISSHClient, machine: Machine, project: Project, sweep_ind, marker_dir: Path,
+                          sweep_key: str, scheduler: Literal['slurm', 'pbs']) -> List[int]:
+    """Drop sweep indices that have a completion marker or that are still queued / running (see `get_active_sweep_indices`)."""
+    from lmn.helpers import LaunchLogManager
+    from lmn.sweep import parse_completion_markers, get_active_sweep_indices
+
+    if scheduler == 'slurm':
+        query_jobs = 'squeue -h -u $USER -o %i'
+    else:
+        query_jobs = 'qselect -u $USER'
+    separator = '--- lmn ---'
+    # Single round trip: list completion markers and ids of the active jobs
+    output = ssh_client.run(f'ls -1 {marker_dir} 2>/dev/null ; echo "{separator}" ; {query_jobs} 2>/dev/null ; true',
+                            capture_output=True)
+    markers_output, _, jobs_output = output.partition(separator)
+    completed = parse_completion_markers(markers_output)
+    active = get_active_sweep_indices(LaunchLogManager().read(), machine.base_uri, project.name, sweep_key,
+                                      [line.strip() for line in jobs_output.splitlines() if line.strip()])
+
+    sweep_ind = list(sweep_ind)
+    skip_completed = sorted(idx for idx in sweep_ind if idx in completed)
+    skip_active = sorted(idx for idx in sweep_ind if idx in active and idx not in completed)
+    if skip_completed:
+        logger.info(f'--resume: skipping {len(skip_completed)} completed indices: {skip_completed}')
+    if skip_active:
+        logger.info(f'--resume: skipping {len(skip_active)} indices that are still queued / running: {skip_active}')
+    remaining = [idx for idx in sweep_ind if idx not in completed and idx not in active]
+    logger.info(f'--resume: launching {len(remaining)} out of {len(sweep_ind)} indices')
+    return remaining
+
+
+def _launch_sweep_workers(runner, ssh_client: CLISSHClient, lmndirs, scheduler_conf, run_opt: Namespace,
+                          sweep_ind, num_workers: int, startup: str, run_id: str, env: dict,
+                          dry_run: bool = False) -> Dict[str, List[str]]:
+    """Upload the sweep indices as a task list and submit `num_workers` jobs that drain it.
+
+    Returns a map from the job name of each worker to its job ids.
+    """
+    from tempfile import NamedTemporaryFile
+    from lmn.sweep import make_task_list, make_worker_command
+
+    sweep_ind = list(sweep_ind)
+    if num_workers > len(sweep_ind):
+        logger.info(f'--workers ({num_workers}) is larger than the number of sweep indices ({len(sweep_ind)}).')
+        num_workers = len(sweep_ind)
+
+    task_fpath = Path(lmndirs.scriptdir) / f'.tasks-{run_id}.txt'
+    queue_dir = Path(lmndirs.scriptdir) / f'.queue-{run_id}'
+    with NamedTemporaryFile(mode='w+') as temp_file:
+        temp_file.write(make_task_list(sweep_ind))
+        temp_file.flush()
+        # NOTE: With dry_run, ssh_client is a PlanRecorder and it is only recorded
+        ssh_client.put(temp_file.name, task_fpath)
+    logger.info(f'Uploaded {len(sweep_ind)} tasks to {task_fpath}')
+
+    worker_cmd = make_worker_command(run_opt.cmd, task_fpath, queue_dir)
+    _scheduler_conf = deepcopy(scheduler_conf)
+    worker_jobs = {}
+    for worker_idx in range(num_workers):
+        _scheduler_conf.job_name = f'{scheduler_conf.job_name}-w{worker_idx}'
+        logger.info(f'Launching worker {worker_idx}: {_scheduler_conf.job_name}')
+        worker_jobs[_scheduler_conf.job_name] = runner.exec(
+            worker_cmd, run_opt.rel_workdir, conf=_scheduler_conf,
+            startup=startup,
+            timestamp=f'{run_id}-w{worker_idx}',
+            interactive=False, num_sequence=1,
+            env={**env, 'LMN_WORKER_IDX': worker_idx}, dry_run=dry_run
+        )
+    return worker_jobs
 
 
 name = 'run'
@@ -1,9 +1,16 @@
 from argparse import ArgumentParser, Namespace
+from pathlib import Path
+from typing import List, Optional
+from tempfile import NamedTemporaryFile
+from threading import Event
 
-from lmn import logger
+from lmn import logger, LMNError
 from lmn.cli._config_loader import Machine, Project
-from lmn.cli._utils import rsync
-from lmn.machine import CLISSHClient
+from lmn.cli._utils import rsync, tar_stream
+from lmn.config import SyncConfig
+from lmn.helpers import list_git_files
+from lmn.machine import CLISSHClient, RemoteConfig
+from lmn.plan import SyncSpec
 
 RSYNC_DESTINATION_PATH = "/tmp/".rstrip('/')
 
@@ -22,59 +29,328 @@ def _get_parser() -> ArgumentParser:
         action="store_true",
         help="Be verbose"
     )
+    parser.add_argument(
+        "--since",
+        action="store",
+        type=str,
+        default=None,
+        help="only pull the output files modified within this duration (e.g., 30m, 2h, 1d)"
+    )
     return parser
 
 
-def _sync_code(project: Project, machine: Machine, dry_run: bool = False):
+def _get_cold_sync_compressor(machine: Machine) -> Optional[str]:
+    """Return the compressor to stream a tar archive with if the remote codedir is empty, otherwise None."""
+    import shutil
+    from lmn.probe import parse_sections
+
+    lmndirs = machine.lmndirs
+    ssh_client = CLISSHClient(machine.remote_conf)
+    output = ssh_client.run(' ; '.join((
+        f'mkdir -p {lmndirs.codedir} {lmndirs.outdir} {lmndirs.mountdir} {lmndirs.scriptdir}',
+        'echo LMN_SECTION codedir', f'ls -A {lmndirs.codedir} | head -n 1',
+        'echo LMN_SECTION zstd', 'command -v zstd',
+        'true',
+    )), capture_output=True)
+    sections = parse_sections(output)
+    if sections.get('codedir'):
+        return None
+    if sections.get('zstd') and shutil.which('zstd') is not None:
+        return 'zstd'
+    return 'gzip'
+
+
+# Cache the detection for a day
+SHARED_FS_CACHE_TTL = 24 * 60 * 60
+
+
+def _get_shared_candidates(project: Project, machine: Machine) -> List[str]:
+    """Return the remote paths where the project would be found if the remote mounts the same filesystem."""
+    rootdir = project.rootdir.resolve()
+    candidates = []
+    for local_prefix, remote_prefix in machine.parsed_conf.shared_paths.items():
+        local_prefix = Path(local_prefix).expanduser()
+        if rootdir == local_prefix or local_prefix in rootdir.parents:
+            candidates.append(str(Path(remote_prefix) / rootdir.relative_to(local_prefix)))
+    candidates.append(str(rootdir))
+    return candidates
+
+
+def _detect_shared_codedir(project: Project, machine: Machine, probe: bool = True) -> Optional[str]:
+    """Return the remote path of the project if it is on a filesystem shared with the remote, otherwise None.
+
+    A marker file with a random name is created in the project, and the remote looks for it at the candidate paths.
+    A cached path is used after making sure that it still exists on the remote (e.g., the mount may have gone).
+    With `probe=False`, only the cached result is looked up.
+    """
+    import secrets
+    from lmn.cache import HostCache
+
+    cache = HostCache('shared_fs', ttl=SHARED_FS_CACHE_TTL)
+    key = f'{machine.base_uri}:{project.rootdir.resolve()}'
+    cached = cache.get(key)
+    if cached is not None:
+        codedir = cached['codedir']
+        if codedir is None:
+            return None
+        output = CLISSHClient(machine.remote_conf).run(f'test -d {codedir} && echo found ; true', capture_output=True)
+        if 'found' in output:
+            return codedir
+        logger.info(f'{codedir} is no longer found on {machine.base_uri}. Detecting the shared filesystem again.')
+        cache.remove(key)
+    if not probe:
+        return None
+
+    marker = f'.lmn-shared-{secrets.token_hex(8)}'
+    marker_path = project.rootdir / marker
+    try:
+        marker_path.write_text(marker)
+    except OSError as e:
+        logger.warning(f'Failed to detect the shared filesystem (cannot write a marker file to the project): {str(e)}')
+        return None
+    try:
+        candidates = _get_shared_candidates(project, machine)
+        ssh_client = CLISSHClient(machine.remote_conf)
+        output = ssh_client.run(' ; '.join(
+            [f'grep -qs {marker} {candidate}/{marker} && echo {candidate}' for candidate in candidates] + ['true']
+        ), capture_output=True)
+    finally:
+        try:
+            marker_path.unlink()
+        except OSError as e:
+            logger.warning(f'Failed to remove the marker file {marker_path}: {str(e)}')
+
+    found = [line.strip() for line in output.splitlines() if line.strip()]
+    codedir = found[0] if found else None
+    cache.set(key, {'codedir': codedir})
+    return codedir
+
+
+def _get_code_rsync_options(lmndirs, mkdir: bool = True, link_dest: Optional[List[str]] = None) -> List[str]:
+    rsync_options = []
+    if mkdir:
+        # A trick to create directories right before performing rsync
+        rsync_options += [f"--rsync-path='mkdir -p {lmndirs.codedir} && mkdir -p {lmndirs.outdir} && mkdir -p {lmndirs.mountdir} && mkdir -p {lmndirs.scriptdir} && rsync'"]
+    # NOTE: rsync accepts up to 20 --link-dest directories
+    rsync_options += [f"--link-dest='{path}'" for path in (link_dest or [])[:20]]
+    return rsync_options
+
+
+def _get_code_sync_spec(project: Project, machine: Machine, link_dest: Optional[List[str]] = None) -> SyncSpec:
+    """Return the sync of the project to the remote codedir for a launch plan (see `_sync_code`)."""
+    return SyncSpec(source_dir=str(project.rootdir), target_dir=str(machine.lmndirs.codedir),
+                    exclude=project.exclude or [], options=_get_code_rsync_options(machine.lmndirs, link_dest=link_dest),
+                    git=project.sync_mode == 'git')
+
+
+def _get_dataset_sync_specs(project: Project, machine: Machine) -> List[SyncSpec]:
+    """Return the syncs of `project.datasets` for a launch plan.
+
+    Unlike `_stage_datasets`, the datasets are always synced (rsync only transfers what has changed)
+    and the manifests are left as they are, since the datasets may change before the plan is applied.
+    """
+    mountdir = machine.lmndirs.mountdir
+    specs = []
+    for name, dataset in project.datasets.items():
+        path = project.rootdir / dataset.path
+        if not path.is_dir():
+            raise LMNError(f'Dataset "{name}" is not found at {path}')
+        specs.append(SyncSpec(source_dir=str(path), target_dir=f'{mountdir}/{name}', exclude=dataset.exclude,
+                              options=['--delete', f"--rsync-path='mkdir -p {mountdir}/{name} && rsync'"]))
+    return specs
+
+
+def _apply_sync_spec(spec: SyncSpec, remote_conf: RemoteConfig, sync_conf: Optional[SyncConfig] = None):
+    files_from = None
+    if spec.git:
+        fnames = list_git_files(Path(spec.source_dir))
+        if fnames is None:
+            logger.warning(f'{spec.source_dir} is not a git repository. Syncing all the files.')
+        else:
+            files_from = NamedTemporaryFile(mode='w+')
+            files_from.write('\0'.join(fnames))
+            files_from.flush()
+    try:
+        rsync(source_dir=spec.source_dir, target_dir=spec.target_dir, remote_conf=remote_conf,
+              exclude=spec.exclude, options=spec.options, transfer_rootdir=False,
+              files_from=files_from.name if files_from is not None else None, sync_conf=sync_conf)
+    finally:
+        if files_from is not None:
+            files_from.close()
+
+
+def _sync_code(project: Project, machine: Machine, dry_run: bool = False, link_dest: Optional[List[str]] = None):
+    """Sync the project to the remote codedir.
+
+    link_dest: remote directories (e.g., previous snapshots) from which unchanged files are hard-linked rather than transferred
+    """
     # rsync_options = f"--rsync-path='mkdir -p {project.remote_dir} && mkdir -p {project.remote_outdir} && mkdir -p {project.remote_mountdir} && rsync'"
 
-    # A trick to create directories right before performing rsync
     lmndirs = machine.lmndirs
-    rsync_options = [f"--rsync-path='mkdir -p {lmndirs.codedir} && mkdir -p {lmndirs.outdir} && mkdir -p {lmndirs.mountdir} && mkdir -p {lmndirs.scriptdir} && rsync'"]
+
+    # An empty codedir is filled much faster with a single tar stream than with rsync.
+    # With link_dest, rsync hard-links most of the files instead, which is even cheaper.
+    # The tar stream cannot limit the bandwidth, thus rsync is always used with `bwlimit`.
+    # NOTE: Checking the codedir also creates the lmn directories
+    check_cold = not (dry_run or link_dest or machine.parsed_conf.sync.bwlimit)
+    compressor = _get_cold_sync_compressor(machine) if check_cold else None
+
+    rsync_options = _get_code_rsync_options(lmndirs, mkdir=not check_cold, link_dest=link_dest)
+
+    files_from = None
+    if project.sync_mode == 'git':
+        fnames = list_git_files(project.rootdir)
+        if fnames is None:
+            logger.warning(f'sync_mode is "git", but {project.rootdir} is not a git repository. Syncing all the files.')
+        else:
+            logger.info(f'Syncing {len(fnames)} files listed by git')
+            files_from = NamedTemporaryFile(mode='w+')
+            files_from.write('\0'.join(fnames))
+            files_from.flush()
 
     try:
-        rsync(source_dir=project.rootdir, target_dir=lmndirs.codedir, remote_conf=machine.remote_conf,
-              exclude=project.exclude, options=rsync_options, dry_run=dry_run, transfer_rootdir=False)
+        if compressor is not None:
+            try:
+                tar_stream(source_dir=project.rootdir, target_dir=lmndirs.codedir, remote_conf=machine.remote_conf,
+                           exclude=project.exclude, files_from=files_from.name if files_from is not None else None,
+                           compressor=compressor)
+            except RuntimeError as e:
+                # The codedir was empty, thus empty it again rather than leaving partial files that look synced
+                CLISSHClient(machine.remote_conf).run(f'rm -rf {lmndirs.codedir} && mkdir -p {lmndirs.codedir} ; true')
+                raise LMNError(f'Failed to stream the files to {machine.base_uri}:{lmndirs.codedir}:\n{str(e)}')
+        else:
+            rsync(source_dir=project.rootdir, target_dir=lmndirs.codedir, remote_conf=machine.remote_conf,
+                  exclude=project.exclude, options=rsync_options, dry_run=dry_run, transfer_rootdir=False,
+                  files_from=files_from.name if files_from is not None else None,
+                  sync_conf=machine.parsed_conf.sync)
 
-        # rsync the directories to mount
-        # for mount_dir in project.mount_dirs:
-        #     rsync(source_dir=mount_dir, target_dir=lmndirs.mountdir, remote_conf=machine.remote_conf,
-        #           exclude=project.exclude, dry_run=dry_run)
     except OSError:
-        import sys
         import traceback
-        print(traceback.format_exc(0), file=sys.stderr)
-        sys.exit(1)
+        raise LMNError(traceback.format_exc(0))
+    finally:
+        if files_from is not None:
+            files_from.close()
+
+
+def _stage_datasets(project: Project, machine: Machine, dry_run: bool = False):
+    """Stage `project.datasets` to `{mountdir}/{name}` unless the remote copy matches the local manifest."""
+    from lmn.dataset import MANIFEST_DIR, get_dataset_manifest, make_manifest_check_command, parse_manifest_check
+    if not project.datasets:
+        return
+
+    mountdir = machine.lmndirs.mountdir
+    ssh_client = CLISSHClient(machine.remote_conf)
+    remote_manifests = parse_manifest_check(
+        ssh_client.run(make_manifest_check_command(mountdir, project.datasets), capture_output=True)
+    )
+    for name, dataset in project.datasets.items():
+        path = project.rootdir / dataset.path
+        if not path.is_dir():
+            raise LMNError(f'Dataset "{name}" is not found at {path}')
+        manifest = get_dataset_manifest(path, dataset.exclude)
+        if remote_manifests.get(name) == manifest:
+            logger.info(f'Dataset "{name}" is already staged')
+            continue
+
+        logger.info(f'Staging dataset "{name}"')
+        rsync(source_dir=path, target_dir=f'{mountdir}/{name}', remote_conf=machine.remote_conf,
+              options=['--delete', f"--rsync-path='mkdir -p {mountdir}/{name} && rsync'"],
+              exclude=dataset.exclude, dry_run=dry_run, transfer_rootdir=False, sync_conf=machine.parsed_conf.sync)
+        if not dry_run:
+            ssh_client.run(f'mkdir -p {mountdir}/{MANIFEST_DIR} && echo {manifest} > {mountdir}/{MANIFEST_DIR}/{name}')
+
 
+def _push_paths(project: Project, machine: Machine, paths: List[str], dry_run: bool = False):
+    """Push the given paths (relative to the project root) to the codedir; the ones missing locally are deleted on the remote."""
+    if project.sync_mode == 'git':
+        git_files = list_git_files(project.rootdir)
+        if git_files is not None:
+            git_files = set(git_files)
+            paths = [path for path in paths if path in git_files or not (project.rootdir / path).exists()]
+    if not paths:
+        return
+
+    with NamedTemporaryFile(mode='w+') as files_from:
+        files_from.write('\0'.join(paths))
+        files_from.flush()
+        rsync(source_dir=project.rootdir, target_dir=machine.lmndirs.codedir, remote_conf=machine.remote_conf,
+              options=['--delete-missing-args', '--force'], dry_run=dry_run, transfer_rootdir=False,
+              files_from=files_from.name, sync_conf=machine.parsed_conf.sync)
+
+
+def _sync_output(project: Project, machine: Machine, dry_run: bool = False, since: Optional[float] = None):
+    """Pull the output files that pass `project.output_filter` from the remote outdir.
+
+    since: only pull the files modified within this many seconds
+    """
+    from lmn.output import filter_manifest, make_manifest_command, parse_manifest
 
-def _sync_output(project: Project, machine: Machine, dry_run: bool = False):
     # Rsync remote outdir with the local outdir.
     if project.outdir:
+        files_from = None
         try:
             lmndirs = machine.lmndirs
-            # Check if there's any output file (the first line is always 'total [num-files]')
+            # List the output files (with their sizes and mtimes) in a single call and select the ones to pull
             ssh_client = CLISSHClient(machine.remote_conf)
+            entries = parse_manifest(ssh_client.run(make_manifest_command(lmndirs.outdir), capture_output=True))
+            fnames = filter_manifest(entries, project.output_filter, since=since)
 
-            result = ssh_client.run(f'ls -l {lmndirs.outdir} | grep -v "^total" | wc -l', capture_output=True)
-            num_output_files = int(result)
-
-            logger.info(f'{num_output_files} files are in the output directory')
-            if num_output_files > 0:
-                rsync(source_dir=lmndirs.outdir, target_dir=project.outdir, 
+            logger.info(f'{len(entries)} files are in the output directory ({len(fnames)} to pull)')
+            if len(fnames) > 0:
+                # NOTE: The files end up in `{project.outdir}/{outdir name}/`, same as rsync-ing the outdir itself
+                outdir = Path(lmndirs.outdir)
+                files_from = NamedTemporaryFile(mode='w+')
+                files_from.write('\0'.join(f'{outdir.name}/{fname}' for fname in fnames))
+                files_from.flush()
+                rsync(source_dir=outdir.parent, target_dir=project.outdir,
                       remote_conf=machine.remote_conf,
-                      dry_run=dry_run, to_local=True)
+                      dry_run=dry_run, to_local=True, transfer_rootdir=False,
+                      files_from=files_from.name, sync_conf=machine.parsed_conf.sync)
                 logger.info(f'The output files are copied to {str(project.outdir)}')
 
         except OSError:
             # NOTE: Only show the last stack of traceback (If I remember corectly...)
-            import sys
             import traceback
-            print(traceback.format_exc(0), file=sys.stderr)
-            sys.exit(1)
+            raise LMNError(traceback.format_exc(0))
+        finally:
+            if files_from is not None:
+                files_from.close()
     else:
         logger.warning('project.outdir is set to None. Doing nothing here.')
 
 
+def get_output_signature(machine: Machine) -> Optional[str]:
+    """Return a checksum of the (mtime, size, path) of the files in the remote outdir, which changes whenever an output file does.
+
+    This is much cheaper than running rsync just to find out that nothing has changed.
+    """
+    ssh_client = CLISSHClient(machine.remote_conf)
+    try:
+        output = ssh_client.run(f'find {machine.lmndirs.outdir} -type f -printf "%T@ %s %p\\n" 2>/dev/null | cksum',
+                                capture_output=True)
+    except RuntimeError as e:
+        logger.debug(f'Failed to get the output signature: {str(e)}')
+        return None
+    return output.strip()
+
+
+def follow_output(project: Project, machine: Machine, interval: float = 30., stop_event: Optional[Event] = None,
+                  since: Optional[float] = None, dry_run: bool = False):
+    """Pull the output files every `interval` seconds as they change, until stop_event is set (or forever)."""
+    stop_event = Event() if stop_event is None else stop_event
+    last_signature = None
+    while not stop_event.is_set():
+        signature = get_output_signature(machine)
+        if signature is not None and signature != last_signature:
+            try:
+                _sync_output(project, machine, dry_run=dry_run, since=since)
+                last_signature = signature
+            except RuntimeError as e:
+                # Transient failures (e.g., a file removed during the transfer) are retried in the next round
+                logger.warning(f'Failed to pull the output files: {str(e)}')
+        stop_event.wait(interval)
+
+
 def handler(project: Project, machine: Machine, parsed: Namespace, preset: dict):
     """Deploy the local repository and execute the command on a machine.
 
@@ -85,8 +361,12 @@ def handler(project: Project, machine: Machine, parsed: Namespace, preset: dict)
     logger.debug(f'handling command for {__file__}')
     logger.debug(f'parsed: {parsed}')
 
+    from lmn.output import parse_duration
+    since = None if parsed.since is None else parse_duration(parsed.since)
+
     _sync_code(project, machine, dry_run=parsed.dry_run)
-    _sync_output(project, machine, dry_run=parsed.dry_run)
+    _stage_datasets(project, machine, dry_run=parsed.dry_run)
+    _sync_output(project, machine, dry_run=parsed.dry_run, since=since)
 
 
 name = 'sync'
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Push local edits to a remote server as they happen, so that `lmn run --no-sync` can skip syncing."""
+
+
+from __future__ import annotations
+import shutil
+import time
+from argparse import ArgumentParser
+from argparse import Namespace
+from queue import Empty, Queue
+from threading import Thread
+from lmn import logger
+from lmn.cli.sync import _push_paths, _sync_code
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from lmn.cli._config_loader import Project, Machine
+
+
+def _get_parser() -> ArgumentParser:
+    parser = ArgumentParser()
+    parser.add_argument(
+        "machine",
+        action="store",
+        type=str,
+        help="Machine",
+    )
+    parser.add_argument(
+        "--verbose",
+        default=False,
+        action="store_true",
+        help="Be verbose"
+    )
+    parser.add_argument(
+        "--debounce",
+        action="store",
+        type=float,
+        default=.5,
+        help="push once no further change is seen for this many seconds (default: 0.5)"
+    )
+    parser.add_argument(
+        "--poll",
+        action="store",
+        nargs="?",
+        type=float,
+        const=1.,
+        default=None,
+        help="scan the project every N seconds (default: 1) rather than using inotifywait",
+    )
+    return parser
+
+
+# How often (in seconds) the watcher checks for runs waiting for it to confirm
+REQUEST_CHECK_INTERVAL = .2
+
+
+def get_watch_key(machine: Machine) -> str:
+    return f'{machine.base_uri}:{machine.lmndirs.codedir}'
+
+
+def handler(project: Project, machine: Machine, parsed: Namespace, preset: dict):
+    from lmn.helpers import establish_persistent_ssh
+    from lmn.watch import WatchState, diff_trees, drain, inotify_changes, poll_changes, scan_tree
+
+    logger.debug(f'handling command for {__file__}')
+    logger.debug(f'parsed: {parsed}')
+
+    establish_persistent_ssh(machine.remote_conf)
+    exclude = project.exclude or []
+
+    queue = Queue()
+    if parsed.poll is None and shutil.which('inotifywait') is not None:
+        logger.info('Watching the project with inotifywait')
+        watcher = Thread(target=inotify_changes, args=(project.rootdir, exclude, queue), daemon=True)
+    else:
+        interval = parsed.poll or 1.
+        logger.info(f'Watching the project by scanning it every {interval} seconds')
+        watcher = Thread(target=poll_changes, args=(project.rootdir, exclude, queue, interval), daemon=True)
+    watcher.start()
+
+    key = get_watch_key(machine)
+    state = WatchState()
+
+    # Start from the full sync so that the remote is up-to-date with whatever happened before watching
+    # NOTE: The tree is scanned before the sync, and everything changed since is pushed by the next confirmation scan
+    scanned_at = time.time()
+    state.set(key, pending=True, scanned_at=None)
+    tree = scan_tree(project.rootdir, exclude)
+    _sync_code(project, machine, dry_run=parsed.dry_run)
+    state.set(key, pending=False, scanned_at=scanned_at)
+    try:
+        while True:
+            try:
+                first = queue.get(timeout=REQUEST_CHECK_INTERVAL)
+            except Empty:
+                first = None
+            if first is not None:
+                state.set(key, pending=True)
+                paths = drain(queue, parsed.debounce, first)
+                logger.debug(f'changed: {paths}')
+                try:
+                    _push_paths(project, machine, paths, dry_run=parsed.dry_run)
+                except RuntimeError as e:
+                    # Keep watching; the paths are pushed again with the next confirmation scan
+                    logger.warning(f'Failed to push {len(paths)} paths: {str(e)}')
+                if queue.empty():
+                    state.set(key, pending=False)
+
+            # `lmn run --no-sync` is waiting: scan the project to confirm that nothing is left behind
+            # (e.g., changes within the polling interval, or events that are not read yet)
+            current = state.get(key) or {}
+            if (current.get('requested_at') or 0.) > (current.get('scanned_at') or 0.):
+                scanned_at = time.time()
+                new_tree = scan_tree(project.rootdir, exclude)
+                paths = diff_trees(tree, new_tree)
+                try:
+                    if paths:
+                        logger.debug(f'changed (confirmation scan): {paths}')
+                        _push_paths(project, machine, paths, dry_run=parsed.dry_run)
+                except RuntimeError as e:
+                    logger.warning(f'Failed to push {len(paths)} paths: {str(e)}')
+                else:
+                    tree = new_tree
+                    state.set(key, scanned_at=scanned_at)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        state.remove(key)
+
+
+name = 'watch'
+description = 'push local edits to a remote server as they happen'
+parser = _get_parser()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Python API to launch commands, as `lmn run` does.
+
+```python
+import lmn
+client = lmn.Client('tticslurm')
+jobs = client.run('python train.py', mode='slurm-sing', sweep='0-9', contain=True)
+print([job.state() for job in jobs])
+```
+"""
+from __future__ import annotations
+from copy import deepcopy
+from pathlib import Path
+from typing import Dict, List, Literal, Optional, Union
+
+from lmn import logger
+from lmn.machine import CLISSHClient
+
+
+class Job:
+    """A batch job submitted to Slurm / PBS.
+
+    `job_ids` has more than one id for a sequence of jobs (`num_sequence` > 1); the last one is the latest.
+    """
+    def __init__(self, ssh_client: CLISSHClient, name: str, job_ids: List[str],
+                 scheduler: Literal['slurm', 'pbs']) -> None:
+        self.ssh_client = ssh_client
+        self.name = name
+        self.job_ids = job_ids
+        self.scheduler = scheduler
+
+    def state(self) -> Optional[str]:
+        """Return the state of the latest job as reported by `squeue` / `qstat`, or None if it has left the queue."""
+        if not self.job_ids:
+            return None
+        job_id = self.job_ids[-1]
+        if self.scheduler == 'slurm':
+            cmd = f'squeue -h -j {job_id} -o %T 2>/dev/null ; true'
+        else:
+            cmd = f'qstat -f {job_id} 2>/dev/null | grep job_state | sed -e "s/.*= //" ; true'
+        state = self.ssh_client.run(cmd, capture_output=True).strip()
+        return state or None
+
+    def cancel(self):
+        """Cancel all the jobs (including the ones in the sequence that have not started)."""
+        if not self.job_ids:
+            return
+        cancel_cmd = 'scancel' if self.scheduler == 'slurm' else 'qdel'
+        self.ssh_client.run(f'{cancel_cmd} {" ".join(self.job_ids)}', capture_output=True)
+
+    def __repr__(self):
+        return f'<Job {self.name} ({", ".join(self.job_ids)})>'
+
+
+class Client:
+    """Launch commands on a machine (or a pool, `pool:<name>`) from Python.
+
+    The configuration is loaded once (from the project that contains `project_dir`, or the current directory),
+    and the ssh connection and the agent (`"agent": true`) are reused across `run` calls.
+    Errors are raised as `lmn.LMNError` rather than exiting.
+    """
+    def __init__(self, machine: str, dry_run: bool = False, project_dir: Optional[Union[str, Path]] = None) -> None:
+        from lmn.cli._config_loader import load_config
+        self.machine_name = machine
+        self.dry_run = dry_run
+        self.project, self.machine, self.preset = load_config(machine, project_dir=project_dir)
+        self.ssh_client = CLISSHClient(self.machine.remote_conf)
+        self._connected = False
+
+    def _connect(self):
+        if not self._connected:
+            from lmn.helpers import establish_persistent_ssh
+            establish_persistent_ssh(self.machine.remote_conf)
+            self._connected = True
+
+    def run(self, cmd: str, mode: Optional[str] = None, sweep: Optional[str] = None,
+            env: Optional[Dict[str, str]] = None, workdir: Union[str, Path] = '.',
+            disown: bool = True, contain: bool = False, sync: bool = True, **options) -> List[Job]:
+        """Run `cmd` like `lmn run`, and return the submitted batch jobs (empty unless in Slurm / PBS mode).
+
+        - workdir: the directory (relative to the project root) to run `cmd` in
+        - disown: do not wait for the command (in Slurm / PBS mode, submit batch jobs)
+        - sync: sync the code before running `cmd` (and the output files after it, unless disowned)
+        - options: any other option of `lmn run`, such as `sconf`, `workers`, `resume` or `num_sequence`
+        """
+        from argparse import Namespace
+        from lmn.cli import run as run_command
+
+        # Start from the defaults of `lmn run`
+        parsed = run_command.parser.parse_args([self.machine_name, '--', cmd])
+        unknown = [key for key in options if not hasattr(parsed, key)]
+        if unknown:
+            raise TypeError(f'Unknown options: {unknown}')
+        parsed = Namespace(**{**vars(parsed), **options, 'remote_command': cmd, 'mode': mode, 'sweep': sweep,
+                              'disown': disown, 'contain': contain, 'no_sync': not sync, 'dry_run': self.dry_run})
+        run_command._validate_options(parsed)
+        run_command._validate_mode(self.machine, mode or self.machine.parsed_conf.mode or 'ssh')
+        self._connect()
+
+        # The launch modifies the configurations (e.g., lmndirs with `contain`), thus it is given a copy
+        project, machine, preset = deepcopy(self.project), deepcopy(self.machine), deepcopy(self.preset)
+        project.env.update(env or {})
+        jobs = run_command.launch(project, machine, parsed, preset, rel_workdir=Path(workdir))
+
+        mode = mode or machine.parsed_conf.mode or 'ssh'
+        scheduler = 'slurm' if 'slurm' in mode else 'pbs'
+        logger.debug(f'launched jobs: {jobs}')
+        return [Job(self.ssh_client, name, job_ids, scheduler) for name, job_ids in jobs.items()]
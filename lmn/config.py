@@ -1,11 +1,25 @@
 from __future__ import annotations
 from pydantic import BaseModel
-from typing import Optional, List, Union
+from typing import Dict, Optional, List, Union
 
 from lmn.container import DockerContainerConfig, SingularityConfig
 from lmn.scheduler import SlurmConfig, PBSConfig
 
 
+class OutputFilterConfig(BaseModel):
+    # Glob patterns are matched against the paths relative to the output directory (`*` also matches `/`)
+    include: List[str] = []  # Only pull the files matching any of these (everything if empty)
+    exclude: List[str] = []
+    max_size: Optional[str] = None  # e.g., '500M'
+    keep_latest: Dict[str, int] = {}  # e.g., {'*.ckpt': 1}: only the latest N matching files in each directory
+
+
+class DatasetConfig(BaseModel):
+    path: str  # Local directory (relative to the project root)
+    exclude: List[str] = []
+    node_local: bool = False  # Copy it to `node_local_cache` of the machine at job start
+
+
 class ProjectConfig(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
@@ -14,6 +28,25 @@ class ProjectConfig(BaseModel):
     mount_from_host: dict = {}
     exclude: List[str] = []
     startup: Union[str, List[str]] = ''
+    output_filter: OutputFilterConfig = OutputFilterConfig()
+    datasets: Dict[str, DatasetConfig] = {}  # Staged to `{mountdir}/{name}` once per host
+    sync_mode: str = 'all'  # 'all': sync everything under the project root except `exclude`, 'git': only the files that git does not ignore
+
+
+class SyncConfig(BaseModel):
+    compress: str = 'on'  # 'on', 'off' or 'auto' (compress only if the measured throughput is below `auto_threshold`)
+    auto_threshold: float = 50.  # MB/s
+    compress_choice: Optional[str] = None  # e.g., 'zstd', 'lz4' (rsync >= 3.2.0)
+    compress_level: Optional[int] = None
+    skip_compress: List[str] = []  # File suffixes not to compress, e.g., ['pt', 'ckpt', 'npz']
+    bwlimit: Optional[str] = None  # e.g., '50m' (the initial sync to an empty codedir uses rsync rather than a tar stream then)
+    partial: bool = False  # Keep partially transferred files to resume large transfers
+    whole_file: bool = False  # Skip the delta-transfer algorithm (faster on fast links)
+
+
+class NodeLocalCacheConfig(BaseModel):
+    dir: str  # e.g., '/tmp/$USER/lmn-datasets' (evaluated on the compute node)
+    max_size: Optional[str] = None  # e.g., '200G': the least recently used datasets are evicted beyond this
 
 
 class MachineConfig(BaseModel):
@@ -24,6 +57,14 @@ class MachineConfig(BaseModel):
     mount_from_host: dict = {}  # Deprecated; Moved to container config (Docker and Singularity)
     startup: Union[str, List[str]] = ''
     mode: str = 'ssh'
+    sync: SyncConfig = SyncConfig()
+    agent: bool = False  # Submit batch jobs through the lmn agent on the host (requires python3 there)
+    node_local_cache: Optional[NodeLocalCacheConfig] = None
+
+    # Detect if the project is on a filesystem that the remote mounts as well (then it is used as the codedir without rsync)
+    # NOTE: A marker file is written to the project to detect it, and the jobs run on the live code rather than a copy
+    shared_fs: bool = False
+    shared_paths: Dict[str, str] = {}  # Local path prefix -> remote path prefix (the same path is tried otherwise)
 
     # LMN Directories
     lmndirs: Optional[OptionalLMNDirectories] = None
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Stage datasets into the remote mountdir and (optionally) into a node-local cache at job start."""
+from __future__ import annotations
+import re
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+# Datasets are staged to `{mountdir}/{name}`, and their manifests to `{mountdir}/{MANIFEST_DIR}/{name}`
+MANIFEST_DIR = '.lmn-datasets'
+
+
+def get_dataset_envvar(name: str) -> str:
+    """Return the name of the envvar that points to the dataset (e.g., `imagenet-1k` -> `LMN_DATASET_IMAGENET_1K`)."""
+    return 'LMN_DATASET_' + re.sub(r'[^A-Z0-9]', '_', name.upper())
+
+
+def get_dataset_manifest(path: Union[str, Path], exclude: Iterable[str] = ()) -> str:
+    """Return a checksum over the (path, size, mtime) of every file in the dataset.
+
+    File contents are not read, so that this stays cheap for datasets of hundreds of GBs.
+    """
+    import hashlib
+    from lmn.watch import scan_tree
+    tree = scan_tree(Path(path), exclude)
+    digest = hashlib.sha1()
+    for relpath in sorted(tree):
+        mtime_ns, size = tree[relpath]
+        digest.update(f'{relpath}\0{size}\0{mtime_ns}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def make_manifest_check_command(mountdir: Union[str, Path], names: Iterable[str]) -> str:
+    """Return a command that prints `{name} {manifest}` for each dataset (manifest is empty if it is not staged)."""
+    return ' ; '.join(f'echo {name} $(cat {mountdir}/{MANIFEST_DIR}/{name} 2>/dev/null)' for name in names)
+
+
+def parse_manifest_check(output: str) -> dict:
+    manifests = {}
+    for line in output.splitlines():
+        fields = line.split()
+        if fields:
+            manifests[fields[0]] = fields[1] if len(fields) > 1 else None
+    return manifests
+
+
+def make_node_local_command(name: str, srcdir: Union[str, Path], manifest: str, cachedir: str,
+                            max_kbytes: Optional[int] = None, fd: int = 20) -> str:
+    """Return a command that copies the dataset to the node-local cachedir (unless it is there already) and points the envvar to it.
+
+    - Concurrent jobs on the same node serialize the copy with a lock on the cachedir.
+    - Each job holds a shared lock on the datasets it uses (on fd `fd`) until it exits, and
+      the least recently used datasets that nobody holds are evicted while the cache exceeds max_kbytes.
+    """
+    cache = f'{cachedir}/{name}-{manifest[:12]}'
+    envvar = get_dataset_envvar(name)
+    lines = [
+        f'mkdir -p {cachedir} && exec 19>{cachedir}/.lmn-lock && flock 19',
+        f'if [ ! -e {cache}/.lmn-complete ]; then',
+        f'    rm -rf {cache}.tmp && mkdir -p {cache}.tmp && cp -a {srcdir}/. {cache}.tmp/ && touch {cache}.tmp/.lmn-complete && mv {cache}.tmp {cache} || rm -rf {cache}.tmp',
+        'fi',
+        f'if [ -e {cache}/.lmn-complete ]; then',
+        f'    touch {cache}/.lmn-complete && exec {fd}<{cache}/.lmn-complete && flock -s {fd}',
+        f'    _lmn_dataset={cache}',
+        'else',
+        f'    echo "[lmn] failed to copy the dataset {name} to {cachedir}, reading it from {srcdir}" >&2',
+        f'    _lmn_dataset={srcdir}',
+        'fi',
+    ]
+    if max_kbytes is not None:
+        lines += [
+            f'for _lmn_stamp in $(ls -1tr {cachedir}/*/.lmn-complete 2>/dev/null); do',
+            f'    [ $(du -sk {cachedir} | cut -f1) -le {max_kbytes} ] && break',
+            '    ( flock -n -x 9 && rm -rf $(dirname $_lmn_stamp) ) 9<$_lmn_stamp',
+            'done',
+        ]
+    lines += [
+        'flock -u 19',
+        f'export {envvar}=$_lmn_dataset SINGULARITYENV_{envvar}=$_lmn_dataset APPTAINERENV_{envvar}=$_lmn_dataset',
+    ]
+    return '\n'.join(lines)
@@ -2,7 +2,7 @@
 from __future__ import annotations
 import os
 from pathlib import Path
-from typing import Iterator
+from typing import Iterator, List, Optional, Union
 
 def is_system_root(directory: Path):
     return directory == directory.parent
@@ -91,13 +91,13 @@ def parse_config(project_root):
     return merged_conf
 
 
-def find_project_root():
+def find_project_root(directory: Optional[Union[str, Path]] = None):
     """Find a project root (which is rsync-ed with the remote server).
 
-    It first goes up in the directory tree to find ".git" or ".lmn.json5" file.
-    If not found, print warning and just use the current directory
+    It first goes up in the directory tree (from `directory`, or the current directory) to find ".git" or ".lmn.json5" file.
+    If not found, print warning and just use the directory itself
     """
-    from lmn import logger
+    from lmn import logger, LMNError
     from lmn.const import local_config_fnames
     def is_proj_root(directory: Path):
         if (directory / '.git').is_dir():
@@ -107,7 +107,7 @@ def find_project_root():
                 return True
         return False
 
-    current_dir = Path(os.getcwd()).resolve()
+    current_dir = Path(os.getcwd() if directory is None else directory).expanduser().resolve()
     if is_proj_root(current_dir):
         return current_dir
 
@@ -119,16 +119,42 @@ def find_project_root():
                    'Setting project root to current directory')
 
     if is_system_root(current_dir):
-        logger.error("project root detected is the system root '/' you never want to rsync your entire disk.")
-        exit(1)
+        raise LMNError("project root detected is the system root '/' you never want to rsync your entire disk.")
 
     if is_home_dir(current_dir):
-        logger.error("project root detected is home directory. You never want to rsync the entire home directory to a remote machine.")
-        exit(1)
+        raise LMNError("project root detected is home directory. You never want to rsync the entire home directory to a remote machine.")
 
     return current_dir
 
 
+def list_git_files(rootdir: Path) -> Optional[List[str]]:
+    """Return the files tracked by git and the untracked files that are not ignored (relative to `rootdir`).
+
+    The files in the (initialized) submodules are listed as well, rather than the submodule directories,
+    as rsync does not recurse into the directories given by `--files-from`.
+    Returns None if `rootdir` is not a git repository.
+    NOTE: Files deleted from the working tree (but still tracked) are dropped, as rsync fails on them.
+    """
+    import subprocess
+
+    def git(*args, directory=rootdir) -> Optional[List[str]]:
+        """Run git and return its NUL-separated output, or None if it fails."""
+        result = subprocess.run(['git', '-C', str(directory), *args], capture_output=True)
+        if result.returncode != 0:
+            return None
+        return [fname for fname in result.stdout.decode('utf-8').split('\0') if fname]
+
+    # NOTE: --recurse-submodules only supports the tracked files
+    fnames = git('ls-files', '--cached', '--recurse-submodules', '-z')
+    if fnames is None:
+        return None
+    fnames += git('ls-files', '--others', '--exclude-standard', '-z') or []
+    for submodule in git('submodule', 'foreach', '--quiet', '--recursive', 'printf "%s\\0" "$displaypath"') or []:
+        fnames += [f'{submodule}/{fname}'
+                   for fname in git('ls-files', '--others', '--exclude-standard', '-z', directory=rootdir / submodule) or []]
+    return [fname for fname in dict.fromkeys(fnames) if os.path.lexists(os.path.join(rootdir, fname))]
+
+
 TIMESTAMP_FORMAT = '%Y-%m-%d_%H%M%S-%f'
 from datetime import datetime
 def get_timestamp() -> str:
@@ -139,6 +165,34 @@ def read_timestamp(time_str: str) -> datetime:
     return datetime.strptime(time_str, TIMESTAMP_FORMAT)
 
 
+CROCKFORD_BASE32 = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+
+def make_run_id() -> str:
+    """Return a unique ID of a launch, in the ULID format (https://github.com/ulid/spec).
+
+    It is 26 characters of Crockford's base32: 48-bit milliseconds since the epoch followed by 80 random bits.
+    IDs sort in the order they are made (to the millisecond) and never collide across concurrent lmn processes.
+    """
+    import secrets
+    import time
+    value = (int(time.time() * 1000) << 80) | secrets.randbits(80)
+    return ''.join(CROCKFORD_BASE32[(value >> shift) & 31] for shift in range(125, -5, -5))
+
+
+def is_run_id(name: str) -> bool:
+    """Return True if `name` is a run ID made by `make_run_id` (rather than, e.g., a timestamp of older versions)."""
+    return len(name) == 26 and all(char in CROCKFORD_BASE32 for char in name)
+
+
+def read_run_id(run_id: str) -> datetime:
+    """Return the time when the run ID was made."""
+    millis = 0
+    for char in run_id[:10]:
+        millis = millis * 32 + CROCKFORD_BASE32.index(char)
+    return datetime.fromtimestamp(millis / 1000)
+
+
 def wrap_shebang(command, shell='bash'):
     return f"#!/usr/bin/env {shell}\n{command}"
 
@@ -150,7 +204,7 @@ def parse_sweep_idx(sweep_str: str):
     - format #1: 1-9 --> range(1, 9 + 1) = [1, 2, ..., 9]
     - format #2: 1,2,7 --> [1, 2, 7]
     """
-    from lmn import logger
+    from lmn import LMNError
     import re
     from typing import Pattern
     allowed_formats = """
@@ -161,8 +215,7 @@ def parse_sweep_idx(sweep_str: str):
 
     def check_pattern(string: str, pattern: Pattern):
         if not pattern.match(string):
-            logger.error(f'Invalid sweep range format. Allowed formats are:\n{allowed_formats}')
-            import sys; sys.exit(1)
+            raise LMNError(f'Invalid sweep range format. Allowed formats are:\n{allowed_formats}')
 
     if '-' in sweep_str:
         # Validate the format
@@ -170,8 +223,7 @@ def parse_sweep_idx(sweep_str: str):
         check_pattern(sweep_str, pattern)
         begin, end = [int(val) for val in sweep_str.split('-')]
         if begin >= end:
-            logger.error(f'Invalid sweep range: {begin} must be smaller than {end}')
-            import sys; sys.exit(1)
+            raise LMNError(f'Invalid sweep range: {begin} must be smaller than {end}')
         sweep_ind = range(begin, end + 1)
     elif ',' in sweep_str:
         pattern = re.compile(r'^\d+(,\d+)+$')
@@ -180,8 +232,7 @@ def parse_sweep_idx(sweep_str: str):
     elif sweep_str.isnumeric():
         sweep_ind = [int(sweep_str)]
     else:
-        logger.error(f'Invalid sweep range format. Allowed formats are:\n{allowed_formats}')
-        import sys; sys.exit(1)
+        raise LMNError(f'Invalid sweep range format. Allowed formats are:\n{allowed_formats}')
 
     return sweep_ind
 
@@ -202,6 +253,12 @@ def parse_sacct(sacct_output):
     return entries
 
 
+def parse_job_ids(submission_output: str) -> List[str]:
+    """Parse the job ids printed as `LMN_JOB_ID <job-id>` by the submission chain."""
+    import re
+    return re.findall(r'^LMN_JOB_ID (\S+)', submission_output, flags=re.MULTILINE)
+
+
 def posixpath2str(obj):
     import pathlib
     if isinstance(obj, list):
@@ -270,19 +327,94 @@ class LaunchLogManager:
         import json
         # Prepare jsonification
         entry = posixpath2str(entry)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
         with open(self.path, 'a') as f:
             f.write(json.dumps(entry) + '\n')
 
-    def read(self):
-        pass
+    def read(self) -> List[dict]:
+        import json
+        if not os.path.isfile(self.path):
+            return []
+        with open(self.path, 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+class AllocationManager:
+    """Keeps track of the Slurm allocations held by `lmn alloc` (at most one per host)."""
+    def __init__(self, path=expandvars('$HOME/.lmn/allocations.json')) -> None:
+        self.path = path
+
+    def _load(self) -> dict:
+        import json
+        if not os.path.isfile(self.path):
+            return {}
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def _save(self, allocations: dict):
+        import json
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(allocations, f, indent=2)
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return the allocation entry for `key` unless it is expired."""
+        import time
+        entry = self._load().get(key)
+        if entry is None:
+            return None
+        if entry['expires_at'] <= time.time():
+            self.remove(key)
+            return None
+        return entry
+
+    def set(self, key: str, job_id: str, ttl: int, **extra):
+        import time
+        allocations = self._load()
+        allocations[key] = {'job_id': job_id, 'expires_at': time.time() + ttl, **extra}
+        self._save(allocations)
+
+    def remove(self, key: str):
+        allocations = self._load()
+        if allocations.pop(key, None) is not None:
+            self._save(allocations)
 
 
 # TODO: Let's move this to lmn/helper/ssh.py
-from lmn.machine import RemoteConfig
+# NOTE: Only imported for type annotations, as lmn.machine imports this module
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from lmn.machine import RemoteConfig
 
 def establish_persistent_ssh(remote_conf: RemoteConfig):
     from lmn.cli._utils import run_cmd
     # TODO: Move the ControlPath to global config
     # Reference: https://unix.stackexchange.com/a/50515/556831
     options = f'-nNf -o ControlMaster=auto -o ControlPath=~/.ssh/lmn-ssh-socket-{remote_conf.host}'
-    run_cmd(f'ssh {options} {remote_conf.base_uri}', shell=True)
\ No newline at end of file
+    run_cmd(f'ssh {options} {remote_conf.base_uri}', shell=True)
+
+
+async def establish_persistent_ssh_async(remote_conf: RemoteConfig, timeout: Optional[float] = None,
+                                         connect_timeout: Optional[int] = None):
+    """Async version of `establish_persistent_ssh`.
+
+    - connect_timeout: give up connecting (including the ssh handshake) after this many seconds (`-o ConnectTimeout`)
+    """
+    import asyncio
+    # TODO: Move the ControlPath to global config
+    cmd = ['ssh', '-nNf', '-o', 'ControlMaster=auto',
+           '-o', f'ControlPath={os.path.expanduser("~")}/.ssh/lmn-ssh-socket-{remote_conf.host}']
+    if connect_timeout is not None:
+        cmd += ['-o', f'ConnectTimeout={connect_timeout}']
+    cmd += [remote_conf.base_uri]
+    # NOTE: The master process forked by `-f` keeps stdout / stderr open, thus they must not be pipes to wait on
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+    try:
+        returncode = await asyncio.wait_for(proc.wait(), timeout=timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+    if returncode != 0:
+        raise RuntimeError(f"The command {' '.join(cmd)} returned exit code {returncode}")
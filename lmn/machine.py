@@ -45,18 +45,16 @@ class CLISSHClient:
         """
         Args:
             - capture_output (bool): If True, the returned object will contain stdout/stderr, **but the process won't be interactive**
+            - dry_run (bool): Only show the command (and return an empty output)
         """
-        # TODO: remove `env`: handle that within `cmd`!
         # TODO: Support disown (if that is necessary for sweep)
         env = {} if env is None else env
 
-        # Perform shell escaping for envvars
-        # NOTE: Fabric seems to have an issue to handle envvar that contains spaces...
-        # This is the issue of using "inline_ssh_env" that essentially sets envvars by putting bunch of export KEY=VAL before running shells.
-        # The documentation clearly says developers need to handle shell escaping for non-trivial values.
-        # TEMP: shell escaping only when env contains space
-        import shlex
-        env = {key: shlex.quote(str(val)) if " " in str(val) else str(val) for key, val in env.items()}
+        # NOTE: The remote command is wrapped in single quotes, thus the values are exported in double quotes
+        # (envvars in them are evaluated on the remote) and single quotes are closed and reopened around.
+        def quote(val) -> str:
+            val = re.sub(r'(["\\`])', r'\\\1', str(val))
+            return '"' + val.replace("'", "'\\''") + '"'
 
         # NOTE:
         # -t: Force pseudo-terminal allocation.
@@ -64,11 +62,16 @@ class CLISSHClient:
         ssh_base_cmd = f'ssh {" ".join(ssh_options)} {self.remote_conf.base_uri}'
 
         remote_cmds = []
+        if env:
+            remote_cmds += ['export ' + ' '.join(f'{key}={quote(val)}' for key, val in env.items())]
         if directory is not None:
             remote_cmds += [f'cd {directory}']
         remote_cmds += [cmd]
 
         ssh_cmd = f"{ssh_base_cmd} '{' && '.join(remote_cmds)}'"
+        if dry_run:
+            logger.info(f'dry run: {ssh_cmd}')
+            return '' if capture_output else None
         result = run_cmd(ssh_cmd, get_output=capture_output)
         return result
 
@@ -81,6 +84,27 @@ class CLISSHClient:
         # Setting get_output=True has a side-effect of not showing stdout on the terminal
         run_cmd(cmd, shell=False, get_output=True)
 
+    async def run_async(self, cmd, directory="$HOME", capture_output: bool = False, timeout: Optional[float] = None,
+                        on_output=None) -> Optional[str]:
+        """Async version of `run` for non-interactive commands (no pseudo-terminal is allocated).
+
+        See `lmn.cli._utils.run_cmd_async` for timeout and on_output.
+        """
+        from lmn.cli._utils import run_cmd_async
+        # TODO: Move the ControlPath to global config
+        control_path = os.path.expanduser(f'~/.ssh/lmn-ssh-socket-{self.remote_conf.host}')
+        remote_cmd = cmd if directory is None else f'cd {directory} && {cmd}'
+        ssh_cmd = ['ssh', '-T', '-o', f'ControlPath={control_path}', self.remote_conf.base_uri, remote_cmd]
+        return await run_cmd_async(ssh_cmd, get_output=capture_output, timeout=timeout, on_output=on_output)
+
+    async def put_async(self, fpath, target_path=None, timeout: Optional[float] = None) -> None:
+        from lmn.cli._utils import run_cmd_async
+        # TODO: Move the ControlPath to global config
+        options = [f'-o ControlPath=$HOME/.ssh/lmn-ssh-socket-{self.remote_conf.host}']
+        options = [os.path.expandvars(opt) for opt in options]
+        cmd = ['scp', *options, fpath, f'{self.remote_conf.base_uri}:{target_path}']
+        await run_cmd_async(cmd, get_output=True, timeout=timeout)
+
     def port_forward(self):
         raise NotImplementedError
 
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Select which remote output files to pull, based on a manifest listed in one remote call."""
+from __future__ import annotations
+import re
+import time
+from fnmatch import fnmatch
+from pathlib import PurePosixPath
+from typing import Dict, List, Optional
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from lmn.config import OutputFilterConfig
+
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+_DURATION_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60, 'w': 7 * 24 * 60 * 60}
+
+
+def make_manifest_command(outdir: str) -> str:
+    """Return a command that prints `{mtime} {size} {relative path}` for every file under outdir."""
+    return f'find {outdir} -type f -printf "%T@ %s %P\\n" 2>/dev/null ; true'
+
+
+def parse_manifest(output: str) -> List[dict]:
+    """Parse the output of `make_manifest_command`."""
+    entries = []
+    for line in output.splitlines():
+        fields = line.rstrip('\r').split(' ', 2)
+        if len(fields) != 3:
+            continue
+        try:
+            entries.append({'mtime': float(fields[0]), 'size': int(fields[1]), 'path': fields[2]})
+        except ValueError:
+            continue
+    return entries
+
+
+def parse_size(size: str) -> int:
+    """Parse a size such as `512K`, `100M` or `2G` (powers of 1024) into bytes."""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*', str(size), flags=re.IGNORECASE)
+    if match is None:
+        raise ValueError(f'Invalid size: {size}')
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+def parse_duration(duration: str) -> float:
+    """Parse a duration such as `90`, `30m`, `2h`, `1d` or `1w` into seconds."""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*', str(duration))
+    if match is None:
+        raise ValueError(f'Invalid duration: {duration}')
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+
+def _select_latest(entries: List[dict], keep_latest: Dict[str, int]) -> List[dict]:
+    """Drop all but the latest N files matching each glob, counted per directory."""
+    dropped = set()
+    for pattern, num_keep in keep_latest.items():
+        groups = {}
+        for entry in entries:
+            if fnmatch(entry['path'], pattern):
+                groups.setdefault(str(PurePosixPath(entry['path']).parent), []).append(entry)
+        for group in groups.values():
+            group = sorted(group, key=lambda entry: entry['mtime'], reverse=True)
+            dropped.update(entry['path'] for entry in group[num_keep:])
+    return [entry for entry in entries if entry['path'] not in dropped]
+
+
+def filter_manifest(entries: List[dict], output_filter: OutputFilterConfig, since: Optional[float] = None,
+                    now: Optional[float] = None) -> List[str]:
+    """Return the paths of the files to pull.
+
+    since: only the files modified within this many seconds
+    """
+    now = time.time() if now is None else now
+    max_size = None if output_filter.max_size is None else parse_size(output_filter.max_size)
+
+    selected = []
+    for entry in entries:
+        path = entry['path']
+        if output_filter.include and not any(fnmatch(path, pattern) for pattern in output_filter.include):
+            continue
+        if any(fnmatch(path, pattern) for pattern in output_filter.exclude):
+            continue
+        if max_size is not None and entry['size'] > max_size:
+            continue
+        if since is not None and entry['mtime'] < now - since:
+            continue
+        selected.append(entry)
+
+    selected = _select_latest(selected, output_filter.keep_latest)
+    return [entry['path'] for entry in selected]
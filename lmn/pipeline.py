@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Run the stages of a launch concurrently, respecting the dependencies between them."""
+from __future__ import annotations
+import asyncio
+import inspect
+import time
+from typing import Any, Callable, Dict, Iterable
+
+from lmn import logger
+
+
+class Pipeline:
+    """A small dependency graph of stages.
+
+    A stage is a function (or a coroutine function) that receives the results of its dependencies as positional
+    arguments; an awaitable returned by a function is awaited as well. Each stage starts as soon as all of its dependencies finish; blocking functions run in threads.
+    If a stage fails, the stages that have not started are cancelled and the exception is raised from `run`.
+    """
+    def __init__(self) -> None:
+        self.stages = {}
+
+    def add(self, name: str, fn: Callable, deps: Iterable[str] = ()) -> Pipeline:
+        if name in self.stages:
+            raise ValueError(f'Stage "{name}" already exists')
+        self.stages[name] = (fn, list(deps))
+        return self
+
+    def _check(self):
+        """Raise ValueError on unknown dependencies or cycles."""
+        visiting, done = set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f'Stage "{name}" depends on itself')
+            visiting.add(name)
+            for dep in self.stages[name][1]:
+                if dep not in self.stages:
+                    raise ValueError(f'Stage "{name}" depends on an unknown stage "{dep}"')
+                visit(dep)
+            visiting.remove(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def run(self) -> Dict[str, Any]:
+        """Run all the stages and return their results."""
+        self._check()
+        return asyncio.run(self._run())
+
+    async def _run(self) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        tasks = {}
+
+        async def run_stage(name):
+            fn, deps = self.stages[name]
+            args = await asyncio.gather(*[tasks[dep] for dep in deps])
+            start = time.time()
+            if asyncio.iscoroutinefunction(fn):
+                result = await fn(*args)
+            else:
+                result = await loop.run_in_executor(None, fn, *args)
+                if inspect.isawaitable(result):
+                    # e.g., a lambda that calls a coroutine function
+                    result = await result
+            logger.debug(f'stage {name} finished in {time.time() - start:.2f} sec')
+            return result
+
+        for name in self.stages:
+            tasks[name] = asyncio.ensure_future(run_stage(name))
+        await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+
+        failed = [task for task in tasks.values() if task.done() and not task.cancelled() and task.exception() is not None]
+        if failed:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise failed[0].exception()
+        return {name: task.result() for name, task in tasks.items()}
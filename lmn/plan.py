@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Launch plans: what a launch would sync and run on the remote, compiled with `--dry-run` and executed by `lmn apply`.
+
+The config is resolved (and the remote queried, e.g., for `--resume` or `"partition": "auto"`) when the plan is compiled,
+thus applying it later only transfers the files, uploads the scripts and runs the commands.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel
+
+from lmn import logger
+from lmn.config import SyncConfig
+
+
+class SyncSpec(BaseModel):
+    """An rsync from a local directory to the remote (see `lmn.cli._utils.rsync`)."""
+    source_dir: str
+    target_dir: str
+    exclude: List[str] = []
+    options: List[str] = []
+    git: bool = False  # Only the files that git does not ignore (`sync_mode: "git"`), listed when the plan is applied
+
+
+class PlanStep(BaseModel):
+    """A remote operation.
+
+    - put: upload `content` to `path`
+    - run: run `cmd` in `directory` with the envvars `env`
+    - submit: run `cmd` in `directory` and read the job ids from its output; `log` is recorded in the launch log
+    """
+    op: Literal['put', 'run', 'submit']
+    cmd: Optional[str] = None
+    directory: Optional[str] = None
+    env: Dict[str, str] = {}
+    path: Optional[str] = None
+    content: Optional[str] = None
+    log: Optional[Dict[str, Any]] = None
+
+
+class LaunchPlan(BaseModel):
+    version: int = 1
+    run_id: Optional[str] = None  # The scripts, the --contain snapshot and the job names are named after it
+    user: str
+    host: str
+    project: str
+    mode: str
+    cmd: str
+    env: Dict[str, str] = {}  # The project / machine envvars (for reference; each step carries the envvars it runs with)
+    sync_conf: SyncConfig = SyncConfig()
+    syncs: List[SyncSpec] = []
+    steps: List[PlanStep] = []
+
+    def save(self, path):
+        Path(path).write_text(self.model_dump_json(indent=2) + '\n')
+
+    @classmethod
+    def load(cls, path) -> LaunchPlan:
+        return cls.model_validate_json(Path(path).read_text())
+
+
+class PlanRecorder:
+    """Records the operations on the remote into a plan rather than running them. Compatible with CLISSHClient.
+
+    Queries (`run` without dry_run) still run with `client`, so that the plan is compiled with the current state of the remote.
+    Commands run with dry_run are recorded, where the ones that capture the output are submissions (see `_submit_chain`).
+    """
+    def __init__(self, client, plan: LaunchPlan) -> None:
+        self.client = client
+        self.plan = plan
+        self.remote_conf = client.remote_conf
+
+    def uri(self, path):
+        return self.client.uri(path)
+
+    def run(self, cmd, directory="$HOME", env=None, capture_output: bool = False, dry_run: bool = False) -> Optional[str]:
+        if not dry_run:
+            return self.client.run(cmd, directory=directory, env=env, capture_output=capture_output)
+        logger.debug(f'plan: {cmd}')
+        self.plan.steps.append(PlanStep(op='submit' if capture_output else 'run', cmd=cmd,
+                                        directory=None if directory is None else str(directory),
+                                        env={key: str(val) for key, val in (env or {}).items()}))
+        return '' if capture_output else None
+
+    def put(self, fpath, target_path=None) -> None:
+        logger.debug(f'plan: upload {target_path}')
+        self.plan.steps.append(PlanStep(op='put', path=str(target_path), content=Path(fpath).read_text()))
+
+    def tag_submission(self, log: Dict[str, Any]):
+        """Attach the launch log entry to the earliest submission that does not have one yet."""
+        for step in self.plan.steps:
+            if step.op == 'submit' and step.log is None:
+                step.log = log
+                return
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""Probe remote hosts (GPU usage and load average) over the persistent ssh connection."""
+from __future__ import annotations
+import os
+from typing import Dict, List, Optional
+from lmn import logger
+from lmn.machine import CLISSHClient, RemoteConfig
+
+GPU_QUERY_FIELDS = ['index', 'uuid', 'name', 'memory.used', 'memory.total', 'utilization.gpu']
+GPU_QUERY = f'nvidia-smi --query-gpu={",".join(GPU_QUERY_FIELDS)} --format=csv,noheader,nounits'
+
+# Give up on a host that does not complete the ssh handshake within this many seconds
+CONNECT_TIMEOUT = 10
+
+# Added to the score of a host without GPUs in a pool with GPU hosts, so that it is picked last
+NO_GPU_PENALTY = 2.
+
+
+def make_load_probe_command() -> str:
+    """Return a command that prints GPU usage, load average and the number of CPUs, each after `LMN_SECTION <name>`."""
+    return ' ; '.join((
+        'echo LMN_SECTION gpu', f'{GPU_QUERY} 2>/dev/null',
+        'echo LMN_SECTION loadavg', 'cat /proc/loadavg',
+        'echo LMN_SECTION nproc', 'nproc',
+    ))
+
+
+def parse_sections(output: str) -> Dict[str, List[str]]:
+    """Split the output into sections delimited by `LMN_SECTION <name>` lines."""
+    sections = {}
+    lines = None
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith('LMN_SECTION '):
+            lines = sections.setdefault(line[len('LMN_SECTION '):], [])
+        elif line and lines is not None:
+            lines.append(line)
+    return sections
+
+
+def parse_gpu_query(lines: List[str]) -> List[dict]:
+    """Parse the output of `GPU_QUERY` (csv without header and units)."""
+    gpus = []
+    for line in lines:
+        values = [val.strip() for val in line.split(',')]
+        if len(values) != len(GPU_QUERY_FIELDS):
+            continue
+        index, uuid, name, mem_used, mem_total, util = values
+        try:
+            gpus.append({'index': int(index), 'uuid': uuid, 'name': name,
+                         'memory_used': int(mem_used), 'memory_total': int(mem_total), 'utilization': int(util)})
+        except ValueError:
+            # e.g., "[N/A]" or "[Not Supported]"
+            continue
+    return gpus
+
+
+def parse_load_probe(output: str) -> dict:
+    sections = parse_sections(output)
+    loadavg = float(sections['loadavg'][0].split()[0]) if sections.get('loadavg') else 0.
+    nproc = int(sections['nproc'][0]) if sections.get('nproc') else 1
+    return {'gpus': parse_gpu_query(sections.get('gpu', [])), 'loadavg': loadavg, 'nproc': nproc}
+
+
+def get_load_score(load: dict, expect_gpus: bool = False) -> float:
+    """Lower is better. Sum of the mean GPU busyness (max of memory and utilization) and the CPU load per core.
+
+    With `expect_gpus` (i.e., other hosts in the pool have GPUs), a host that reports no GPUs
+    (e.g., nvidia-smi is missing or failing) is scored worse than any host with GPUs.
+    """
+    cpu_load = min(load['loadavg'] / max(load['nproc'], 1), 1.)
+    gpus = load['gpus']
+    if not gpus:
+        return cpu_load + (NO_GPU_PENALTY if expect_gpus else 0.)
+    gpu_load = sum(max(gpu['memory_used'] / max(gpu['memory_total'], 1), gpu['utilization'] / 100) for gpu in gpus) / len(gpus)
+    return gpu_load + cpu_load
+
+
+def run_on_host(remote_conf: RemoteConfig, cmd: str, establish: bool = True) -> Optional[str]:
+    """Run `cmd` and return its output, or None if the host cannot be reached."""
+    from lmn.helpers import establish_persistent_ssh
+    try:
+        if establish:
+            establish_persistent_ssh(remote_conf)
+        return CLISSHClient(remote_conf).run(cmd, capture_output=True)
+    except RuntimeError as e:
+        logger.debug(f'Failed to run the command on {remote_conf.base_uri}: {str(e)}')
+        return None
+
+
+async def run_on_host_async(remote_conf: RemoteConfig, cmd: str, establish: bool = True,
+                            timeout: Optional[float] = 30.) -> Optional[str]:
+    """Async version of `run_on_host`. None is also returned if the host does not respond within `timeout` seconds."""
+    import asyncio
+    from lmn.helpers import establish_persistent_ssh_async
+
+    async def _run():
+        if establish:
+            await establish_persistent_ssh_async(remote_conf, connect_timeout=CONNECT_TIMEOUT)
+        return await CLISSHClient(remote_conf).run_async(cmd, capture_output=True)
+
+    try:
+        return await asyncio.wait_for(_run(), timeout=timeout)
+    except (RuntimeError, asyncio.TimeoutError) as e:
+        logger.debug(f'Failed to run the command on {remote_conf.base_uri}: {str(e) or type(e).__name__}')
+        return None
+
+
+def run_on_hosts(remote_confs: Dict[str, RemoteConfig], cmd: str, establish: bool = True,
+                 timeout: Optional[float] = 30.) -> Dict[str, Optional[str]]:
+    """Run `cmd` on the hosts concurrently (see `run_on_host_async`)."""
+    import asyncio
+
+    async def _run_all():
+        outputs = await asyncio.gather(*[run_on_host_async(remote_conf, cmd, establish, timeout)
+                                         for remote_conf in remote_confs.values()])
+        return dict(zip(remote_confs.keys(), outputs))
+
+    return asyncio.run(_run_all())
+
+
+def probe_hosts(remote_confs: Dict[str, RemoteConfig]) -> Dict[str, Optional[dict]]:
+    """Probe the load of the hosts concurrently. The load is None if the host cannot be reached."""
+    outputs = run_on_hosts(remote_confs, make_load_probe_command())
+    return {name: None if output is None else parse_load_probe(output) for name, output in outputs.items()}
+
+
+def select_least_loaded(remote_confs: Dict[str, RemoteConfig]) -> Optional[str]:
+    """Return the name of the least loaded host, or None if none of them can be reached."""
+    loads = probe_hosts(remote_confs)
+    expect_gpus = any(load is not None and load['gpus'] for load in loads.values())
+    scores = {}
+    for name, load in loads.items():
+        if load is None:
+            logger.info(f'[{name}] unreachable')
+            continue
+        scores[name] = get_load_score(load, expect_gpus=expect_gpus)
+        logger.info(f'[{name}] score: {scores[name]:.2f} (GPUs: {len(load["gpus"])}, load average: {load["loadavg"]:.2f} / {load["nproc"]} CPUs)')
+    if not scores:
+        return None
+    return min(scores, key=scores.get)
+
+
+def make_gpu_status_command() -> str:
+    """Return a command that prints GPUs, compute processes on them and the owner of each process.
+
+    The command always succeeds, also on a host without GPUs or GPU processes.
+    """
+    apps_query = 'nvidia-smi --query-compute-apps=gpu_uuid,pid,used_memory --format=csv,noheader,nounits'
+    return ' ; '.join((
+        'echo LMN_SECTION gpu', f'{GPU_QUERY} 2>/dev/null',
+        'echo LMN_SECTION apps', f'{apps_query} 2>/dev/null',
+        'echo LMN_SECTION users',
+        # NOTE: `ps -p` with an empty list fails, thus it only runs when there are processes
+        '_lmn_pids=$(nvidia-smi --query-compute-apps=pid --format=csv,noheader 2>/dev/null | paste -sd, -)',
+        '[ -n "$_lmn_pids" ] && ps -o pid=,user= -p $_lmn_pids 2>/dev/null',
+        'true',
+    ))
+
+
+def parse_gpu_status(output: str) -> List[dict]:
+    """Parse the output of `make_gpu_status_command`, and attach the processes (user and memory) to each GPU."""
+    sections = parse_sections(output)
+    gpus = parse_gpu_query(sections.get('gpu', []))
+
+    users = {}
+    for line in sections.get('users', []):
+        fields = line.split()
+        if len(fields) == 2:
+            users[fields[0]] = fields[1]
+
+    uuid2gpu = {gpu['uuid']: gpu for gpu in gpus}
+    for gpu in gpus:
+        gpu['processes'] = []
+    for line in sections.get('apps', []):
+        values = [val.strip() for val in line.split(',')]
+        if len(values) != 3 or values[0] not in uuid2gpu:
+            continue
+        uuid, pid, used_memory = values
+        uuid2gpu[uuid]['processes'].append({'pid': pid, 'user': users.get(pid, '?'), 'memory_used': used_memory})
+    return gpus
+
+
+def measure_throughput(remote_conf: RemoteConfig, nbytes: int = 16 * 1024 * 1024) -> Optional[float]:
+    """Measure the throughput (MB/s) of the link by downloading `nbytes` of random data over ssh.
+
+    The time to set up the connection is not included as long as the persistent connection is established.
+    """
+    import subprocess
+    import time
+    cmd = ['ssh', '-o', f'ControlPath={os.path.expanduser("~")}/.ssh/lmn-ssh-socket-{remote_conf.host}',
+           '-o', 'Compression=no', remote_conf.base_uri, f'head -c {nbytes} /dev/urandom']
+    start = time.time()
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    elapsed = time.time() - start
+    if result.returncode != 0 or len(result.stdout) < nbytes:
+        logger.debug(f'Failed to measure the throughput to {remote_conf.base_uri}')
+        return None
+    return nbytes / 1024 / 1024 / max(elapsed, 1e-6)
+
+
+# Tools whose presence (and version) the capability probe reports
+CAPABILITY_TOOLS = ['rsync', 'tar', 'zstd', 'python3', 'sbatch', 'qsub', 'singularity', 'apptainer', 'docker', 'nvidia-smi']
+
+# Tools that lmn itself runs on the host in each mode (`a|b` means either of them)
+REQUIRED_TOOLS = {
+    'ssh': [],
+    'docker': ['docker'],
+    'slurm': ['sbatch'],
+    'pbs': ['qsub'],
+    'slurm-sing': ['sbatch'],
+    'sing-slurm': ['sbatch'],
+    'pbs-sing': ['qsub'],
+    'sing-pbs': ['qsub'],
+}
+
+# Tools that the job runs on the compute nodes, which often lack them on the login node
+# (or only have them after `module load` in `startup`), thus their absence is not an error
+EXPECTED_TOOLS = {
+    'slurm-sing': ['singularity|apptainer'],
+    'sing-slurm': ['singularity|apptainer'],
+    'pbs-sing': ['singularity|apptainer'],
+    'sing-pbs': ['singularity|apptainer'],
+}
+
+# Cache the capabilities for six hours
+CAPABILITY_CACHE_TTL = 6 * 60 * 60
+
+
+def make_capability_probe_command(rootdir: str, create: bool = True) -> str:
+    """Return a command that reports the available tools (with versions), whether rootdir is writable and its free space.
+
+    With `create=False`, rootdir is not created, and it is writable if its nearest existing ancestor is.
+    """
+    # The nearest existing ancestor of rootdir (rootdir itself once it is created)
+    existing = f'_lmn_dir={rootdir}; while [ ! -e "$_lmn_dir" ]; do _lmn_dir=$(dirname "$_lmn_dir"); done'
+    cmds = ['echo LMN_SECTION tools']
+    cmds += [f'command -v {tool} >/dev/null 2>&1 && echo {tool} $({tool} --version 2>&1 | head -n 1)' for tool in CAPABILITY_TOOLS]
+    if create:
+        cmds += ['echo LMN_SECTION writable', f'mkdir -p {rootdir} 2>/dev/null && test -w {rootdir} && echo yes']
+    else:
+        cmds += ['echo LMN_SECTION writable', existing, 'test -d "$_lmn_dir" && test -w "$_lmn_dir" && echo yes']
+    cmds += ['echo LMN_SECTION df', existing, 'df -Pk "$_lmn_dir" 2>/dev/null | tail -n 1']
+    return ' ; '.join(cmds + ['true'])
+
+
+def parse_capability_probe(output: str) -> dict:
+    sections = parse_sections(output)
+    tools = {}
+    for line in sections.get('tools', []):
+        tool, _, version = line.partition(' ')
+        tools[tool] = version.strip()
+    free_kbytes = None
+    for line in sections.get('df', []):
+        fields = line.split()
+        if len(fields) >= 4 and fields[3].isdigit():
+            free_kbytes = int(fields[3])
+    return {'tools': tools, 'writable': bool(sections.get('writable')), 'free_kbytes': free_kbytes}
+
+
+def get_capabilities(remote_conf: RemoteConfig, rootdir: str, refresh: bool = False, create: bool = True) -> Optional[dict]:
+    """Return the capabilities of the host (cached), or None if the host cannot be reached.
+
+    With `create=False` (e.g., dry run), nothing is changed on the host (see `make_capability_probe_command`).
+    Its result is inferred from the existing ancestor of rootdir, thus it is not cached (a cached result is still used).
+    """
+    from lmn.cache import HostCache
+    cache = HostCache('capabilities', ttl=CAPABILITY_CACHE_TTL)
+    key = f'{remote_conf.base_uri}:{rootdir}'
+    capabilities = None if refresh else cache.get(key)
+    if capabilities is None:
+        output = run_on_host(remote_conf, make_capability_probe_command(rootdir, create=create), establish=False)
+        if output is None:
+            return None
+        capabilities = parse_capability_probe(output)
+        if create:
+            cache.set(key, capabilities)
+    return capabilities
+
+
+def get_missing_tools(capabilities: dict, mode: str, sync: bool = True, expected: bool = False) -> List[str]:
+    """Return the tools required for the mode (and rsync if syncing) that the host does not have.
+
+    With `expected`, return the missing tools that the job is expected to run instead (see `EXPECTED_TOOLS`).
+    """
+    if expected:
+        required = EXPECTED_TOOLS.get(mode, [])
+    else:
+        required = REQUIRED_TOOLS.get(mode, []) + (['rsync'] if sync else [])
+    return [tools for tools in required if not any(tool in capabilities['tools'] for tool in tools.split('|'))]
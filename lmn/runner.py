@@ -105,22 +105,7 @@ class DockerRunner:
 
         # NOTE: Intentionally being super verbose to make arguments explicit.
         d = docker_conf
-
-        # HACK: if docker.startup is a list, flatten it to a string
-        if isinstance(docker_conf.startup, list):
-            docker_conf.startup = ' ; '.join(docker_conf.startup)
-
-        # TEMP: When running in non-interactive mode and command fails, container disappears before we attach to its log stream,
-        # and thus we cannot observe its error message. A naive way to avoid it is to wait for a bit before command execution.
-        if not interactive:
-            if docker_conf.startup:
-                docker_conf.startup = ' ; '.join((docker_conf.startup, 'sleep 2'))
-            else:
-                docker_conf.startup = 'sleep 2'
-
-        if docker_conf.startup:
-            cmd = ' ; '.join((docker_conf.startup, cmd))
-        cmd = f'{cmd} && chmod -R a+r {str(self.lmndirs.outdir)}'
+        cmd = self._make_container_cmd(cmd, docker_conf, interactive)
 
         assert d.tty
 
@@ -206,6 +191,54 @@ class DockerRunner:
                     log_stream(stream)
 
 
+    def _make_container_cmd(self, cmd: str, docker_conf: DockerContainerConfig, interactive: bool) -> str:
+        """Return the command to run in the container (startup, `cmd` and making the outputs readable)."""
+        startup = docker_conf.startup
+        # HACK: if docker.startup is a list, flatten it to a string
+        if isinstance(startup, list):
+            startup = ' ; '.join(startup)
+
+        # TEMP: When running in non-interactive mode and command fails, container disappears before we attach to its log stream,
+        # and thus we cannot observe its error message. A naive way to avoid it is to wait for a bit before command execution.
+        if not interactive:
+            startup = ' ; '.join((startup, 'sleep 2')) if startup else 'sleep 2'
+
+        if startup:
+            cmd = ' ; '.join((startup, cmd))
+        return f'{cmd} && chmod -R a+r {str(self.lmndirs.outdir)}'
+
+    def make_cli_command(self, cmd: str, relative_workdir, docker_conf: DockerContainerConfig,
+                         kill_existing_container: bool = True, interactive: bool = True, quiet: bool = False) -> str:
+        """Return the docker CLI command (to run on the host) that is equivalent to `exec`. Used for launch plans.
+
+        NOTE: The command is run in single quotes by `CLISSHClient.run`, thus double quotes are used here.
+        """
+        import re
+
+        def quote(string) -> str:
+            return '"' + re.sub(r'(["\\$`])', r'\\\1', str(string)) + '"'
+
+        lmnenv = get_lmnenvs(cmd, self.lmndirs)
+        allenv = {**docker_conf.env, **lmnenv}
+        allenv = {key: replace_lmn_envvars(val, lmnenv) for key, val in allenv.items()}
+        cmd = self._make_container_cmd(cmd, docker_conf, interactive)
+
+        d = docker_conf
+        options = ['-it' if interactive else '-d']
+        if interactive or d.remove:
+            options += ['--rm']
+        options += [f'--name {d.name}', f'--network {d.network}', f'--ipc {d.ipc_mode}', f'--gpus {d.gpus}',
+                    f'--user {d.user_id}:{d.group_id}', f'--workdir {quote(self.lmndirs.codedir / relative_workdir)}']
+        options += [f'--mount type=bind,source={src},destination={tgt}' for src, tgt in d.mount_from_host.items()]
+        options += [f'--env {key}={quote(val)}' for key, val in allenv.items()]
+        docker_cmd = f'docker run {" ".join(options)} {d.image} /bin/bash -c {quote(cmd)}'
+        if kill_existing_container:
+            docker_cmd = f'{{ docker rm -f {d.name} >/dev/null 2>&1 ; true ; }} && {docker_cmd}'
+        if not interactive and not quiet:
+            docker_cmd = f'{docker_cmd} && docker logs -f {d.name}'
+        return docker_cmd
+
+
 class SlurmRunner:
     """Use srun/sbatch to submit the command on a remote machine.
     If your local machine has slurm (i.e., you're on slurm login-node), I guess you don't need this tool.
@@ -218,12 +251,14 @@ class SlurmRunner:
     def exec(self, cmd: str, relative_workdir, conf, env: Optional[dict] = None,
              env_from_host: List[str] = [],
              startup: Union[str, List[str]] = "", timestamp: str = "", num_sequence: int = 1,
-             interactive: bool = None, dry_run: bool = False):
+             interactive: bool = None, jobid: Optional[str] = None, dry_run: bool = False):
         """
         Args:
             - env_from_host (List[str]): Used for Singularity, inherit specified envvars from host
+            - jobid (str): Run inside of this existing allocation (held by `lmn alloc`) in interactive mode
         """
-        from lmn.scheduler.slurm import SlurmCommand
+        from lmn.scheduler.slurm import make_slurm_command, make_sbatch_chain
+        from lmn.scheduler.preemption import make_preemption_wrapper
         env = {} if env is None else env
 
         # TODO: Verify env_from_list contains valid environment variable names
@@ -233,24 +268,13 @@ class SlurmRunner:
             cmd = ' '.join(cmd)
 
         if num_sequence > 1:
-            # Use sbatch and set dependency to singleton
-            conf.dependency = 'singleton'
+            # Jobs are chained with `--dependency=afterany:<previous-job-id>`
             if interactive:
                 logger.warning(f'num_sequence is set to {num_sequence} (> 1). Force disabling interactive mode')
                 interactive = False
 
         s = conf
-        slurm_command = SlurmCommand(cpus_per_task=s.cpus_per_task,
-                                     job_name=s.job_name,
-                                     partition=s.partition,
-                                     time=s.time,
-                                     nodelist=s.nodelist,
-                                     exclude=s.exclude,
-                                     gpus=s.gpus,
-                                     constraint=s.constraint,
-                                     dependency=s.dependency,
-                                     output=s.output,
-                                     error=s.error)
+        slurm_command = make_slurm_command(s)
 
         if interactive and (s.output is not None):
             # User may expect stdout shown on the console.
@@ -282,12 +306,23 @@ class SlurmRunner:
             ]
 
         if not interactive:
-            sbatch_cmd = slurm_command.sbatch(cmd, shell=f'/usr/bin/env {s.shell}')
+            # NOTE: Only the #SBATCH lines are used, thus the command is left empty (it may span multiple lines)
+            sbatch_cmd = slurm_command.sbatch('', shell=f'/usr/bin/env {s.shell}')
             # HACK: rather than submitting with `sbatch << EOF\n ...\n EOF`,
             # I use `sbatch file-name` to avoid `$ENVVAR` to be evaluated right at the submission time
             # I want the `$ENVVAR` to be evaluated after the compute is allocated.
             slurm_options += sbatch_cmd.split('\n')[2:-2]  # Strip `sbatch << EOF`, '#!/usr/bin/env/ bash', {cmd} and `EOF`
 
+            # NOTE: SlurmCommand renders flags as `--requeue True`, thus these are added manually
+            if s.requeue:
+                slurm_options += ['#SBATCH --requeue']
+            if s.checkpoint_signal:
+                # `B:` sends the signal only to the batch shell, which forwards it to the command
+                slurm_options += [f'#SBATCH --signal=B:{s.checkpoint_signal}@{s.checkpoint_signal_secs}']
+                # Preemption and `scancel` send SIGTERM instead, which is forwarded as the checkpoint signal as well (without requeueing)
+                on_preempt = 'scontrol requeue $SLURM_JOB_ID' if s.requeue else ':'
+                cmd = make_preemption_wrapper(cmd, [s.checkpoint_signal, 'TERM'], s.checkpoint_signal, on_preempt=on_preempt)
+
         exec_str = '\n'.join((
             # NOTE: without `-S` option, `bash -i` will be considered a single command and will end up in command not found.
             # Reference: https://unix.stackexchange.com/a/657774/556831
@@ -305,10 +340,13 @@ class SlurmRunner:
             temp_file.flush()  # This is necessary!!
             self.client.put(temp_file.name, script_fpath)
 
-        if interactive:
+        if interactive and jobid is not None:
+            # The job step inherits the resources of the existing allocation
+            cmd = f'srun --jobid={jobid} --pty {s.shell} {script_fpath}'
+        elif interactive:
             cmd = slurm_command.srun(str(script_fpath), pty=s.shell)
         else:
-            cmd = '\n'.join([f'sbatch {script_fpath}'] * num_sequence)
+            return _submit_chain(self.client, make_sbatch_chain(script_fpath, num_sequence), workdir, dry_run=dry_run)
 
         try:
             self.client.run(cmd, directory=workdir, dry_run=dry_run)
@@ -317,6 +355,7 @@ class SlurmRunner:
             import traceback
             logger.debug(f'self.client.run(...) failed!!:\n{str(e)}')
             logger.debug(traceback.format_exc())
+        return []
 
 
 class PBSRunner:
@@ -328,10 +367,14 @@ class PBSRunner:
              env_from_host: List[str] = [],
              startup: Union[str, List[str]] = "", timestamp: str = "", num_sequence: int = 1,
              interactive: bool = None, dry_run: bool = False):
-        from lmn.scheduler.pbs import PBSCommand
+        from lmn.scheduler.pbs import PBSCommand, make_qsub_chain
+        from lmn.scheduler.preemption import make_preemption_wrapper
         env = {} if env is None else env
 
-        assert num_sequence == 1, 'Jobs with dependency are not supported on PBS mode yet.'
+        if num_sequence > 1 and interactive:
+            # Jobs are chained with `-W depend=afterany:<previous-job-id>`
+            logger.warning(f'num_sequence is set to {num_sequence} (> 1). Force disabling interactive mode')
+            interactive = False
 
         if isinstance(cmd, list):
             cmd = ' '.join(cmd)
@@ -361,8 +404,13 @@ class PBSRunner:
                 *[f'export APPTAINERENV_{envvar}=${envvar}' for envvar in env_from_host],
             ]
 
+        if not interactive and conf.checkpoint_signal:
+            # PBS sends SIGTERM before killing the job (on preemption or walltime)
+            cmd = make_preemption_wrapper(cmd, 'TERM', conf.checkpoint_signal)
+
         if not interactive:
-            qsub_cmd = PBSCommand.qsub(cmd, conf, interactive=False)
+            # NOTE: Only the #PBS lines are used, thus the command is left empty (it may span multiple lines)
+            qsub_cmd = PBSCommand.qsub('', conf, interactive=False)
             # HACK: rather than submitting with `sbatch << EOF\n ...\n EOF`,
             # I use `sbatch file-name` to avoid `$ENVVAR` to be evaluated right at the submission time
             # I want the `$ENVVAR` to be evaluated after the compute is allocated.
@@ -391,7 +439,7 @@ class PBSRunner:
                                   qsub_cmd=f'chmod +x {script_fpath} && qsub',  # HACK to make the script executable
                                   interactive=True)
         else:
-            cmd = '\n'.join([f'qsub {script_fpath}'] * num_sequence)
+            return _submit_chain(self.client, make_qsub_chain(script_fpath, num_sequence), workdir, dry_run=dry_run)
 
         logger.debug(f'submission command: {cmd}')
 
@@ -401,4 +449,33 @@ class PBSRunner:
             # NOTE: hide error as the exception is also raised when the command in the container returns non-zero exit value.
             import traceback
             logger.debug(f'self.client.run(...) failed!!:\n{str(e)}')
-            logger.debug(traceback.format_exc())
\ No newline at end of file
+            logger.debug(traceback.format_exc())
+        return []
+
+
+def _submit_chain(client: CLISSHClient, cmd: str, workdir, dry_run: bool = False) -> List[str]:
+    """Run the submission chain (see `make_sbatch_chain` / `make_qsub_chain`) and return the job ids."""
+    logger.debug(f'submission command: {cmd}')
+    if dry_run:
+        # NOTE: PlanRecorder records it as a submission
+        client.run(cmd, directory=workdir, capture_output=True, dry_run=True)
+        return []
+
+    output = client.run(_wrap_submission(cmd), directory=workdir, capture_output=True)
+    return _read_job_ids(cmd, output)
+
+
+def _wrap_submission(cmd: str) -> str:
+    # NOTE: Capture stderr as well and never fail here, so that the error message from sbatch / qsub can be shown
+    return f'{{ {cmd} ; }} 2>&1 || true'
+
+
+def _read_job_ids(cmd: str, output: str) -> List[str]:
+    """Return the job ids in the output of the submission chain `cmd`, reporting the submissions that failed."""
+    from lmn.helpers import parse_job_ids
+    job_ids = parse_job_ids(output)
+    if job_ids:
+        logger.info(f'Submitted job(s): {" -> ".join(job_ids)}')
+    if len(job_ids) < cmd.count('LMN_JOB_ID'):
+        logger.error(f'Failed to submit all the jobs. Submission output:\n{output}')
+    return job_ids
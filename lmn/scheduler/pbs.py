@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-from typing import List, Optional
+from typing import Dict, List, Optional
 from copy import deepcopy
 from pydantic import BaseModel
 
@@ -7,13 +7,18 @@ from pydantic import BaseModel
 class PBSConfig(BaseModel):
     job_name: str = 'default-job-name'  # To be filled
     account: str = 'SuperBERT'  # Account string
-    queue: str = 'debug'  # debug, small, medium, large, etc. (Check `qstat -q`)
+    queue: str = 'debug'  # debug, small, medium, large, etc. (Check `qstat -q`). 'auto' picks the least busy one in `queue_candidates`
+    queue_candidates: List[str] = []
     shell: str = 'bash'  # It will be fed to `/bin/{shell}` template
     filesystems: str = 'home:grand'  # Request access to /home and /grand directories
     select: int = 1  # Request 1 node
     place: str = 'free'  # scatter, pack (default): specify how to distribute allocations (I believe it only matters for multi-node allocation ?)
     walltime: str = '1:00:00'  # 1 hour for debug queue, 72 hours for preemptable queue
 
+    # Preemption
+    requeue: bool = False  # Declare the job rerunnable (`-r y`) so that PBS requeues it on preemption
+    checkpoint_signal: Optional[str] = None  # e.g., USR1: sent to the command when the job receives SIGTERM
+
     @property
     def resource_list(self):
         return [
@@ -122,7 +127,7 @@ class PBSCommand:
             # 'p': # Priority of the job.  Sets job's Priority attribute to priority. (Range: [-1024, 1023], Default: Zero)
             # P
             'q': pbs_config.queue,  # Where the job is sent upon submission.
-            # 'r':  # Declares whether the job is rerunnable. format: `-r <y|n>`
+            'r': 'y' if pbs_config.requeue else None,  # Declares whether the job is rerunnable. format: `-r <y|n>`
             # R  # Specifies whether standard output and/or standard error files are automatically removed (deleted) upon job completion.
             # 'S': pbs_config.shell,
             # u
@@ -132,3 +137,36 @@ class PBSCommand:
             # z  # Job identifier is not written to standard output.
         }
         return PBSCommand.qsub_from_dict(run_cmd, pbs_dict, qsub_cmd, interactive, convert)
+
+
+def make_qsub_chain(script_fpath, num_sequence: int = 1) -> str:
+    """Return a command that submits `script_fpath` `num_sequence` times, each depending on the previous one.
+
+    Every job id is printed as `LMN_JOB_ID <job-id>` (see `lmn.helpers.parse_job_ids`).
+    """
+    cmds = [f'jid=$(qsub {script_fpath})', 'echo "LMN_JOB_ID $jid"']
+    for _ in range(num_sequence - 1):
+        cmds += [f'jid=$(qsub -W depend=afterany:$jid {script_fpath})', 'echo "LMN_JOB_ID $jid"']
+    return ' && '.join(cmds)
+
+
+def parse_qstat_queues(qstat_output: str) -> Dict[str, dict]:
+    """Parse `qstat -Q` and return the number of queued / running jobs of each enabled and started queue.
+
+    Queue              Max   Tot Ena Str   Que   Run   Hld   Wat   Trn   Ext Type
+    ---------------- ----- ----- --- --- ----- ----- ----- ----- ----- ----- ----
+    debug                0     3 yes yes     1     2     0     0     0     0 Exec
+    """
+    queues = {}
+    lines = [line.split() for line in qstat_output.splitlines() if line.strip()]
+    header = next((line for line in lines if line and line[0] == 'Queue'), None)
+    if header is None:
+        return queues
+    for line in lines:
+        if len(line) != len(header) or line[0] in ('Queue', ) or line[0].startswith('---'):
+            continue
+        entry = dict(zip(header, line))
+        if entry.get('Ena') != 'yes' or entry.get('Str') != 'yes':
+            continue
+        queues[entry['Queue']] = {'queued': int(entry['Que']), 'running': int(entry['Run'])}
+    return queues
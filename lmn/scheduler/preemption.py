@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""Wrap a batch command so that it can checkpoint before it is preempted or killed."""
+from __future__ import annotations
+from typing import List, Union
+
+
+def make_preemption_wrapper(cmd: str, trap_signals: Union[str, List[str]], forward_signal: str, on_preempt: str = ':') -> str:
+    """Run `cmd` in the background and forward any of `trap_signals` (received by the batch script) to it as `forward_signal`.
+
+    The command is expected to handle `forward_signal` (available as $LMN_CHECKPOINT_SIGNAL) by saving a checkpoint.
+    Once the command exits after `forward_signal` itself was received (e.g., from `--signal=B:USR1` ahead of the time limit),
+    `on_preempt` runs (e.g., `scontrol requeue $SLURM_JOB_ID`). It does not run for the other signals, such as SIGTERM from
+    `scancel`, so that a cancelled job is not requeued (requeueing on preemption is left to the scheduler).
+
+    NOTE: The signal is sent to every descendant process, as `cmd` may be wrapped with `bash -c` or singularity.
+    The subshell itself ignores the signal (`trap :`), and the handler is reset to default in its children.
+    """
+    if isinstance(trap_signals, str):
+        trap_signals = [trap_signals]
+    return '\n'.join((
+        f'export LMN_CHECKPOINT_SIGNAL={forward_signal}',
+        '_lmn_preempted=0',
+        '_lmn_signal_tree() { local _lmn_pid; for _lmn_pid in $(pgrep -P $2); do _lmn_signal_tree $1 $_lmn_pid; done; kill -$1 $2 2>/dev/null; }',
+        f'_lmn_on_preempt() {{ [ "$1" = "{forward_signal}" ] && _lmn_preempted=1; echo "[lmn] received SIG$1, sending SIG{forward_signal} to the command" >&2; _lmn_signal_tree {forward_signal} $_lmn_child; }}',
+        *[f'trap "_lmn_on_preempt {sig}" {sig}' for sig in dict.fromkeys(trap_signals)],
+        f'( trap : {forward_signal}; {cmd} ) &',
+        '_lmn_child=$!',
+        # `wait` returns early when a trap is triggered, thus keep waiting until the command exits
+        'while true; do wait $_lmn_child; _lmn_status=$?; kill -0 $_lmn_child 2>/dev/null || break; done',
+        f'if [ $_lmn_preempted -eq 1 ]; then {on_preempt}; fi',
+        'exit $_lmn_status',
+    ))
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 from __future__ import annotations
+from datetime import datetime
 from pydantic import BaseModel
-from typing import Optional, Union
+from typing import Dict, List, Optional, Union
 
 # TODO: Implement SlurmCommand by myself
 from simple_slurm_command import SlurmCommand
@@ -12,7 +13,8 @@ class SlurmConfig(BaseModel):
     but that would make it harder to read.
     """
     job_name: str = 'default-job-name'  # To be filled
-    partition: str = 'cpu'
+    partition: str = 'cpu'  # 'auto' picks the one in `partition_candidates` where the job starts soonest
+    partition_candidates: List[str] = []
     constraint: Optional[str] = None
     cpus_per_task: int = 1
     time: Optional[str] = None
@@ -23,3 +25,111 @@ class SlurmConfig(BaseModel):
     exclude: Optional[str] = None
     gpus: Optional[Union[str, int]] = 1
     shell: str = 'bash'
+
+    # Preemption
+    requeue: bool = False  # `--requeue`: requeued on preemption (with PreemptMode=REQUEUE), and by lmn after checkpointing for the time limit
+    checkpoint_signal: Optional[str] = None  # e.g., USR1: sent to the command `checkpoint_signal_secs` before the time limit, and on SIGTERM (preemption / scancel)
+    checkpoint_signal_secs: int = 120
+
+
+def make_slurm_command(conf: SlurmConfig, **overrides) -> SlurmCommand:
+    """Create SlurmCommand from SlurmConfig. `overrides` take precedence over the values in `conf`."""
+    options = dict(cpus_per_task=conf.cpus_per_task,
+                   job_name=conf.job_name,
+                   partition=conf.partition,
+                   time=conf.time,
+                   nodelist=conf.nodelist,
+                   exclude=conf.exclude,
+                   gpus=conf.gpus,
+                   constraint=conf.constraint,
+                   dependency=conf.dependency,
+                   output=conf.output,
+                   error=conf.error)
+    options.update(overrides)
+    return SlurmCommand(**options)
+
+
+def parse_slurm_time(time_str: str) -> int:
+    """Convert Slurm time format into seconds.
+
+    Acceptable formats (from `man sbatch`): "minutes", "minutes:seconds", "hours:minutes:seconds",
+    "days-hours", "days-hours:minutes" and "days-hours:minutes:seconds".
+    """
+    time_str = str(time_str).strip()
+    days = 0
+    if '-' in time_str:
+        _days, time_str = time_str.split('-', 1)
+        days = int(_days)
+        # With days, the first field is always hours
+        fields = [int(e) for e in time_str.split(':')]
+        fields += [0] * (3 - len(fields))
+        hours, minutes, seconds = fields
+    else:
+        fields = [int(e) for e in time_str.split(':')]
+        if len(fields) == 1:
+            hours, (minutes, ), seconds = 0, fields, 0
+        elif len(fields) == 2:
+            hours, (minutes, seconds) = 0, fields
+        elif len(fields) == 3:
+            hours, minutes, seconds = fields
+        else:
+            raise ValueError(f'Invalid Slurm time format: {time_str}')
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def parse_salloc_jobid(salloc_output: str) -> Optional[str]:
+    """Parse the job id from `salloc` output (i.e., "salloc: Granted job allocation 12345")."""
+    import re
+    match = re.search(r'Granted job allocation (\d+)', salloc_output)
+    return match.group(1) if match else None
+
+
+def make_sbatch_chain(script_fpath, num_sequence: int = 1) -> str:
+    """Return a command that submits `script_fpath` `num_sequence` times, each depending on the previous one.
+
+    Every job id is printed as `LMN_JOB_ID <job-id>` (see `lmn.helpers.parse_job_ids`).
+    NOTE: `sbatch --parsable` prints `<job-id>[;<cluster>]`, thus the cluster name is stripped.
+    """
+    cmds = [f'jid=$(sbatch --parsable {script_fpath})', 'echo "LMN_JOB_ID ${jid%%;*}"']
+    for _ in range(num_sequence - 1):
+        cmds += [f'jid=$(sbatch --parsable --dependency=afterany:${{jid%%;*}} {script_fpath})',
+                 'echo "LMN_JOB_ID ${jid%%;*}"']
+    return ' && '.join(cmds)
+
+
+def make_test_only_command(candidates: Dict[str, SlurmConfig]) -> str:
+    """Return a command that asks Slurm when a job with each config would start (`sbatch --test-only`).
+
+    The output of each candidate follows a line `LMN_CANDIDATE <name>` (see `parse_test_only_output`).
+    The command always succeeds, as an invalid candidate is reported in the output rather than by the exit status.
+    """
+    cmds = []
+    for name, conf in candidates.items():
+        slurm_command = make_slurm_command(conf, output=None, error=None)
+        cmds += [f'echo "LMN_CANDIDATE {name}"',
+                 slurm_command.srun('--wrap=true', srun_cmd='sbatch --test-only') + ' 2>&1']
+    return ' ; '.join(cmds + ['true'])
+
+
+def parse_test_only_output(output: str) -> Dict[str, Optional[datetime]]:
+    """Parse the expected start time of each candidate.
+
+    `sbatch --test-only` prints "sbatch: Job 1234 to start at 2024-01-01T12:00:00 using 1 processors on nodes ..."
+    The start time is None when the job cannot be submitted (e.g., invalid partition).
+    """
+    import re
+    start_times = {}
+    name = None
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith('LMN_CANDIDATE '):
+            name = line[len('LMN_CANDIDATE '):]
+            start_times[name] = None
+            continue
+        match = re.search(r'to start at (\S+)', line)
+        if name is not None and match:
+            try:
+                start_times[name] = datetime.fromisoformat(match.group(1))
+            except ValueError:
+                pass
+    return start_times
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Helpers to run sweeps on job schedulers."""
+from __future__ import annotations
+from pathlib import Path
+from typing import Iterable, Set, Union
+
+
+def make_task_list(sweep_ind: Iterable[int]) -> str:
+    """Return the content of a task list file (one sweep index per line)."""
+    return '\n'.join(str(idx) for idx in sweep_ind) + '\n'
+
+
+def make_worker_command(cmd: str, task_fpath: Union[str, Path], queue_dir: Union[str, Path]) -> str:
+    """Wrap `cmd` with a loop that keeps claiming tasks from a file-based queue until it is drained.
+
+    Each worker reads the task list from top to bottom and claims a task by creating `{queue_dir}/{task}`.
+    `mkdir` is atomic (also on NFS), so exactly one worker runs each task,
+    and a worker that finishes early simply moves on to the next unclaimed task.
+
+    The task list is read through fd 3 so that `cmd` can still read from stdin.
+    """
+    # NOTE: `SINGULARITYENV_` / `APPTAINERENV_` prefixes pass the variable into the container (see handler_scheduler)
+    return '\n'.join((
+        f'mkdir -p {queue_dir}',
+        'while IFS= read -r _lmn_task <&3; do',
+        '    [ -z "$_lmn_task" ] && continue',
+        f'    mkdir {queue_dir}/$_lmn_task 2>/dev/null || continue',
+        '    export LMN_RUN_SWEEP_IDX=$_lmn_task RMX_RUN_SWEEP_IDX=$_lmn_task',
+        '    export SINGULARITYENV_LMN_RUN_SWEEP_IDX=$_lmn_task APPTAINERENV_LMN_RUN_SWEEP_IDX=$_lmn_task',
+        '    echo "[lmn] worker $LMN_WORKER_IDX claimed task $_lmn_task"',
+        f'    ( {cmd} )',
+        f'done 3< {task_fpath}',
+    ))
+
+
+def get_sweep_key(cmd: str) -> str:
+    """Return a short key that identifies a sweep by its (user) command."""
+    import hashlib
+    return hashlib.sha1(cmd.encode('utf-8')).hexdigest()[:12]
+
+
+def make_completion_command(cmd: str, marker_dir: Union[str, Path]) -> str:
+    """Wrap `cmd` so that a completion marker `{marker_dir}/$LMN_RUN_SWEEP_IDX.done` is created when it succeeds.
+
+    `$LMN_RUN_SWEEP_IDX` is evaluated on the remote, thus the same command works for the worker pool as well.
+    """
+    return f'( {cmd} ) && mkdir -p {marker_dir} && touch {marker_dir}/$LMN_RUN_SWEEP_IDX.done'
+
+
+def parse_completion_markers(ls_output: str) -> Set[int]:
+    """Parse `ls -1 {marker_dir}` and return the set of completed sweep indices."""
+    completed = set()
+    for line in ls_output.splitlines():
+        line = line.strip()
+        if line.endswith('.done') and line[:-len('.done')].isdigit():
+            completed.add(int(line[:-len('.done')]))
+    return completed
+
+
+def get_active_sweep_indices(entries: Iterable[dict], host: str, project: str, sweep_key: str,
+                             active_job_ids: Iterable[str]) -> Set[int]:
+    """Return the sweep indices covered by the jobs of the sweep that are still queued / running.
+
+    The jobs are looked up in the launch log (`LaunchLogManager`), thus only the launches from this machine are known.
+    Only the jobs of the same sweep (`get_sweep_key` of the command) count, and a live worker (`--workers`)
+    covers its whole task list, as it keeps claiming tasks until the list is drained.
+    """
+    # NOTE: PBS job ids look like 1234.server, and only the number is compared
+    active_job_ids = {str(job_id).split('.')[0] for job_id in active_job_ids}
+    active = set()
+    for entry in entries:
+        if entry.get('host') != host or entry.get('project') != project or 'cmd' not in entry:
+            continue
+        if get_sweep_key(entry['cmd']) != sweep_key:
+            continue
+        if not any(str(job_id).split('.')[0] in active_job_ids for job_id in entry.get('job_ids', [])):
+            continue
+        if 'sweep_idx' in entry:
+            active.add(int(entry['sweep_idx']))
+        active.update(int(idx) for idx in entry.get('sweep_ind', []))
+    return active
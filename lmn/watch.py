@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""Watch the local project for changes (inotify or polling) and keep track of pending pushes."""
+from __future__ import annotations
+import os
+import time
+from contextlib import contextmanager
+from fnmatch import fnmatch
+from os.path import expandvars
+from pathlib import Path
+from queue import Queue
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def is_excluded(relpath: str, exclude: Iterable[str]) -> bool:
+    """Return whether relpath (or any of its parent directories) matches one of the rsync-style exclude patterns.
+
+    A pattern with a leading `/` is anchored to the project root, otherwise it can match at any depth.
+    """
+    parts = Path(relpath).parts
+    subpaths = ['/'.join(parts[:i + 1]) for i in range(len(parts))]
+    for pattern in exclude:
+        pattern = pattern.rstrip('/')
+        if pattern.startswith('/'):
+            if any(fnmatch(subpath, pattern[1:]) for subpath in subpaths):
+                return True
+        elif any(fnmatch(subpath, pattern) or fnmatch(subpath, f'*/{pattern}') for subpath in subpaths):
+            return True
+    return False
+
+
+def scan_tree(rootdir: Path, exclude: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+    """Return {relative path: (mtime_ns, size)} of the files under rootdir that are not excluded."""
+    exclude = list(exclude)
+    tree = {}
+    for dirpath, dirnames, filenames in os.walk(rootdir):
+        reldir = os.path.relpath(dirpath, rootdir)
+        reldir = '' if reldir == '.' else reldir
+        # Prune the excluded directories rather than walking into them
+        dirnames[:] = [d for d in dirnames if not is_excluded(os.path.join(reldir, d), exclude)]
+        for fname in filenames:
+            relpath = os.path.join(reldir, fname)
+            if is_excluded(relpath, exclude):
+                continue
+            try:
+                stat = os.lstat(os.path.join(dirpath, fname))
+            except FileNotFoundError:
+                continue
+            tree[relpath] = (stat.st_mtime_ns, stat.st_size)
+    return tree
+
+
+def diff_trees(old: Dict[str, Tuple[int, int]], new: Dict[str, Tuple[int, int]]) -> List[str]:
+    """Return the paths that are added, modified or deleted between the two scans."""
+    return sorted(path for path in set(old) | set(new) if old.get(path) != new.get(path))
+
+
+def poll_changes(rootdir: Path, exclude: Iterable[str], queue: Queue, interval: float = 1.):
+    """Put the changed paths into queue, scanning the tree every `interval` seconds (forever)."""
+    tree = scan_tree(rootdir, exclude)
+    while True:
+        time.sleep(interval)
+        new_tree = scan_tree(rootdir, exclude)
+        for path in diff_trees(tree, new_tree):
+            queue.put(path)
+        tree = new_tree
+
+
+def inotify_changes(rootdir: Path, exclude: Iterable[str], queue: Queue):
+    """Put the changed paths into queue as `inotifywait` reports them (until it exits)."""
+    import subprocess
+    exclude = list(exclude)
+    cmd = ['inotifywait', '-m', '-r', '-q', '--format', '%w%f',
+           '-e', 'close_write,create,delete,moved_from,moved_to,attrib', str(rootdir)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    for line in proc.stdout:
+        relpath = os.path.relpath(line.rstrip('\n'), rootdir)
+        if relpath == '.' or is_excluded(relpath, exclude):
+            continue
+        # A directory moved into the tree does not produce events for its content
+        if os.path.isdir(os.path.join(rootdir, relpath)):
+            queue.put(relpath)
+            for path in scan_tree(Path(rootdir) / relpath, exclude):
+                queue.put(os.path.join(relpath, path))
+        else:
+            queue.put(relpath)
+
+
+def drain(queue: Queue, debounce: float, first: str) -> List[str]:
+    """Keep collecting changes (after `first`) until none arrives for `debounce` seconds."""
+    from queue import Empty
+    paths = {first}
+    while True:
+        try:
+            paths.add(queue.get(timeout=debounce))
+        except Empty:
+            return sorted(paths)
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class WatchState:
+    """Shares the state of running `lmn watch` processes with `lmn run --no-sync` (one entry per remote codedir).
+
+    - pending: the watcher has picked up changes that are not pushed yet
+    - scanned_at: every local change made before this time has been pushed (confirmed by a scan of the project)
+    - requested_at: the latest time a run asked the watcher to confirm (see `request_scan`)
+    """
+    def __init__(self, path=expandvars('$HOME/.lmn/watch.json')) -> None:
+        self.path = path
+
+    @contextmanager
+    def _lock(self):
+        """Serialize read-modify-write of the file across processes (watchers and `lmn run`)."""
+        import fcntl
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f'{self.path}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self) -> dict:
+        import json
+        if not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    def _save(self, states: dict):
+        import json
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Write atomically so that readers without the lock never see a partial file
+        tmp_path = f'{self.path}.{os.getpid()}'
+        with open(tmp_path, 'w') as f:
+            json.dump(states, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return the state for `key` unless its watcher is no longer running."""
+        state = self._load().get(key)
+        if state is None or not _is_alive(state['pid']):
+            return None
+        return state
+
+    def set(self, key: str, **fields):
+        """Update the state of the watcher (the current process) for `key`, e.g., `pending` and `scanned_at`."""
+        with self._lock():
+            states = self._load()
+            state = states.get(key, {})
+            if state.get('pid') != os.getpid():
+                # Left by a watcher that has exited
+                state = {}
+            states[key] = {**state, **fields, 'pid': os.getpid(), 'updated_at': time.time()}
+            self._save(states)
+
+    def remove(self, key: str):
+        with self._lock():
+            states = self._load()
+            if states.pop(key, None) is not None:
+                self._save(states)
+
+    def request_scan(self, key: str) -> float:
+        """Ask the watcher for `key` to scan the project and push whatever changed. Returns the time of the request."""
+        requested_at = time.time()
+        with self._lock():
+            states = self._load()
+            if key in states:
+                states[key]['requested_at'] = max(states[key].get('requested_at') or 0., requested_at)
+                self._save(states)
+        return requested_at
+
+    def wait(self, key: str, since: float, timeout: float = 60., interval: float = .2) -> bool:
+        """Wait until the watcher for `key` (if any) has pushed every change made before `since`. Returns False on timeout.
+
+        Changes that the watcher has not picked up yet (e.g., made within its polling interval) are covered
+        as well, as it only confirms after a scan that started after `since` (see `request_scan`).
+        """
+        deadline = time.time() + timeout
+        while True:
+            state = self.get(key)
+            if state is None or (state.get('scanned_at') or 0.) >= since:
+                return True
+            if time.time() > deadline:
+                return False
+            time.sleep(interval)
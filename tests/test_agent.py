@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+from lmn.agent import AgentClient, AgentError, get_agent_path
+
+
+class LocalAgentClient(AgentClient):
+    """Runs the agent locally, with `home` as $HOME, rather than over ssh"""
+    def __init__(self, home, login_output='', **kwargs) -> None:
+        super().__init__(SimpleNamespace(host='localhost', base_uri='takuma@localhost'), **kwargs)
+        self.home = home
+        self.login_output = login_output
+
+    def _ssh_cmd(self, remote_cmd):
+        if self.login_output:
+            # e.g., printed by the rc files of the remote shell
+            remote_cmd = f'echo {self.login_output} ; {remote_cmd}'
+        return ['bash', '-c', f'cd {self.home} && {remote_cmd}']
+
+
+class TestAgent(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.home = Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_upload_once(self):
+        with LocalAgentClient(self.home) as agent:
+            self.assertEqual(1, agent.call('ping')['version'])
+        self.assertTrue((self.home / get_agent_path()).is_file())
+        with LocalAgentClient(self.home) as agent:
+            self.assertEqual(1, agent.call('ping')['version'])
+
+    def test_batch(self):
+        with LocalAgentClient(self.home) as agent:
+            outdir = str(self.home / 'lmn' / 'output')
+            results = agent.batch([
+                {'op': 'write_file', 'args': {'path': f'{outdir}/a.txt', 'content': 'hello'}},
+                {'op': 'exec', 'args': {'cmd': f'cat {outdir}/a.txt'}},
+            ])
+            self.assertTrue(all(result['ok'] for result in results))
+            self.assertEqual('hello', results[1]['result']['stdout'])
+
+    def test_errors(self):
+        with LocalAgentClient(self.home) as agent:
+            results = agent.batch([
+                {'op': 'write_file', 'args': {'path': '/proc/lmn/a.txt', 'content': ''}},
+                {'op': 'ping'},
+            ])
+            self.assertFalse(results[0]['ok'])
+            self.assertEqual('Skipped', results[1]['type'])
+            with self.assertRaises(AgentError):
+                agent.call('unknown')
+
+    def test_ssh_client_interface(self):
+        with LocalAgentClient(self.home) as agent:
+            batch = agent.batch
+            with mock.patch.object(agent, 'batch', side_effect=batch) as mock_batch:
+                with tempfile.NamedTemporaryFile(mode='w+') as f:
+                    f.write('echo $((1 + 2))')
+                    f.flush()
+                    agent.put(f.name, self.home / 'script.sh')
+                # The upload is sent along with the command
+                self.assertEqual('3', agent.run('bash script.sh', directory=self.home, capture_output=True))
+                self.assertEqual(1, mock_batch.call_count)
+                self.assertEqual('', agent.run('exit 3', capture_output=True, dry_run=True))
+                self.assertEqual(1, mock_batch.call_count)
+            with self.assertRaises(RuntimeError):
+                agent.run('exit 3')
+
+    def test_unexpected_output(self):
+        with LocalAgentClient(self.home).start():
+            pass
+        with self.assertRaises(AgentError):
+            LocalAgentClient(self.home, login_output='Welcome').start()
+
+    def test_timeout(self):
+        with LocalAgentClient(self.home, timeout=0.5) as agent:
+            with self.assertRaises(AgentError) as e:
+                agent.batch([{'op': 'exec', 'args': {'cmd': 'sleep 5'}}])
+            self.assertEqual('TimeoutError', e.exception.type)
+            self.assertIsNotNone(agent.proc.poll())
+
+    def test_sweep_submission(self):
+        """The scripts and the submissions of a sweep are sent in a single round trip"""
+        from lmn.cli.run import _submit_with_agent
+        from lmn.plan import LaunchPlan, PlanRecorder
+        from lmn.runner import SlurmRunner
+        from lmn.scheduler import SlurmConfig
+        bindir = self.home / 'bin'
+        bindir.mkdir()
+        # Prints the next job id if the script exists
+        (bindir / 'sbatch').write_text('#!/bin/bash\n[ -f "${@: -1}" ] || exit 1\n'
+                                       f'jid=$(( $(cat {self.home}/jid 2>/dev/null || echo 0) + 1 ))\n'
+                                       f'echo $jid > {self.home}/jid\necho $jid\n')
+        (bindir / 'sbatch').chmod(0o755)
+        lmndirs = SimpleNamespace(codedir=self.home, mountdir=self.home, outdir=self.home, scriptdir=self.home / 'script')
+
+        with mock.patch.dict(os.environ, {'PATH': f'{bindir}:{os.environ["PATH"]}'}), \
+                LocalAgentClient(self.home) as agent, \
+                mock.patch('lmn.helpers.LaunchLogManager') as log_manager:
+            recorder = PlanRecorder(agent, LaunchPlan(user='me', host='elm', project='proj', mode='slurm', cmd='train'))
+            runner = SlurmRunner(recorder, lmndirs)
+            for sweep_idx in range(3):
+                runner.exec('train', '.', conf=SlurmConfig(), timestamp=str(sweep_idx), interactive=False,
+                            num_sequence=2, dry_run=True)
+                recorder.tag_submission({'job_name': f'job-{sweep_idx}'})
+
+            batch = agent.batch
+            with mock.patch.object(agent, 'batch', side_effect=batch) as mock_batch:
+                jobs = _submit_with_agent(agent, recorder.plan.steps)
+            self.assertEqual(1, mock_batch.call_count)
+        self.assertDictEqual({'job-0': ['1', '2'], 'job-1': ['3', '4'], 'job-2': ['5', '6']}, jobs)
+        self.assertEqual(3, log_manager.return_value.log.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+import asyncio
+import time
+import unittest
+from lmn.cli._utils import run_cmd_async
+
+
+class TestRunCmdAsync(unittest.TestCase):
+    def test_output(self):
+        self.assertEqual('hello', asyncio.run(run_cmd_async('echo hello', get_output=True)))
+        self.assertEqual('a b', asyncio.run(run_cmd_async(['echo', 'a', 'b'], get_output=True)))
+
+    def test_error(self):
+        with self.assertRaises(RuntimeError):
+            asyncio.run(run_cmd_async('echo oops >&2; exit 3', get_output=True))
+        self.assertEqual('', asyncio.run(run_cmd_async('exit 3', get_output=True, ignore_error=True)))
+
+    def test_streaming(self):
+        lines = []
+        asyncio.run(run_cmd_async('echo 1; echo 2', on_output=lines.append))
+        self.assertListEqual(['1', '2'], lines)
+
+    def test_concurrent_with_timeout(self):
+        async def main():
+            start = time.time()
+            outputs = await asyncio.gather(*[run_cmd_async(f'sleep 0.3; echo {i}', get_output=True) for i in range(4)])
+            elapsed = time.time() - start
+            with self.assertRaises(asyncio.TimeoutError):
+                await run_cmd_async('sleep 10', timeout=0.1)
+            return outputs, elapsed
+
+        outputs, elapsed = asyncio.run(main())
+        self.assertListEqual(['0', '1', '2', '3'], outputs)
+        self.assertLess(elapsed, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
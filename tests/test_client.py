@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+import lmn
+from lmn import LMNError
+
+
+class FakeSSHClient:
+    def __init__(self, output=''):
+        self.output = output
+        self.cmds = []
+
+    def run(self, cmd, capture_output=False, **kwargs):
+        self.cmds.append(cmd)
+        return self.output
+
+    async def run_async(self, cmd, capture_output=False, **kwargs):
+        return self.run(cmd, capture_output=capture_output, **kwargs)
+
+
+class TestJob(unittest.TestCase):
+    def test_state(self):
+        job = lmn.Job(FakeSSHClient('RUNNING\r\n'), 'job', ['12', '13'], scheduler='slurm')
+        self.assertEqual('RUNNING', job.state())
+        self.assertIn('squeue -h -j 13', job.ssh_client.cmds[0])
+
+        job = lmn.Job(FakeSSHClient(''), 'job', ['12.pbs'], scheduler='pbs')
+        self.assertIsNone(job.state())
+        self.assertIn('qstat -f 12.pbs', job.ssh_client.cmds[0])
+
+    def test_cancel(self):
+        job = lmn.Job(FakeSSHClient(), 'job', ['12', '13'], scheduler='slurm')
+        job.cancel()
+        self.assertListEqual(['scancel 12 13'], job.ssh_client.cmds)
+
+        job = lmn.Job(FakeSSHClient(), 'job', [], scheduler='pbs')
+        job.cancel()
+        self.assertListEqual([], job.ssh_client.cmds)
+
+
+class TestClient(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        rootdir = Path(self.tmpdir.name)
+        (rootdir / '.lmn.json5').write_text('{"project": {"name": "proj"}, "machines": {'
+                                            '"elm": {"user": "me", "host": "elm.example.com"}, '
+                                            '"oak": {"user": "me", "host": "oak.example.com", "mode": "docker", '
+                                            '"docker": {"image": "ubuntu:22.04"}}}}')
+        os.chdir(rootdir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def test_unknown_machine(self):
+        with self.assertRaises(LMNError):
+            lmn.Client('birch')
+
+    def test_invalid_options(self):
+        client = lmn.Client('elm')
+        self.assertEqual('me@elm.example.com', client.machine.base_uri)
+        # Options are validated before connecting to the machine
+        with self.assertRaises(LMNError):
+            client.run('python train.py', sweep='9-3')
+        with self.assertRaises(LMNError):
+            client.run('python train.py', resume=True)
+        with self.assertRaises(TypeError):
+            client.run('python train.py', no_such_option=True)
+        # The mode must be available on the machine
+        with self.assertRaises(LMNError):
+            client.run('python train.py', mode='slurm-sing')
+        with self.assertRaises(LMNError):
+            client.run('python train.py', mode='k8s')
+        self.assertFalse(client._connected)
+
+    def test_project_dir(self):
+        rootdir = os.getcwd()
+        os.chdir(self.cwd)
+        client = lmn.Client('elm', project_dir=Path(rootdir) / 'src')
+        self.assertEqual('proj', client.project.name)
+        self.assertEqual(Path(rootdir).resolve(), client.project.rootdir)
+
+        # Never falls back to the home directory (nor exits the process)
+        with self.assertRaises(LMNError):
+            lmn.Client('elm', project_dir=Path.home())
+
+    def test_image_check(self):
+        ssh_client = FakeSSHClient()
+        client = lmn.Client('oak')
+        with mock.patch('lmn.helpers.establish_persistent_ssh'), \
+                mock.patch('lmn.cli.run.CLISSHClient', return_value=ssh_client), \
+                mock.patch('lmn.cli.run._prepare'), mock.patch('lmn.cli.run._sync'), \
+                mock.patch('lmn.cli.run._run', return_value={}):
+            client.run('python train.py', disown=True)
+        self.assertTrue(any('docker image inspect ubuntu:22.04' in cmd for cmd in ssh_client.cmds))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from lmn.dataset import (get_dataset_envvar, get_dataset_manifest, make_manifest_check_command,
+                         make_node_local_command, parse_manifest_check)
+
+
+class TestDataset(unittest.TestCase):
+    def test_envvar(self):
+        self.assertEqual('LMN_DATASET_IMAGENET_1K', get_dataset_envvar('imagenet-1k'))
+
+    def test_manifest(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            rootdir = Path(tmpdir)
+            (rootdir / 'train.npy').write_bytes(b'0' * 10)
+            manifest = get_dataset_manifest(rootdir)
+            self.assertEqual(manifest, get_dataset_manifest(rootdir))
+            (rootdir / 'val.npy').write_bytes(b'0' * 10)
+            self.assertNotEqual(manifest, get_dataset_manifest(rootdir))
+
+    def test_manifest_check(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            (Path(tmpdir) / '.lmn-datasets').mkdir()
+            (Path(tmpdir) / '.lmn-datasets' / 'mnist').write_text('abc\n')
+            output = subprocess.run(['bash', '-c', make_manifest_check_command(tmpdir, ['mnist', 'cifar'])],
+                                    check=True, capture_output=True, text=True).stdout
+            self.assertDictEqual({'mnist': 'abc', 'cifar': None}, parse_manifest_check(output))
+
+    def test_node_local_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            cachedir = tmpdir / 'cache'
+            for name in ['a', 'b']:
+                (tmpdir / 'mount' / name).mkdir(parents=True)
+                (tmpdir / 'mount' / name / 'data.bin').write_bytes(b'0' * 64 * 1024)
+
+            def run(name, max_kbytes=None):
+                cmd = make_node_local_command(name, tmpdir / 'mount' / name, f'{name}' * 12, str(cachedir), max_kbytes=max_kbytes)
+                return subprocess.run(['bash', '-c', f'{cmd}\necho $LMN_DATASET_{name.upper()}'],
+                                      check=True, capture_output=True, text=True).stdout.strip()
+
+            cache_a = run('a')
+            self.assertTrue((Path(cache_a) / 'data.bin').is_file())
+            self.assertEqual(cache_a, run('a'))
+
+            # Exceeding the size, the least recently used dataset (a) is evicted
+            cache_b = run('b', max_kbytes=100)
+            self.assertFalse(Path(cache_a).exists())
+            self.assertTrue((Path(cache_b) / 'data.bin').is_file())
+
+            # ...unless a running job holds it
+            holder = subprocess.Popen(['flock', '-s', str(Path(cache_b) / '.lmn-complete'), 'sleep', '5'])
+            try:
+                import time; time.sleep(.2)
+                run('a', max_kbytes=100)
+                self.assertTrue(Path(cache_b).exists())
+            finally:
+                holder.kill()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+import time
+import unittest
+from lmn.cli.gc import parse_du, get_snapshot_status, get_snapshot_time
+
+
+class TestGC(unittest.TestCase):
+    def test_parse_du(self):
+        lines = ['1024\t/scratch/takuma/lmn/proj', '12\t/scratch/takuma/lmn/proj--abc', 'du: cannot read']
+        self.assertDictEqual({'/scratch/takuma/lmn/proj': 1024, '/scratch/takuma/lmn/proj--abc': 12}, parse_du(lines))
+
+    def test_snapshot_status(self):
+        entries = [
+            {'host': 'tticslurm', 'mode': 'slurm', 'job_ids': ['123'], 'lmndirs': {'codedir': '/lmn/proj--a/code'}},
+            {'host': 'tticslurm', 'mode': 'slurm-sing', 'job_ids': ['124'], 'lmndirs': {'codedir': '/lmn/proj--b/code'}},
+            # A sweep: finished only when all of its jobs are
+            {'host': 'tticslurm', 'mode': 'slurm', 'job_ids': ['125'], 'lmndirs': {'codedir': '/lmn/proj--c/code'}},
+            {'host': 'tticslurm', 'mode': 'slurm', 'job_ids': ['126'], 'lmndirs': {'codedir': '/lmn/proj--c/code'}},
+            {'host': 'polaris', 'mode': 'pbs', 'job_ids': ['555.polaris-pbs-01'], 'lmndirs': {'codedir': '/lmn/proj--d/code'}},
+            {'host': 'tticslurm', 'cmd': 'entry logged by an older version'},
+        ]
+        self.assertDictEqual({'/lmn/proj--a': 'active', '/lmn/proj--b': 'finished', '/lmn/proj--c': 'active'},
+                             get_snapshot_status(entries, 'tticslurm', {'slurm': {'123', '126', '999'}, 'pbs': None}))
+        self.assertDictEqual({'/lmn/proj--d': 'active'},
+                             get_snapshot_status(entries, 'polaris', {'slurm': None, 'pbs': {'555.polaris-pbs-01.host'}}))
+        # The queue cannot be queried
+        self.assertDictEqual({'/lmn/proj--d': 'unknown'},
+                             get_snapshot_status(entries, 'polaris', {'slurm': None, 'pbs': None}))
+
+    def test_snapshot_time(self):
+        from lmn.helpers import make_run_id
+        self.assertAlmostEqual(time.time(), get_snapshot_time(f'/lmn/proj--{make_run_id()}', 0), delta=1)
+        self.assertEqual(123, get_snapshot_time('/lmn/proj--custom', 123))
+
+
+if __name__ == '__main__':
+    unittest.main()
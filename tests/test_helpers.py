@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+import time
+import unittest
+from datetime import datetime
+from lmn.helpers import CROCKFORD_BASE32, get_timestamp, is_run_id, make_run_id, read_run_id
+
+
+class TestRunId(unittest.TestCase):
+    def test_format(self):
+        run_id = make_run_id()
+        self.assertEqual(26, len(run_id))
+        self.assertTrue(set(run_id) <= set(CROCKFORD_BASE32))
+        self.assertLess(abs((read_run_id(run_id) - datetime.now()).total_seconds()), 1)
+        self.assertTrue(is_run_id(run_id))
+        self.assertFalse(is_run_id(get_timestamp()))
+
+    def test_unique_and_ordered(self):
+        run_ids = [make_run_id() for _ in range(1000)]
+        self.assertEqual(len(run_ids), len(set(run_ids)))
+
+        earlier = make_run_id()
+        time.sleep(0.002)
+        self.assertLess(earlier, make_run_id())
+
+
+if __name__ == '__main__':
+    unittest.main()
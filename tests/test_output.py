@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+import unittest
+from lmn.config import OutputFilterConfig
+from lmn.output import filter_manifest, parse_duration, parse_manifest, parse_size
+
+MANIFEST = '''\
+1700000000.5 1024 metrics.csv\r
+1700000100.0 2147483648 run-0/ckpt_100.pt\r
+1700000200.0 2147483648 run-0/ckpt_200.pt\r
+1700000150.0 2147483648 run-1/ckpt_100.pt\r
+1700000300.0 4096 run-1/plots/loss curve.png\r
+'''
+
+
+class TestOutputFilter(unittest.TestCase):
+    def setUp(self):
+        self.entries = parse_manifest(MANIFEST)
+
+    def test_parse_manifest(self):
+        self.assertEqual(5, len(self.entries))
+        self.assertDictEqual({'mtime': 1700000300.0, 'size': 4096, 'path': 'run-1/plots/loss curve.png'}, self.entries[-1])
+
+    def test_parse_units(self):
+        self.assertEqual(100 * 1024 ** 2, parse_size('100M'))
+        self.assertEqual(2 * 60 * 60, parse_duration('2h'))
+        with self.assertRaises(ValueError):
+            parse_size('lots')
+
+    def test_no_filter(self):
+        self.assertEqual(5, len(filter_manifest(self.entries, OutputFilterConfig())))
+
+    def test_globs_and_size(self):
+        output_filter = OutputFilterConfig(include=['*.csv', '*.pt', '*.png'], exclude=['*/plots/*'], max_size='1G')
+        self.assertListEqual(['metrics.csv'], filter_manifest(self.entries, output_filter))
+
+    def test_keep_latest(self):
+        output_filter = OutputFilterConfig(keep_latest={'*.pt': 1})
+        self.assertListEqual(['metrics.csv', 'run-0/ckpt_200.pt', 'run-1/ckpt_100.pt', 'run-1/plots/loss curve.png'],
+                             filter_manifest(self.entries, output_filter))
+
+    def test_since(self):
+        self.assertListEqual(['run-0/ckpt_200.pt', 'run-1/plots/loss curve.png'],
+                             filter_manifest(self.entries, OutputFilterConfig(), since=150, now=1700000350.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
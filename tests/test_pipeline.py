@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import asyncio
+import time
+import unittest
+from lmn import LMNError
+from lmn.pipeline import Pipeline
+
+
+class TestPipeline(unittest.TestCase):
+    def test_dependency_results(self):
+        order = []
+
+        def stage(name, value):
+            def fn(*args):
+                order.append(name)
+                return value + sum(args)
+            return fn
+
+        pipeline = Pipeline()
+        pipeline.add('c', stage('c', 100), deps=['a', 'b'])
+        pipeline.add('a', stage('a', 1))
+        pipeline.add('b', stage('b', 10), deps=['a'])
+        results = pipeline.run()
+        self.assertDictEqual({'a': 1, 'b': 11, 'c': 112}, results)
+        self.assertListEqual(['a', 'b', 'c'], order)
+
+    def test_concurrent(self):
+        async def sleep():
+            await asyncio.sleep(0.3)
+
+        pipeline = Pipeline()
+        pipeline.add('blocking', lambda: time.sleep(0.3))
+        pipeline.add('async', sleep)
+        start = time.time()
+        pipeline.run()
+        self.assertLess(time.time() - start, 0.55)
+
+    def test_awaitable_result(self):
+        called = []
+
+        async def check(name):
+            called.append(name)
+            return name
+
+        pipeline = Pipeline()
+        pipeline.add('check', lambda: check('image'))
+        self.assertDictEqual({'check': 'image'}, pipeline.run())
+        self.assertListEqual(['image'], called)
+
+    def test_failure_cancels_dependents(self):
+        called = []
+
+        def fail():
+            raise RuntimeError('oops')
+
+        pipeline = Pipeline()
+        pipeline.add('fail', fail)
+        pipeline.add('after', lambda _: called.append('after'), deps=['fail'])
+        with self.assertRaises(RuntimeError):
+            pipeline.run()
+        self.assertListEqual([], called)
+
+    def test_async_failure(self):
+        async def fail():
+            raise LMNError('oops')
+
+        pipeline = Pipeline()
+        pipeline.add('fail', fail)
+        pipeline.add('blocking', lambda: time.sleep(0.1))
+        with self.assertRaises(LMNError):
+            pipeline.run()
+
+    def test_invalid_graph(self):
+        with self.assertRaises(ValueError):
+            Pipeline().add('a', lambda _: None, deps=['missing']).run()
+        pipeline = Pipeline()
+        pipeline.add('a', lambda _: None, deps=['b'])
+        pipeline.add('b', lambda _: None, deps=['a'])
+        with self.assertRaises(ValueError):
+            pipeline.run()
+
+
+if __name__ == '__main__':
+    unittest.main()
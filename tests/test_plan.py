@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+from lmn.plan import LaunchPlan, PlanRecorder, PlanStep, SyncSpec
+
+
+class FakeSSHClient:
+    def __init__(self, output=''):
+        self.remote_conf = SimpleNamespace(user='me', host='elm', base_uri='me@elm')
+        self.output = output
+        self.cmds = []
+
+    def run(self, cmd, directory="$HOME", env=None, capture_output=False, dry_run=False):
+        self.cmds.append(cmd)
+        self.env = env
+        return self.output
+
+
+class TestPlanRecorder(unittest.TestCase):
+    def test_record(self):
+        client = FakeSSHClient('gpu\n')
+        plan = LaunchPlan(user='me', host='elm', project='proj', mode='slurm', cmd='python train.py')
+        recorder = PlanRecorder(client, plan)
+
+        # Queries are run
+        self.assertEqual('gpu\n', recorder.run('sinfo', capture_output=True))
+        # Others are recorded
+        with tempfile.NamedTemporaryFile(mode='w+') as f:
+            f.write('#!/bin/bash\necho hi')
+            f.flush()
+            recorder.put(f.name, Path('/tmp/script/.script-0.sh'))
+        recorder.run('mkdir -p /tmp/out', directory=None, dry_run=True)
+        self.assertEqual('', recorder.run('sbatch a.sh', directory=Path('/tmp/code'), capture_output=True, dry_run=True))
+        recorder.run('sbatch b.sh', capture_output=True, dry_run=True)
+        recorder.tag_submission({'job_name': 'a'})
+        recorder.tag_submission({'job_name': 'b'})
+
+        self.assertListEqual(['sinfo'], client.cmds)
+        self.assertListEqual(['put', 'run', 'submit', 'submit'], [step.op for step in plan.steps])
+        self.assertEqual('#!/bin/bash\necho hi', plan.steps[0].content)
+        self.assertEqual('/tmp/code', plan.steps[2].directory)
+        self.assertListEqual(['a', 'b'], [step.log['job_name'] for step in plan.steps[2:]])
+
+    def test_slurm_dry_run(self):
+        """Nothing is uploaded or submitted in a dry run, but the script and the submission are in the plan"""
+        from lmn.runner import SlurmRunner
+        from lmn.scheduler import SlurmConfig
+        client = FakeSSHClient()
+        plan = LaunchPlan(user='me', host='elm', project='proj', mode='slurm', cmd='python train.py')
+        lmndirs = SimpleNamespace(codedir='/tmp/code', mountdir='/tmp/mount', outdir='/tmp/out', scriptdir='/tmp/script')
+        runner = SlurmRunner(PlanRecorder(client, plan), lmndirs)
+        job_ids = runner.exec('python train.py', '.', conf=SlurmConfig(job_name='job'), timestamp='0',
+                              interactive=False, num_sequence=2, dry_run=True)
+
+        self.assertListEqual([], job_ids)
+        self.assertListEqual([], client.cmds)
+        self.assertListEqual(['put', 'submit'], [step.op for step in plan.steps])
+        self.assertEqual('/tmp/script/.script-0.sh', plan.steps[0].path)
+        self.assertTrue(plan.steps[0].content.endswith('python train.py'))
+        self.assertEqual(2, plan.steps[1].cmd.count('sbatch --parsable'))
+
+    def test_ssh_apply(self):
+        """The envvars of an ssh-mode launch are recorded and passed to the command when the plan is applied"""
+        from lmn.cli.apply import apply_plan
+        from lmn.runner import SSHRunner
+        plan = LaunchPlan(user='me', host='elm', project='proj', mode='ssh', cmd='python train.py')
+        lmndirs = SimpleNamespace(codedir=Path('/tmp/code'), mountdir='/tmp/mount', outdir='/tmp/out', scriptdir='/tmp/script')
+        SSHRunner(PlanRecorder(FakeSSHClient(), plan), lmndirs).exec('python train.py', '.', env={'LMN_RUN_SWEEP_IDX': 3},
+                                                                    dry_run=True)
+        self.assertEqual('3', plan.steps[0].env['LMN_RUN_SWEEP_IDX'])
+        self.assertEqual('/tmp/out', plan.steps[0].env['LMN_OUTPUT_DIR'])
+
+        client = FakeSSHClient()
+        with mock.patch('lmn.helpers.establish_persistent_ssh'), mock.patch('lmn.machine.CLISSHClient', return_value=client):
+            apply_plan(LaunchPlan.model_validate_json(plan.model_dump_json()))
+        self.assertListEqual(['python train.py'], client.cmds)
+        self.assertDictEqual(plan.steps[0].env, client.env)
+
+    def test_ssh_env(self):
+        """CLISSHClient exports the envvars before running the command"""
+        from lmn.machine import CLISSHClient
+        client = CLISSHClient(SimpleNamespace(host='elm', base_uri='me@elm'))
+        with mock.patch('lmn.cli._utils.run_cmd') as run_cmd:
+            client.run('echo "$MSG" $DIR', directory='/tmp', env={'MSG': 'it\'s "a" `b`', 'DIR': '$((1 + 2))'})
+        ssh_cmd = run_cmd.call_args[0][0]
+        prefix = 'ssh -t -o ControlPath=~/.ssh/lmn-ssh-socket-elm me@elm '
+        self.assertTrue(ssh_cmd.startswith(prefix))
+        output = subprocess.run(['bash', '-c', 'bash -c ' + ssh_cmd[len(prefix):]], capture_output=True, text=True).stdout
+        self.assertEqual('it\'s "a" `b` 3\n', output)
+
+    def test_save_load(self):
+        plan = LaunchPlan(user='me', host='elm', project='proj', mode='ssh', cmd='python train.py',
+                          syncs=[SyncSpec(source_dir='/home/me/proj', target_dir='/tmp/me/lmn/proj/code', git=True)],
+                          steps=[PlanStep(op='run', cmd='python train.py', directory='/tmp/me/lmn/proj/code')])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / 'plan.json'
+            plan.save(path)
+            self.assertEqual(plan, LaunchPlan.load(path))
+
+
+class TestDockerCommand(unittest.TestCase):
+    def test_quoting(self):
+        from lmn.container.docker import DockerContainerConfig
+        from lmn.runner import DockerRunner
+        lmndirs = SimpleNamespace(codedir=Path('/lmn/code'), mountdir='/lmn/mount', outdir='/lmn/output', scriptdir='/lmn/script')
+        conf = DockerContainerConfig(image='ubuntu', name='me-lmn-proj', environment={'MSG': 'a "b" $HOME'},
+                                     mount_from_host={'/tmp/code': '/lmn/code'})
+        cmd = DockerRunner(None, lmndirs).make_cli_command('echo "$MSG" $LMN_RUN_SWEEP_IDX', 'src', conf,
+                                                           interactive=False, quiet=True)
+        self.assertTrue(cmd.startswith('{ docker rm -f me-lmn-proj'))
+        self.assertIn('--mount type=bind,source=/tmp/code,destination=/lmn/code', cmd)
+        self.assertNotIn("'", cmd)
+
+        # The values reach docker intact after the shell on the host evaluates the command
+        output = subprocess.run(['bash', '-c', f'docker() {{ printf "%s\\n" "$@"; }}; {cmd}'],
+                                capture_output=True, text=True).stdout.splitlines()
+        self.assertIn('MSG=a "b" $HOME', output)
+        self.assertIn('/lmn/code/src', output)
+        self.assertEqual('sleep 2 ; echo "$MSG" $LMN_RUN_SWEEP_IDX && chmod -R a+r /lmn/output', output[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
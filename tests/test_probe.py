@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import os
+import unittest
+import subprocess
+import tempfile
+from lmn.probe import (parse_load_probe, get_load_score, parse_gpu_status, make_gpu_status_command,
+                       make_capability_probe_command, parse_capability_probe, get_missing_tools)
+
+
+PROBE_OUTPUT = '\r\n'.join((
+    'LMN_SECTION gpu',
+    '0, GPU-aaaa, NVIDIA RTX A6000, 40000, 49140, 97',
+    '1, GPU-bbbb, NVIDIA RTX A6000, 3, 49140, 0',
+    'LMN_SECTION loadavg',
+    '12.00 10.50 9.80 3/1024 12345',
+    'LMN_SECTION nproc',
+    '48',
+))
+
+
+class TestLoadProbe(unittest.TestCase):
+    def test_parse_load_probe(self):
+        load = parse_load_probe(PROBE_OUTPUT)
+        self.assertEqual(2, len(load['gpus']))
+        self.assertEqual(40000, load['gpus'][0]['memory_used'])
+        self.assertEqual(0, load['gpus'][1]['utilization'])
+        self.assertAlmostEqual(12.0, load['loadavg'])
+        self.assertEqual(48, load['nproc'])
+
+    def test_no_gpu(self):
+        """Hosts without nvidia-smi only print the section header"""
+        load = parse_load_probe('LMN_SECTION gpu\nLMN_SECTION loadavg\n1.0 1.0 1.0 1/10 1\nLMN_SECTION nproc\n4\n')
+        self.assertListEqual([], load['gpus'])
+        self.assertAlmostEqual(0.25, get_load_score(load))
+
+    def test_score_prefers_idle_host(self):
+        busy = parse_load_probe(PROBE_OUTPUT)
+        idle = parse_load_probe(PROBE_OUTPUT.replace('40000', '10').replace(', 97', ', 0'))
+        self.assertLess(get_load_score(idle), get_load_score(busy))
+
+
+    def test_score_host_without_gpus_last_in_gpu_pool(self):
+        busy = parse_load_probe(PROBE_OUTPUT.replace(', 3, 49140, 0', ', 49000, 49140, 100'))
+        no_gpu = parse_load_probe('LMN_SECTION gpu\nLMN_SECTION loadavg\n0.0 0.0 0.0 1/10 1\nLMN_SECTION nproc\n4\n')
+        self.assertLess(get_load_score(busy, expect_gpus=True), get_load_score(no_gpu, expect_gpus=True))
+
+
+class TestGPUStatus(unittest.TestCase):
+    def test_processes_are_attached_to_gpus(self):
+        output = PROBE_OUTPUT.split('\r\nLMN_SECTION loadavg')[0] + '\r\n' + '\r\n'.join((
+            'LMN_SECTION apps',
+            'GPU-aaaa, 1234, 39990',
+            'GPU-aaaa, 5678, 10',
+            'LMN_SECTION users',
+            ' 1234 takuma',
+        ))
+        gpus = parse_gpu_status(output)
+        self.assertListEqual(['takuma', '?'], [proc['user'] for proc in gpus[0]['processes']])
+        self.assertListEqual([], gpus[1]['processes'])
+
+
+    def test_status_command_without_gpus(self):
+        """The command succeeds on a host without GPUs (or GPU processes), rather than being reported unreachable"""
+        output = subprocess.run(['bash', '-c', make_gpu_status_command()],
+                                check=True, capture_output=True, text=True).stdout
+        self.assertListEqual([], parse_gpu_status(output))
+
+
+class TestCapabilityProbe(unittest.TestCase):
+    def test_probe_locally(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = subprocess.run(['bash', '-c', make_capability_probe_command(f'{tmpdir}/lmn')],
+                                    check=True, capture_output=True, text=True).stdout
+            capabilities = parse_capability_probe(output)
+            self.assertIn('tar', capabilities['tools'])
+            self.assertTrue(capabilities['writable'])
+            self.assertGreater(capabilities['free_kbytes'], 0)
+
+    def test_probe_without_creating_rootdir(self):
+        """A dry run does not create rootdir, which is writable if its nearest existing ancestor is"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = subprocess.run(['bash', '-c', make_capability_probe_command(f'{tmpdir}/lmn/proj', create=False)],
+                                    check=True, capture_output=True, text=True).stdout
+            capabilities = parse_capability_probe(output)
+            self.assertFalse(os.path.exists(f'{tmpdir}/lmn'))
+            self.assertTrue(capabilities['writable'])
+            self.assertGreater(capabilities['free_kbytes'], 0)
+
+    def test_dry_run_probe_is_not_cached(self):
+        from functools import partial
+        from unittest import mock
+        from lmn.cache import HostCache
+        from lmn.machine import RemoteConfig
+        from lmn.probe import get_capabilities
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch('lmn.cache.HostCache', partial(HostCache, cachedir=tmpdir)), \
+                mock.patch('lmn.probe.run_on_host', return_value='LMN_SECTION writable\nyes\n') as run_on_host:
+            remote_conf = RemoteConfig('takuma', 'elm')
+            get_capabilities(remote_conf, '/tmp/lmn', create=False)
+            get_capabilities(remote_conf, '/tmp/lmn')
+            self.assertEqual(2, run_on_host.call_count)
+            # The real probe is cached (and used by dry runs as well)
+            get_capabilities(remote_conf, '/tmp/lmn', create=False)
+            self.assertEqual(2, run_on_host.call_count)
+
+    def test_missing_tools(self):
+        capabilities = {'tools': {'rsync': 'rsync  version 3.2.7', 'sbatch': 'slurm 23.02.6', 'apptainer': 'apptainer version 1.2.5'}}
+        self.assertListEqual([], get_missing_tools(capabilities, 'slurm-sing'))
+        # The container runtime is only expected (it may be on the compute nodes only)
+        self.assertListEqual([], get_missing_tools({'tools': {'rsync': '', 'sbatch': ''}}, 'slurm-sing'))
+        self.assertListEqual(['singularity|apptainer'],
+                             get_missing_tools({'tools': {'rsync': '', 'sbatch': ''}}, 'slurm-sing', expected=True))
+        self.assertListEqual(['qsub'], get_missing_tools(capabilities, 'pbs'))
+        self.assertListEqual(['docker', 'rsync'], get_missing_tools({'tools': {}}, 'docker'))
+        self.assertListEqual(['docker'], get_missing_tools({'tools': {}}, 'docker', sync=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+import os
+import signal
+import subprocess
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+from lmn.helpers import parse_job_ids
+from lmn.cli._scheduler import _select_slurm_conf
+from lmn.cli._utils import run_cmd
+from lmn.scheduler.preemption import make_preemption_wrapper
+from lmn.scheduler.pbs import make_qsub_chain, parse_qstat_queues
+from lmn.scheduler.slurm import (SlurmConfig, make_slurm_command, make_sbatch_chain, make_test_only_command,
+                                 parse_slurm_time, parse_salloc_jobid, parse_test_only_output)
+
+
+class TestSlurm(unittest.TestCase):
+    def test_parse_slurm_time(self):
+        self.assertEqual(30 * 60, parse_slurm_time('30'))
+        self.assertEqual(30 * 60 + 15, parse_slurm_time('30:15'))
+        self.assertEqual(4 * 3600, parse_slurm_time('04:00:00'))
+        self.assertEqual(2 * 86400 + 3 * 3600, parse_slurm_time('2-3'))
+        self.assertEqual(86400 + 3600 + 120, parse_slurm_time('1-01:02'))
+        self.assertEqual(86400 + 3600 + 120 + 3, parse_slurm_time('1-01:02:03'))
+
+    def test_parse_salloc_jobid(self):
+        output = 'salloc: Pending job allocation 8231686\r\nsalloc: Granted job allocation 8231686\r\n'
+        self.assertEqual('8231686', parse_salloc_jobid(output))
+        self.assertIsNone(parse_salloc_jobid('salloc: error: invalid partition specified'))
+
+    def test_make_slurm_command_overrides(self):
+        conf = SlurmConfig(partition='gpu', time='1:00:00')
+        cmd = make_slurm_command(conf, time='2:00:00').srun('', srun_cmd='salloc --no-shell')
+        self.assertIn('--partition=gpu', cmd)
+        self.assertIn('--time=2:00:00', cmd)
+
+
+class TestSubmissionChain(unittest.TestCase):
+    def test_sbatch_chain(self):
+        cmd = make_sbatch_chain('script.sh', num_sequence=3)
+        self.assertEqual(3, cmd.count('sbatch --parsable'))
+        self.assertEqual(2, cmd.count('--dependency=afterany:'))
+        self.assertNotIn('singleton', cmd)
+
+    def test_qsub_chain(self):
+        cmd = make_qsub_chain('script.sh', num_sequence=2)
+        self.assertEqual(1, cmd.count('-W depend=afterany:$jid'))
+
+    def test_parse_job_ids(self):
+        output = 'LMN_JOB_ID 8231686\r\nLMN_JOB_ID 8231687\r\nsbatch: error: Batch job submission failed\r\n'
+        self.assertListEqual(['8231686', '8231687'], parse_job_ids(output))
+
+
+class TestPreemption(unittest.TestCase):
+    def _run_wrapper(self, sig):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            cmd = (f'trap "touch {tmpdir}/checkpoint; exit 0" USR1; touch {tmpdir}/started; '
+                   'while true; do sleep 0.1; done')
+            script = make_preemption_wrapper(cmd, ['USR1', 'TERM'], 'USR1', on_preempt=f'touch {tmpdir}/requeued')
+            proc = subprocess.Popen(['bash', '-c', script])
+            for _ in range(50):
+                if (tmpdir / 'started').exists():
+                    break
+                time.sleep(0.1)
+            proc.send_signal(sig)
+            self.assertEqual(0, proc.wait(timeout=10))
+            return (tmpdir / 'checkpoint').exists(), (tmpdir / 'requeued').exists()
+
+    def test_checkpoint_signal(self):
+        """The checkpoint signal makes the command checkpoint and runs on_preempt"""
+        self.assertEqual((True, True), self._run_wrapper(signal.SIGUSR1))
+
+    def test_sigterm_does_not_requeue(self):
+        """SIGTERM (e.g., scancel) makes the command checkpoint, but does not run on_preempt"""
+        self.assertEqual((True, False), self._run_wrapper(signal.SIGTERM))
+
+
+class TestQueueSelection(unittest.TestCase):
+    def test_test_only_command(self):
+        candidates = {'a': SlurmConfig(partition='gpu'), 'b': SlurmConfig(partition='cpu')}
+        cmd = make_test_only_command(candidates)
+        self.assertIn('echo "LMN_CANDIDATE a"', cmd)
+        self.assertIn('--partition=cpu', cmd)
+        self.assertEqual(2, cmd.count('sbatch --test-only'))
+
+    def test_parse_test_only_output(self):
+        output = '\n'.join((
+            'LMN_CANDIDATE gpu',
+            'sbatch: Job 8231690 to start at 2024-01-01T15:00:00 using 1 processors on nodes gpu3 in partition gpu',
+            'LMN_CANDIDATE contrib-gpu',
+            'sbatch: Job 8231691 to start at 2024-01-01T12:00:00 using 1 processors on nodes gpu7 in partition contrib-gpu',
+            'LMN_CANDIDATE typo',
+            'sbatch: error: invalid partition specified: typo',
+        ))
+        start_times = parse_test_only_output(output)
+        self.assertEqual('contrib-gpu', min((k for k, v in start_times.items() if v), key=start_times.get))
+        self.assertIsNone(start_times['typo'])
+
+    def test_select_slurm_conf_with_invalid_last_candidate(self):
+        """An invalid candidate does not fail the whole selection even if it is the last one"""
+        class LocalClient:
+            def run(self, cmd, capture_output=False):
+                return run_cmd(cmd, get_output=capture_output)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            sbatch = Path(tmpdir) / 'sbatch'
+            sbatch.write_text('\n'.join((
+                '#!/bin/sh',
+                'case "$*" in',
+                '  *--partition=typo*) echo "sbatch: error: invalid partition specified: typo" >&2; exit 1 ;;',
+                '  *) echo "sbatch: Job 1 to start at 2024-01-01T12:00:00 using 1 processors on nodes gpu7" >&2 ;;',
+                'esac',
+            )) + '\n')
+            sbatch.chmod(0o755)
+            candidates = {'gpu': SlurmConfig(partition='gpu'), 'typo': SlurmConfig(partition='typo')}
+            with mock.patch.dict(os.environ, {'PATH': f'{tmpdir}:{os.environ["PATH"]}'}):
+                self.assertEqual('gpu', _select_slurm_conf(LocalClient(), candidates).partition)
+
+    def test_parse_qstat_queues(self):
+        output = '\n'.join((
+            'Queue              Max   Tot Ena Str   Que   Run   Hld   Wat   Trn   Ext Type',
+            '---------------- ----- ----- --- --- ----- ----- ----- ----- ----- ----- ----',
+            'debug                0     3 yes yes     1     2     0     0     0     0 Exec',
+            'preemptable          0    10 yes yes     8     2     0     0     0     0 Exec',
+            'closed               0     0  no yes     0     0     0     0     0     0 Exec',
+        ))
+        queues = parse_qstat_queues(output)
+        self.assertDictEqual({'queued': 1, 'running': 2}, queues['debug'])
+        self.assertDictEqual({'queued': 8, 'running': 2}, queues['preemptable'])
+        self.assertNotIn('closed', queues)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from lmn.sweep import (make_task_list, make_worker_command, make_completion_command,
+                       parse_completion_markers, get_active_sweep_indices, get_sweep_key)
+
+
+class TestWorkerQueue(unittest.TestCase):
+    def test_task_list(self):
+        self.assertEqual('3\n5\n8\n', make_task_list([3, 5, 8]))
+
+    def test_workers_drain_queue(self):
+        """Tasks are claimed exactly once even if multiple workers read the same list"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            task_fpath = tmpdir / 'tasks.txt'
+            task_fpath.write_text(make_task_list(range(5)))
+            cmd = make_worker_command(f'echo $LMN_RUN_SWEEP_IDX >> {tmpdir}/done.txt',
+                                      task_fpath, tmpdir / 'queue')
+            for _ in range(2):
+                subprocess.run(['bash', '-c', cmd], check=True, capture_output=True)
+
+            done = sorted(int(line) for line in (tmpdir / 'done.txt').read_text().split())
+            self.assertListEqual(list(range(5)), done)
+
+
+class TestResume(unittest.TestCase):
+    def test_completion_marker(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            marker_dir = Path(tmpdir) / 'markers'
+            for idx, cmd in [(0, 'true'), (1, 'false'), (2, 'true')]:
+                subprocess.run(['bash', '-c', make_completion_command(cmd, marker_dir)],
+                               env={'LMN_RUN_SWEEP_IDX': str(idx)})
+            listing = '\n'.join(p.name for p in marker_dir.iterdir())
+            self.assertSetEqual({0, 2}, parse_completion_markers(listing))
+
+    def test_parse_completion_markers(self):
+        listing = '0.done\r\n3.done\r\nfoo.done\r\n5.txt\r\n'
+        self.assertSetEqual({0, 3}, parse_completion_markers(listing))
+
+    def test_get_active_sweep_indices(self):
+        host, cmd = 'takuma@elm', 'python train.py'
+        entries = [
+            {'host': host, 'project': 'proj', 'cmd': cmd, 'job_ids': ['101'], 'sweep_idx': 7},
+            {'host': host, 'project': 'proj', 'cmd': cmd, 'job_ids': ['102'], 'sweep_idx': 8},  # Left the queue
+            {'host': host, 'project': 'proj', 'cmd': 'python eval.py', 'job_ids': ['103'], 'sweep_idx': 3},
+            {'host': host, 'project': 'other', 'cmd': cmd, 'job_ids': ['104'], 'sweep_idx': 4},
+            {'host': host, 'project': 'proj', 'cmd': cmd, 'job_ids': ['105.server'], 'sweep': '10-12', 'sweep_ind': [10, 11, 12]},
+        ]
+        active_job_ids = ['101', '103', '104', '105.server']
+        self.assertSetEqual({7, 10, 11, 12},
+                            get_active_sweep_indices(entries, host, 'proj', get_sweep_key(cmd), active_job_ids))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+from lmn.helpers import list_git_files
+from lmn.cache import HostCache
+from lmn.config import MachineConfig, SyncConfig
+from lmn.cli._utils import make_rsync_options, make_tar_command, should_compress, tar_stream
+from lmn.cli.run import _find_link_dests, _select_latest_snapshot
+from lmn.machine import RemoteConfig
+
+
+class TestGitFiles(unittest.TestCase):
+    def test_list_git_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            rootdir = Path(tmpdir)
+            subprocess.run(['git', 'init', '-q', str(rootdir)], check=True)
+            (rootdir / '.gitignore').write_text('.venv/\n*.log\n')
+            (rootdir / 'tracked.py').write_text('')
+            (rootdir / 'deleted.py').write_text('')
+            subprocess.run(['git', '-C', str(rootdir), 'add', '.'], check=True)
+            (rootdir / 'deleted.py').unlink()
+            (rootdir / 'untracked.py').write_text('')
+            (rootdir / 'debug.log').write_text('')
+            (rootdir / '.venv').mkdir()
+            (rootdir / '.venv' / 'site.py').write_text('')
+
+            self.assertListEqual(['.gitignore', 'tracked.py', 'untracked.py'], sorted(list_git_files(rootdir)))
+
+    def test_submodule(self):
+        """The files in a submodule are listed (rather than the submodule directory, which rsync does not recurse into)"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            git = ['git', '-c', 'user.name=lmn', '-c', 'user.email=lmn@example.com', '-c', 'protocol.file.allow=always']
+            subprocess.run(['git', 'init', '-q', str(tmpdir / 'lib')], check=True)
+            (tmpdir / 'lib' / 'lib.py').write_text('')
+            subprocess.run([*git, '-C', str(tmpdir / 'lib'), 'add', '.'], check=True)
+            subprocess.run([*git, '-C', str(tmpdir / 'lib'), 'commit', '-q', '-m', 'init'], check=True)
+
+            rootdir = tmpdir / 'proj'
+            subprocess.run(['git', 'init', '-q', str(rootdir)], check=True)
+            (rootdir / 'main.py').write_text('')
+            subprocess.run([*git, '-C', str(rootdir), 'submodule', '-q', 'add', str(tmpdir / 'lib'), 'third_party/lib'],
+                           check=True)
+            (rootdir / 'third_party' / 'lib' / 'untracked.py').write_text('')
+
+            self.assertListEqual(['.gitmodules', 'main.py', 'third_party/lib/lib.py', 'third_party/lib/untracked.py'],
+                                 sorted(list_git_files(rootdir)))
+
+    def test_not_a_git_repo(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.assertIsNone(list_git_files(Path(tmpdir)))
+
+
+class TestTarStream(unittest.TestCase):
+    def _list_archive(self, tar_cmd):
+        output = subprocess.run(f'{tar_cmd} | tar -tf -', shell=True, check=True, capture_output=True).stdout
+        return sorted(line.lstrip('./') for line in output.decode().split() if not line.endswith('/'))
+
+    def test_exclude(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            rootdir = Path(tmpdir)
+            for fname in ['main.py', 'wandb/run.log', 'src/wandb/keep.py', 'data/train.npy']:
+                (rootdir / fname).parent.mkdir(parents=True, exist_ok=True)
+                (rootdir / fname).write_text('')
+            tar_cmd = make_tar_command(rootdir, exclude=['/wandb', 'data/'])
+            self.assertListEqual(['main.py', 'src/wandb/keep.py'], self._list_archive(tar_cmd))
+
+    def test_files_from(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            rootdir = Path(tmpdir)
+            for fname in ['a.py', 'b.py', 'sub dir/c.py']:
+                (rootdir / fname).parent.mkdir(parents=True, exist_ok=True)
+                (rootdir / fname).write_text('')
+            (rootdir / 'list').write_text('a.py\0sub dir/c.py')
+            tar_cmd = make_tar_command(rootdir, files_from=rootdir / 'list')
+            output = subprocess.run(f'{tar_cmd} | tar -tf -', shell=True, check=True, capture_output=True).stdout
+            self.assertListEqual(['a.py', 'sub dir/c.py'], sorted(output.decode().splitlines()))
+
+    def test_files_from_exclude(self):
+        """The exclude patterns apply to the files listed by git as well (e.g., untracked but not ignored)"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            rootdir = Path(tmpdir)
+            fnames = ['main.py', 'wandb/run.log', 'src/wandb/keep.py', 'data/train.npy']
+            for fname in fnames:
+                (rootdir / fname).parent.mkdir(parents=True, exist_ok=True)
+                (rootdir / fname).write_text('')
+            (rootdir / 'list').write_text('\0'.join(fnames))
+
+            archived = []
+
+            def list_archive(cmd, shell):
+                tar_cmd = cmd[-1].split(' | ')[0]
+                archived.extend(self._list_archive(tar_cmd))
+
+            with mock.patch('lmn.cli._utils.run_cmd', side_effect=list_archive):
+                tar_stream(rootdir, '/tmp/code', SimpleNamespace(host='elm', base_uri='me@elm'),
+                           exclude=['/wandb', 'data/'], files_from=rootdir / 'list')
+            self.assertListEqual(['main.py', 'src/wandb/keep.py'], archived)
+
+class TestLinkDest(unittest.TestCase):
+    def test_select_latest_snapshot(self):
+        """Snapshots named after run IDs are newer than the ones named after timestamps"""
+        code_dirs = [
+            '/lmn/proj--01JAB3K6Q2M8ZS1XW4RTV0C9HE/code',
+            '/lmn/proj--2024-05-01_120000-000000/code',
+            '/lmn/proj--01JCZZ0000000000000000000A/code',
+            '/lmn/proj--01JAB3K6Q2M8ZS1XW4RTV0C9HF/code',
+        ]
+        self.assertEqual('/lmn/proj--01JCZZ0000000000000000000A/code', _select_latest_snapshot(code_dirs))
+        self.assertEqual('/lmn/proj--2024-05-01_120000-000000/code',
+                         _select_latest_snapshot(['/lmn/proj--2024-05-01_120000-000000/code',
+                                                  '/lmn/proj--2024-04-01_120000-000000/code']))
+        self.assertIsNone(_select_latest_snapshot([]))
+
+    def test_find_link_dests(self):
+        lmndirs = SimpleNamespace(rootdir=Path('/lmn/proj'), codedir=Path('/lmn/proj/code'))
+        machine = SimpleNamespace(lmndirs=lmndirs, remote_conf=RemoteConfig('takuma', 'elm'))
+        output = '\r\n'.join(('/lmn/proj--01JCZZ0000000000000000000A/code', '/lmn/proj--01JAB3K6Q2M8ZS1XW4RTV0C9HE/code',
+                               '--- lmn ---', '/lmn/proj/code'))
+        with mock.patch('lmn.cli.run.CLISSHClient') as client:
+            client.return_value.run.return_value = output
+            self.assertListEqual(['/lmn/proj--01JCZZ0000000000000000000A/code', '/lmn/proj/code'], _find_link_dests(machine))
+
+
+class TestSyncConfig(unittest.TestCase):
+    def test_default(self):
+        self.assertListEqual(['--compress'], make_rsync_options(SyncConfig(), compress=True))
+
+    def test_options(self):
+        sync_conf = SyncConfig(compress_choice='zstd', compress_level=3, skip_compress=['.pt', 'npz'],
+                               bwlimit='50m', partial=True, whole_file=True)
+        self.assertListEqual(['--compress', '--compress-choice=zstd', '--compress-level=3', '--skip-compress=pt/npz',
+                              '--bwlimit=50m', '--partial', '--whole-file'], make_rsync_options(sync_conf, compress=True))
+        self.assertListEqual(['--bwlimit=50m', '--partial', '--whole-file'], make_rsync_options(sync_conf, compress=False))
+
+    def test_should_compress(self):
+        remote_conf = RemoteConfig('takuma', 'localhost')
+        self.assertFalse(should_compress(SyncConfig(compress='off'), remote_conf))
+        self.assertTrue(should_compress(SyncConfig(compress='on'), remote_conf))
+        with self.assertRaises(ValueError):
+            should_compress(SyncConfig(compress='yes'), remote_conf)
+
+
+class TestHostCache(unittest.TestCase):
+    def test_expiry(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = HostCache('throughput', ttl=60, cachedir=tmpdir)
+            self.assertIsNone(cache.get('takuma@elm'))
+            cache.set('takuma@elm', 120.5)
+            self.assertEqual(120.5, cache.get('takuma@elm'))
+            self.assertIsNone(HostCache('throughput', ttl=0, cachedir=tmpdir).get('takuma@elm'))
+
+
+class TestSharedFS(unittest.TestCase):
+    def test_candidates(self):
+        from types import SimpleNamespace
+        from lmn.cli.sync import _get_shared_candidates
+        project = SimpleNamespace(rootdir=Path('/Users/takuma/nfs/projects/proj'))
+        machine = SimpleNamespace(parsed_conf=MachineConfig(user='takuma', host='elm', shared_paths={
+            '/Users/takuma/nfs': '/home/takuma', '/Users/takuma/other': '/other'
+        }))
+        self.assertListEqual(['/home/takuma/projects/proj', '/Users/takuma/nfs/projects/proj'],
+                             _get_shared_candidates(project, machine))
+
+
+    def test_cached_codedir_is_verified(self):
+        """A cached codedir is only used if it still exists on the remote; --no-sync never probes"""
+        from functools import partial
+        from lmn.cli.sync import _detect_shared_codedir
+        project = SimpleNamespace(rootdir=Path('/Users/takuma/nfs/projects/proj'))
+        machine = SimpleNamespace(base_uri='takuma@elm', remote_conf=RemoteConfig('takuma', 'elm'))
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch('lmn.cache.HostCache', partial(HostCache, cachedir=tmpdir)), \
+                mock.patch('lmn.cli.sync.CLISSHClient') as client:
+            self.assertIsNone(_detect_shared_codedir(project, machine, probe=False))
+            client.return_value.run.assert_not_called()
+
+            HostCache('shared_fs', ttl=60, cachedir=tmpdir).set(f'takuma@elm:{project.rootdir.resolve()}',
+                                                               {'codedir': '/home/takuma/projects/proj'})
+            client.return_value.run.return_value = 'found'
+            self.assertEqual('/home/takuma/projects/proj', _detect_shared_codedir(project, machine, probe=False))
+
+            # The mount has gone
+            client.return_value.run.return_value = ''
+            self.assertIsNone(_detect_shared_codedir(project, machine, probe=False))
+            self.assertIsNone(HostCache('shared_fs', ttl=60, cachedir=tmpdir).get(f'takuma@elm:{project.rootdir.resolve()}'))
+
+    def test_unwritable_project(self):
+        """The detection is skipped (and not cached) if the marker file cannot be written"""
+        from functools import partial
+        from lmn.cli.sync import _detect_shared_codedir
+        self.assertFalse(MachineConfig(user='takuma', host='elm').shared_fs)
+        machine = SimpleNamespace(base_uri='takuma@elm', remote_conf=RemoteConfig('takuma', 'elm'),
+                                  parsed_conf=MachineConfig(user='takuma', host='elm'))
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch('lmn.cache.HostCache', partial(HostCache, cachedir=tmpdir)), \
+                mock.patch('lmn.cli.sync.CLISSHClient') as client:
+            project = SimpleNamespace(rootdir=Path(tmpdir) / 'no-such-dir')
+            self.assertIsNone(_detect_shared_codedir(project, machine))
+            client.return_value.run.assert_not_called()
+            self.assertIsNone(HostCache('shared_fs', ttl=60, cachedir=tmpdir).get(f'takuma@elm:{project.rootdir.resolve()}'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from queue import Queue
+from lmn.watch import WatchState, diff_trees, drain, is_excluded, scan_tree
+
+
+class TestWatch(unittest.TestCase):
+    def test_is_excluded(self):
+        exclude = ['.git', '/wandb', '__pycache__/', '*.log']
+        self.assertTrue(is_excluded('.git/HEAD', exclude))
+        self.assertTrue(is_excluded('src/__pycache__/a.pyc', exclude))
+        self.assertTrue(is_excluded('wandb/run/file', exclude))
+        self.assertTrue(is_excluded('logs/train.log', exclude))
+        self.assertFalse(is_excluded('src/wandb/utils.py', exclude))
+        self.assertFalse(is_excluded('src/main.py', exclude))
+
+    def test_scan_and_diff(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            rootdir = Path(tmpdir)
+            for fname in ['main.py', 'src/model.py', '.git/HEAD']:
+                (rootdir / fname).parent.mkdir(parents=True, exist_ok=True)
+                (rootdir / fname).write_text('')
+            tree = scan_tree(rootdir, ['.git'])
+            self.assertSetEqual({'main.py', 'src/model.py'}, set(tree))
+
+            (rootdir / 'main.py').write_text('print(1)')
+            (rootdir / 'src/model.py').unlink()
+            (rootdir / 'src/new.py').write_text('')
+            self.assertListEqual(['main.py', 'src/model.py', 'src/new.py'], diff_trees(tree, scan_tree(rootdir, ['.git'])))
+
+    def test_drain(self):
+        queue = Queue()
+        for path in ['b.py', 'a.py', 'b.py']:
+            queue.put(path)
+        self.assertListEqual(['a.py', 'b.py', 'c.py'], drain(queue, 0.01, 'c.py'))
+
+    def test_state(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            state = WatchState(path=os.path.join(tmpdir, 'watch.json'))
+            key = 'takuma@elm:/code'
+            self.assertTrue(state.wait(key, since=0., timeout=0))
+
+            # The initial sync is in progress
+            state.set(key, pending=True, scanned_at=None)
+            since = state.request_scan(key)
+            self.assertFalse(state.wait(key, since, timeout=0))
+
+            # Nothing is pending, but the changes made right before the run may not have been picked up yet
+            state.set(key, pending=False, scanned_at=since - 1)
+            self.assertFalse(state.wait(key, since, timeout=0))
+            self.assertEqual(since, state.get(key)['requested_at'])
+
+            # Confirmed by a scan that started after the request
+            state.set(key, scanned_at=since)
+            self.assertTrue(state.wait(key, since, timeout=0))
+
+            state.remove(key)
+            self.assertIsNone(state.get(key))
+
+
+if __name__ == '__main__':
+    unittest.main()